@@ -0,0 +1,145 @@
+"""Access logging from a background thread, so it never holds up a
+response"""
+
+import os
+import json
+import time
+import fcntl
+import queue
+import random
+import threading
+
+LOG_FORMATS = ('combined', 'json')
+MAX_QUEUED_RECORDS = 10000
+BATCH_SIZE = 512
+# Seconds a record may wait before being written
+FLUSH_INTERVAL = 1.0
+MAX_BYTES = 100000000
+BACKUP_COUNT = 5
+
+
+def format_combined(record):
+    """Return record in the Combined Log Format"""
+    (timestamp, client, method, path, version, status, size, referer,
+     user_agent) = record
+    return '{} - - [{}] "{} {} {}" {} {} "{}" "{}"\n'.format(
+        client, time.strftime('%d/%b/%Y:%H:%M:%S %z',
+                              time.localtime(timestamp)),
+        method, path, version, status, size if size else '-', referer or '-',
+        user_agent or '-')
+
+
+def format_json(record):
+    """Return record as a line of JSON"""
+    (timestamp, client, method, path, version, status, size, referer,
+     user_agent) = record
+    return json.dumps({
+        'time': round(timestamp, 3), 'client': client, 'method': method,
+        'path': path, 'version': version, 'status': status, 'size': size,
+        'referer': referer, 'user_agent': user_agent}) + '\n'
+
+
+class AccessLog():
+    """A log of requests written to path by a background thread. Only a
+    sample_rate fraction of requests is logged."""
+
+    def __init__(self, path, log_format='combined', sample_rate=1.0,
+                 max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT,
+                 flush_interval=FLUSH_INTERVAL):
+        if log_format not in LOG_FORMATS:
+            raise ValueError('Unknown log format [{}]'.format(log_format))
+        self.path = path
+        self.format = format_json if log_format == 'json' else format_combined
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(MAX_QUEUED_RECORDS)
+        self._log_file = open(path, 'a', encoding='utf-8')
+        self._writer = threading.Thread(target=self._write_records,
+                                        daemon=True)
+        self._writer.start()
+
+    def log(self, client, method, path, version, status, size,
+            referer=None, user_agent=None):
+        """Record a request, unless it isn't sampled or the writer has
+        fallen too far behind"""
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((time.time(), client, method, path, version,
+                                    status, size, referer, user_agent))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_records(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < BATCH_SIZE:
+                try:
+                    record = self._queue.get(
+                        timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    self._write_batch(batch)
+                    return
+                batch.append(record)
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        self._reopen_if_rotated()
+        self._log_file.write(''.join(self.format(record) for record in batch))
+        self._log_file.flush()
+        self.written += len(batch)
+        if self.max_bytes and self._size() >= self.max_bytes:
+            self._rotate()
+
+    def _size(self):
+        """Return the size of the open log file, including what other
+        processes have written to it"""
+        return os.fstat(self._log_file.fileno()).st_size
+
+    def _reopen_if_rotated(self):
+        """Reopen path if another process has rotated the log"""
+        try:
+            if (os.stat(self.path).st_ino ==
+                    os.fstat(self._log_file.fileno()).st_ino):
+                return
+        except FileNotFoundError:
+            pass
+        self._log_file.close()
+        self._log_file = open(self.path, 'a', encoding='utf-8')
+
+    def _rotate(self):
+        """Move path to path.1 (and path.1 to path.2, and so on) and start a
+        new log file, unless another process already has"""
+        # Workers started by 'serve --workers' share the log, so rotate
+        # under a lock
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._reopen_if_rotated()
+            if self._size() < self.max_bytes:
+                return
+            self._log_file.close()
+            for number in range(self.backup_count - 1, 0, -1):
+                name = '{}.{}'.format(self.path, number)
+                if os.path.exists(name):
+                    os.replace(name, '{}.{}'.format(self.path, number + 1))
+            if self.backup_count:
+                os.replace(self.path, self.path + '.1')
+            else:
+                os.unlink(self.path)
+            self._log_file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        """Write every queued record and close the log"""
+        self._queue.put(None)
+        self._writer.join()
+        self._log_file.close()
@@ -0,0 +1,136 @@
+"""Static assets bundled into files named by their content, which can be
+cached forever"""
+
+import os
+import re
+
+from jinja2 import nodes
+
+import manifest
+
+ASSETS_DIR = 'assets'
+HASH_LENGTH = 16
+TEMPLATE_EXTENSIONS = ('.html', '.xml')
+
+# Strings and comments, which CSS is split on so whitespace is only removed
+# from what's between them
+CSS_TOKEN = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/)',
+                       re.DOTALL)
+CSS_SPACE = re.compile(r'\s+')
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(source):
+    """Return source without comments or unnecessary whitespace. Files are
+    bundled into assets/, which (like css/) is a single directory below the
+    root, so relative url()s go on working unchanged."""
+    pieces = list()
+    for (index, piece) in enumerate(CSS_TOKEN.split(source)):
+        if index % 2 == 0:
+            piece = CSS_PUNCTUATION.sub(r'\1', CSS_SPACE.sub(' ', piece))
+            pieces.append(piece.replace(';}', '}'))
+        elif not piece.startswith('/*'):
+            pieces.append(piece)
+    return ''.join(pieces).strip()
+
+
+def minify_js(source):
+    """Return source without blank lines, indentation or comment lines.
+    Line breaks are kept, since statements may rely on them for their
+    semicolons. Code following a comment on the same line is kept."""
+    lines = list()
+    in_comment = False
+    for line in source.splitlines():
+        line = line.strip()
+        if in_comment:
+            if '*/' not in line:
+                continue
+            line = line.split('*/', 1)[1].strip()
+            in_comment = False
+        while line.startswith('/*') and not line.startswith('/*!'):
+            (_, closed, line) = line[2:].partition('*/')
+            in_comment = not closed
+            line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def find_bundles(template_environment):
+    """Return the arguments of every call of asset_url() with constant
+    arguments in the templates of template_environment"""
+    bundles = set()
+    for template_name in template_environment.list_templates(
+            extensions=[extension[1:] for extension in TEMPLATE_EXTENSIONS]):
+        (source, _, _) = template_environment.loader.get_source(
+            template_environment, template_name)
+        for call in template_environment.parse(source).find_all(nodes.Call):
+            if (isinstance(call.node, nodes.Name) and
+                    call.node.name == 'asset_url' and call.args and
+                    all(isinstance(arg, nodes.Const) for arg in call.args)):
+                bundles.add(tuple(arg.value for arg in call.args))
+    return bundles
+
+
+def build_bundle(static_dir, paths):
+    """Return the extension and contents of the bundle of paths, relative
+    to static_dir"""
+    extension = os.path.splitext(paths[0])[1]
+    parts = list()
+    for path in paths:
+        if os.path.splitext(path)[1] != extension:
+            raise EnvironmentError(
+                'Assets [{paths}] must all be of the same type'.format(
+                    paths=', '.join(paths)))
+        try:
+            with open(os.path.join(static_dir, path), 'rb') as asset_file:
+                parts.append(asset_file.read())
+        except IOError as exception:
+            raise EnvironmentError('Unable to read asset [{path}]: {error}'
+                                   .format(path=path, error=exception))
+    minify = MINIFIERS.get(extension)
+    if minify:
+        return (extension, '\n'.join(
+            minify(part.decode('utf-8')) for part in parts).encode('utf-8'))
+    return (extension, b''.join(parts))
+
+
+class AssetUrls():
+    """The asset_url() of templates, mapping static paths to the URL of
+    their bundle; its repr() changes whenever any bundle does"""
+
+    def __init__(self, urls):
+        self.urls = urls
+
+    def __call__(self, *paths):
+        try:
+            return self.urls[paths]
+        except KeyError:
+            raise EnvironmentError(
+                'No bundle of [{paths}]; asset_url() must be given string '
+                'constants'.format(paths=', '.join(map(str, paths))))
+
+    def __repr__(self):
+        return 'AssetUrls({})'.format(manifest.hash_bytes(repr(
+            sorted(self.urls.items())).encode('utf-8')))
+
+
+def build_assets(template_environment, static_dir, output_dir,
+                 build_manifest=None, blog_root=None):
+    """Write the bundles the templates of template_environment refer to
+    into output_dir, returning the AssetUrls for rendering them with. URLs
+    are absolute, below blog_root if given."""
+    assets_dir = os.path.join(output_dir, ASSETS_DIR)
+    urls = dict()
+    for paths in sorted(find_bundles(template_environment)):
+        (extension, content) = build_bundle(static_dir, paths)
+        file_name = manifest.hash_bytes(content)[:HASH_LENGTH] + extension
+        os.makedirs(assets_dir, exist_ok=True)
+        manifest.write_if_changed(os.path.join(assets_dir, file_name),
+                                  content, build_manifest)
+        urls[paths] = '/' + '/'.join(part.strip('/') for part in (
+            blog_root, ASSETS_DIR, file_name) if part)
+    return AssetUrls(urls)
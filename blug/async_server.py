@@ -0,0 +1,157 @@
+"""An asyncio engine for the Blug server, answering every connection from a
+single event loop"""
+
+import time
+import asyncio
+import threading
+
+import blug_server
+
+# Requests whose headers don't fit are rejected
+MAX_HEADER_SIZE = 64 * 1024
+BACKLOG = 1024
+
+
+def parse_head(head):
+    """Return the method, path, version and (lower-cased) headers of a
+    request's head, or None if it is malformed"""
+    lines = head.decode('iso-8859-1').split('\r\n')
+    words = lines[0].split()
+    if len(words) != 3 or not words[2].startswith('HTTP/'):
+        return None
+    headers = dict()
+    for line in lines[1:]:
+        if line:
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+    return (words[0], words[1], words[2], headers)
+
+
+class AsyncBlugServer():
+    """An HTTP server serving the files under root from an asyncio event
+    loop"""
+
+    timeout = blug_server.FileCacheRequestHandler.timeout
+    max_requests = blug_server.FileCacheRequestHandler.max_requests
+
+    def __init__(self, root, server_address, cache_size=None,
+                 access_log=None, stats=None, search_index=None):
+        self.generation = blug_server.Generation(root, cache_size,
+                                                 search_index)
+        self.server_address = server_address
+        self.access_log = access_log
+        self.stats = stats
+        self.started = threading.Event()
+        self._sock = None
+
+    def listen_on(self, sock):
+        """Serve connections accepted on sock, an already listening socket,
+        rather than binding a socket of its own (see prefork.py)"""
+        self._sock = sock
+
+    async def send_error(self, writer, status):
+        """Send an error response, after which the connection is closed"""
+        writer.write(blug_server.format_head(
+            status, [('Content-Length', '0')]) +
+            blug_server.date_header() + blug_server.CLOSE)
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on a connection, in order, until it is closed"""
+        loop = asyncio.get_running_loop()
+        requests_handled = 0
+        if self.stats:
+            self.stats.connection_opened()
+        try:
+            while requests_handled < self.max_requests:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b'\r\n\r\n'), self.timeout)
+                except asyncio.LimitOverrunError:
+                    await self.send_error(writer, 431)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    break
+                request = parse_head(head)
+                if request is None:
+                    await self.send_error(writer, 400)
+                    break
+                (method, path, version, headers) = request
+                if method not in ('GET', 'HEAD'):
+                    await self.send_error(writer, 501)
+                    break
+
+                requests_handled += 1
+                close_connection = (
+                    not blug_server.keep_alive(version, headers) or
+                    requests_handled >= self.max_requests)
+                started = time.perf_counter()
+                generation = self.generation
+                response = blug_server.dynamic_response(self, generation,
+                                                        path)
+                if response:
+                    (status, head, body, file_path) = response
+                    zipped = False
+                else:
+                    (status, head, body, route,
+                     zipped) = generation.routes.respond(path, headers)
+                    file_path = route.path
+                writer.write(head + blug_server.date_header() + (
+                    blug_server.CLOSE if close_connection else
+                    blug_server.KEEP_ALIVE))
+                size = 0
+                if method == 'HEAD' or body is None:
+                    pass
+                elif isinstance(body, str):
+                    # A large file served straight from disk
+                    await writer.drain()
+                    with open(body, 'rb') as input_file:
+                        size = await loop.sendfile(writer.transport,
+                                                   input_file)
+                else:
+                    writer.write(body)
+                    size = len(body)
+                await writer.drain()
+                if self.stats:
+                    self.stats.record(file_path, status, size, zipped,
+                                      time.perf_counter() - started)
+                if self.access_log:
+                    self.access_log.log(
+                        writer.get_extra_info('peername')[0], method, path,
+                        version, status, size, headers.get('referer'),
+                        headers.get('user-agent'))
+                if close_connection:
+                    break
+        except OSError:
+            # The client went away, or a file sent from disk vanished after
+            # its head was sent; either way the connection can't continue
+            pass
+        finally:
+            if self.stats:
+                self.stats.connection_closed()
+            writer.close()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        if self._sock:
+            server = await asyncio.start_server(
+                self.handle_connection, sock=self._sock,
+                limit=MAX_HEADER_SIZE, backlog=BACKLOG)
+        else:
+            server = await asyncio.start_server(
+                self.handle_connection, self.server_address[0],
+                self.server_address[1], limit=MAX_HEADER_SIZE,
+                backlog=BACKLOG)
+        self.server_address = server.sockets[0].getsockname()[:2]
+        self.started.set()
+        async with server:
+            await self._stop.wait()
+
+    def serve_forever(self):
+        """Serve until shutdown() is called"""
+        asyncio.run(self._serve())
+
+    def shutdown(self):
+        """Stop serving; may be called from any thread"""
+        self._loop.call_soon_threadsafe(self._stop.set)
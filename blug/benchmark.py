@@ -0,0 +1,325 @@
+#! /usr/bin/env python
+"""Benchmarks of each phase of the site generator, run against synthetic
+sites"""
+
+import os
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import threading
+import subprocess
+
+import jinja2
+
+BLUG_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BLUG_DIR)
+DEFAULT_POST_COUNTS = [100, 1000]
+CATEGORIES = ['python', 'web', 'ops', 'databases', 'testing', 'career',
+              'tools', 'javascript', 'design', 'books']
+WORDS = ('the a of to and in is it you that he was for on are with as his '
+         'they be at one have this from or had by hot word but what some we '
+         'can out other were all there when up use your how said an each '
+         'she which do their time if will way about many then them write '
+         'would like so these her long make thing see him two has look more '
+         'day could go come did number sound no most people my over know '
+         'water than call first who may down side been now find').split()
+SITE_CONFIG = {
+    'domain': 'example.com',
+    'url': 'http://example.com',
+    'blog_root': '',
+    'blog_prefix': 'blog',
+    'title': 'Benchmark',
+    'tag_line': 'Synthetic posts',
+    'author': 'Blug',
+    'output_dir': 'generated',
+    'content_dir': 'content',
+    'template_dir': 'templates',
+    'feed_url': 'http://example.com/atom.xml',
+}
+
+
+def sentence(generator):
+    words = generator.sample(WORDS, generator.randint(6, 16))
+    return ' '.join(words).capitalize() + '.'
+
+
+def paragraph(generator):
+    return ' '.join(sentence(generator)
+                    for _ in range(generator.randint(2, 6)))
+
+
+def code_block(generator):
+    lines = ['```python', 'def {}(values):'.format(generator.choice(WORDS))]
+    for index in range(generator.randint(2, 12)):
+        lines.append('    total_{0} = sum(value * {0} for value in values)'
+                     .format(index))
+    lines.extend(['    return total_0', '```'])
+    return '\n'.join(lines)
+
+
+def table(generator):
+    rows = ['| Name | Count | Notes |', '| --- | ---: | --- |']
+    for _ in range(generator.randint(2, 8)):
+        rows.append('| {} | {} | {} |'.format(
+            generator.choice(WORDS), generator.randint(0, 1000),
+            sentence(generator)))
+    return '\n'.join(rows)
+
+
+def synthesize_post(generator, index, date):
+    """Return the file name and Markdown of a synthetic post"""
+    title = 'Post {} {}'.format(index, ' '.join(generator.sample(WORDS, 3)))
+    categories = generator.sample(CATEGORIES, generator.randint(1, 3))
+    blocks = [paragraph(generator), '<!--more-->']
+    footnotes = list()
+    for _ in range(generator.randint(3, 12)):
+        kind = generator.random()
+        if kind < 0.2:
+            blocks.append(code_block(generator))
+        elif kind < 0.3:
+            blocks.append(table(generator))
+        elif kind < 0.4:
+            footnotes.append(len(footnotes) + 1)
+            blocks.append('{}[^{}]'.format(paragraph(generator),
+                                           footnotes[-1]))
+        else:
+            blocks.append(paragraph(generator))
+    blocks.extend('[^{}]: {}'.format(number, sentence(generator))
+                  for number in footnotes)
+    text = 'title: {}\ndate: {}\ncategories: {}\n\n{}\n'.format(
+        title, date.strftime('%Y-%m-%d %H:%M'), ' '.join(categories),
+        '\n\n'.join(blocks))
+    file_name = '{}-post-{}.md'.format(date.strftime('%Y-%m-%d'), index)
+    return (file_name, text)
+
+
+def create_site(site_dir, post_count, seed=0):
+    """Create a site with post_count synthetic posts in site_dir"""
+    generator = random.Random(seed)
+    for name in ('templates', 'static'):
+        shutil.copytree(os.path.join(REPOSITORY_DIR, name),
+                        os.path.join(site_dir, name))
+    content_dir = os.path.join(site_dir, 'content')
+    os.makedirs(content_dir)
+    date = datetime.datetime(2010, 1, 1, 9, 0)
+    for index in range(post_count):
+        date += datetime.timedelta(hours=generator.randint(6, 72))
+        (file_name, text) = synthesize_post(generator, index, date)
+        with open(os.path.join(content_dir, file_name), 'w') as post_file:
+            post_file.write(text)
+
+
+def edit_post(content_dir):
+    """Append a paragraph to the newest post, as a writer saving it would"""
+    post_path = os.path.join(content_dir, max(os.listdir(content_dir)))
+    with open(post_path, 'a') as post_file:
+        post_file.write('\nOne more paragraph.\n')
+
+
+def import_blug():
+    """Import blug.py, which expects a config module, with the benchmark's
+    configuration"""
+    config = types.ModuleType('config_local')
+    config.CONFIG = SITE_CONFIG
+    sys.modules['config_local'] = config
+    if BLUG_DIR not in sys.path:
+        sys.path.insert(0, BLUG_DIR)
+    import blug
+    return blug
+
+
+def timed(phases, name, function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    phases[name] = time.perf_counter() - started
+    return result
+
+
+def clear_caches(blug, site_config):
+    import disk_cache
+    for name in blug.CACHE_NAMES:
+        disk_cache.get_cache(site_config, name).clear()
+
+
+def run_phases(blug, site_config, jobs, cold):
+    """Time each phase of generating the site, rendering each phase's pages
+    on its own, and then a complete build. A cold run starts each of the two
+    from empty caches (and the build from an empty output directory)."""
+    import assets
+    import converter
+    import disk_cache
+    import profiler
+    import renderer
+
+    phases = dict()
+    if cold:
+        clear_caches(blug, site_config)
+    post_cache = disk_cache.get_cache(site_config, 'posts')
+    posts = timed(phases, 'get_all_posts', blug.get_all_posts,
+                  site_config['content_dir'], site_config['blog_prefix'],
+                  site_config['url'], site_config['blog_root'], post_cache)
+    (posts, categories) = blug.prepare_posts(posts)
+    template_environment = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(site_config['template_dir']))
+    site_config = dict(site_config, asset_url=timed(
+        phases, 'build_assets', assets.build_assets, template_environment,
+        'static', site_config['output_dir']))
+
+    def render(page_queue):
+        converter.load_bodies(page_queue.body_posts.values(), jobs)
+        page_queue.render(site_config['template_dir'], jobs,
+                          template_environment)
+
+    def static_files():
+        page_queue = renderer.PageQueue()
+        blug.generate_static_files(site_config, posts, categories,
+                                   template_environment, page_queue)
+        render(page_queue)
+
+    def pagination_pages():
+        page_queue = renderer.PageQueue()
+        blug.generate_pagination_pages(
+            site_config, posts, template_environment.get_template(
+                'list.html'), page_queue)
+        render(page_queue)
+
+    def post_pages():
+        page_queue = renderer.PageQueue()
+        for post in posts:
+            blug.generate_post(post, site_config, template_environment,
+                               page_queue)
+        render(page_queue)
+
+    # The phases share the posts, so each body is only converted once, by
+    # whichever phase needs it first; the feeds in the static files need
+    # every body, just as they do in a real build
+    timed(phases, 'generate_static_files', static_files)
+    timed(phases, 'generate_pagination_pages', pagination_pages)
+    timed(phases, 'generate_post', post_pages)
+    post_cache.evict()
+    if cold:
+        clear_caches(blug, site_config)
+    build_config = dict(SITE_CONFIG)
+    build_config['output_dir'] = os.path.abspath(build_config['output_dir'])
+    timed(phases, 'build_site', blug.build_site, build_config, cold, jobs)
+    if cold:
+        return phases
+
+    # Regenerate after an edit as watch_site() does, with the posts and
+    # templates already in memory
+    watched_posts = dict()
+    blug.update_posts(watched_posts, build_config, post_cache)
+    edit_post(build_config['content_dir'])
+    profile = profiler.BuildProfile()
+
+    def rebuild():
+        blug.update_posts(watched_posts, build_config, post_cache)
+        blug.build_site(build_config, jobs=jobs, all_posts=[
+            post for (_, post) in watched_posts.values()],
+            template_environment=template_environment, profile=profile)
+
+    timed(phases, 'rebuild_after_edit', rebuild)
+    for (name, (seconds, _)) in profile.phases.items():
+        phases['rebuild: ' + name] = seconds
+    return phases
+
+
+def benchmark(post_count, jobs=1, seed=0):
+    """Return the cold and warm timings of each phase for a site of
+    post_count posts"""
+    blug = import_blug()
+    site_dir = tempfile.mkdtemp(prefix='blug-benchmark-')
+    working_dir = os.getcwd()
+    try:
+        create_site(site_dir, post_count, seed)
+        os.chdir(site_dir)
+        site_config = dict(SITE_CONFIG)
+        site_config['output_dir'] = os.path.join(site_dir, 'phases')
+        site_config['blog_dir'] = os.path.join(site_config['output_dir'],
+                                               site_config['blog_prefix'])
+        results = list()
+        for build in ('cold', 'warm'):
+            phases = run_phases(blug, site_config, jobs, build == 'cold')
+            results.append({'posts': post_count, 'build': build,
+                            'jobs': jobs, 'phases': phases})
+        return results
+    finally:
+        # Let the threads removing old builds finish before the site goes
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread() and not thread.daemon:
+                thread.join()
+        os.chdir(working_dir)
+        shutil.rmtree(site_dir, ignore_errors=True)
+
+
+def get_commit():
+    """Return the commit being benchmarked, if it can be found"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY_DIR,
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    """Print a table of results, compared with previous ones if given"""
+    previous_phases = dict()
+    for result in (previous or {}).get('results', []):
+        previous_phases[(result['posts'], result['build'])] = result['phases']
+    for result in results:
+        print ('{posts} posts, {build} build:'.format(**result))
+        before = previous_phases.get((result['posts'], result['build']), {})
+        for phase, seconds in result['phases'].items():
+            line = '    {:<28}{:>10.3f}s'.format(phase, seconds)
+            if before.get(phase):
+                line += '  ({:+.1%})'.format(seconds / before[phase] - 1)
+            print (line)
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description='Time each phase of generating synthetic sites')
+    argument_parser.add_argument('--posts', type=int, nargs='+',
+                                 default=DEFAULT_POST_COUNTS,
+                                 help='Numbers of posts to benchmark with')
+    argument_parser.add_argument('-j', '--jobs', type=int, default=1,
+                                 help='Worker processes to generate with')
+    argument_parser.add_argument('--seed', type=int, default=0,
+                                 help='Seed for the synthetic posts')
+    argument_parser.add_argument('-o', '--output',
+                                 default='benchmark-results.json',
+                                 help='File to write the results to')
+    argument_parser.add_argument('--compare',
+                                 help='Results of an earlier run to compare '
+                                 'with')
+    arguments = argument_parser.parse_args()
+
+    previous = None
+    if arguments.compare:
+        with open(arguments.compare) as previous_file:
+            previous = json.load(previous_file)
+    results = list()
+    for post_count in arguments.posts:
+        results.extend(benchmark(post_count, arguments.jobs, arguments.seed))
+    print_results(results, previous)
+    with open(arguments.output, 'w') as output_file:
+        json.dump({
+            'commit': get_commit(),
+            'date': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'results': results,
+        }, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,30 @@
 
 import jinja2
 import sys
-import markdown
 import os
 import datetime
+import time
 import shutil
+import signal
 import argparse
 import collections
 import blug_server
+import async_server
+import manifest
+import converter
+import disk_cache
+import renderer
+import staging
+import watcher
+import deploy
+import sitepack
+import assets
+import search
+import stats
+import prefork
+import reloader
+import profiler
+from access_log import AccessLog, LOG_FORMATS
 from copy import copy
 try:
     import config_local as config
@@ -21,6 +38,9 @@ date: {date}
 categories:
 """
 
+CACHE_NAMES = ['posts', 'search', 'highlight']
+DEFAULT_FEED_ENTRIES = 20
+
 
 def generate_post_file_name(title):
     """Return the file name a post should use based on its title and date"""
@@ -36,65 +56,50 @@ def generate_post_file_path(title, date):
         generate_post_file_name(title))
 
 
-def get_all_posts(content_dir, blog_prefix, canonical_url, blog_root=None):
-    """Return a list of dictionaries representing converted posts"""
-    input_files = os.listdir(content_dir)
-    all_posts = list()
-
-    for post_file_name in input_files:
-        if os.path.splitext(post_file_name)[1] != ".md":
-            continue
-
-        post = dict()
-        post_output_path = os.path.join(content_dir, post_file_name)
-        with open(post_output_path, encoding='ascii') as post_file:
-            post_file_buffer = post_file.read()
-
-        # Generate HTML from Markdown, splitting between the teaser (the
-        # content to display on the front page until <!--more--> is reached)
-        # and the post proper
-        mardown_generator = markdown.Markdown(extensions=[
-            'fenced_code',
-            'codehilite',
-            'tables',
-            'footnotes',
-            'meta',
-        ])
-        generated_html = mardown_generator.convert(post_file_buffer)
-        post['body'] = generated_html
-        post['title'] = mardown_generator.Meta['title'][0]
-        (post['teaser'], _, _) = generated_html.partition('<!--more-->')
-        post['categories'] = mardown_generator.Meta['categories'][0].split()
-
-        # Construct datetime from the *incredibly useful* string YAML
-        # provides
-        post['date'] = datetime.datetime.strptime(
-            (mardown_generator.Meta['date'][0].strip()), '%Y-%m-%d %H:%M')
-
-        # In general we know the layout on disk must match the generated urls
-        # This doesn't hold in the case that there is an appendix to the
-        # domain that the site resides on. For example, if my WidgetFactory
-        # marketing department blog lived at
-        # www.widgetfactory.com/marketing/blog/, we would generate the
-        # files in the /blog sub-directory but the links would need to
-        # include /marketing/blog
-        post['relative_path'] = generate_post_file_path(post['title'],
-                                                        post['date'])
-
-        if blog_prefix:
-            post['relative_path'] = os.path.join(
-                blog_prefix, post['relative_path'])
-
-        if blog_root:
-            post['relative_url'] = os.path.join('/', blog_root,
-                                                post['relative_path'])
-        else:
-            post['relative_url'] = os.path.join('/', post['relative_path'])
+def get_post(post_file_path, blog_prefix, canonical_url, blog_root=None,
+             cache=None):
+    """Return a dictionary representing the post at post_file_path. Only the
+    post's metadata is read; its body and teaser are converted when first
+    used."""
+    post = converter.load_post(post_file_path, cache)
+
+    # In general we know the layout on disk must match the generated urls
+    # This doesn't hold in the case that there is an appendix to the
+    # domain that the site resides on. For example, if my WidgetFactory
+    # marketing department blog lived at
+    # www.widgetfactory.com/marketing/blog/, we would generate the
+    # files in the /blog sub-directory but the links would need to
+    # include /marketing/blog
+    post['relative_path'] = generate_post_file_path(post['title'],
+                                                    post['date'])
+
+    if blog_prefix:
+        post['relative_path'] = os.path.join(
+            blog_prefix, post['relative_path'])
+
+    if blog_root:
+        post['relative_url'] = os.path.join('/', blog_root,
+                                            post['relative_path'])
+    else:
+        post['relative_url'] = os.path.join('/', post['relative_path'])
+
+    post['canonical_url'] = canonical_url + post['relative_url']
+    return post
+
+
+def get_post_file_paths(content_dir):
+    """Return the paths of every post in content_dir"""
+    return [os.path.join(content_dir, post_file_name)
+            for post_file_name in sorted(os.listdir(content_dir))
+            if os.path.splitext(post_file_name)[1] == '.md']
 
-        post['canonical_url'] = canonical_url + post['relative_url']
 
-        all_posts.append(post)
-    return all_posts
+def get_all_posts(content_dir, blog_prefix, canonical_url, blog_root=None,
+                  cache=None):
+    """Return a list of dictionaries representing posts"""
+    return [get_post(post_file_path, blog_prefix, canonical_url, blog_root,
+                     cache)
+            for post_file_path in get_post_file_paths(content_dir)]
 
 
 def create_path_to_file(path):
@@ -108,36 +113,45 @@ def create_path_to_file(path):
         os.makedirs(path)
 
 
-def generate_post(post, template_variables, template_environment):
-    """Generate a single post's HTML file"""
-    output_path = os.path.join(template_variables['output_dir'],
+def generate_post(post, site_config, template_environment, page_queue):
+    """Queue a single post's HTML file to be generated"""
+    output_path = os.path.join(site_config['output_dir'],
                                post['relative_path'], 'index.html')
 
-    if not post['body']:
-        raise EnvironmentError('No content for post [{post}] found.'.format(
-            post=post['relative_path']))
-
     # Need to keep 'post' and 'site' variables separate
-    post_vars = {'post': post}
-
-    template_variables.update(post_vars)
-    template = template_environment.get_template('post_index.html')
-    create_path_to_file(output_path)
-    with open(output_path, 'w') as output:
-        output.write(template.render(template_variables))
-
-
-def generate_static_page(template_variables, output_dir, template,
-                         filename='index.html'):
-    """Generate a static page"""
-    create_path_to_file(output_dir)
-    with open(
-        os.path.join(
-            output_dir, filename), 'w', encoding='ascii') as output_file:
-        output_file.write(template.render(template_variables))
-
-
-def generate_static_files(site_config, posts, categories, template_environment):
+    template_variables = copy(site_config)
+    template_variables['post'] = post
+    page_queue.add(template_environment.get_template('post_index.html'),
+                   template_variables, output_path, [post])
+
+
+def generate_static_page(template_variables, output_dir, template, page_queue,
+                         filename='index.html', body_posts=()):
+    """Queue a static page to be generated"""
+    page_queue.add(template, template_variables,
+                   os.path.join(output_dir, filename), body_posts)
+
+
+def generate_feed(template_variables, output_dir, template, page_queue,
+                  posts, max_entries):
+    """Queue an Atom feed of the newest max_entries of posts (or all of them
+    if max_entries is 0 or None), which are sorted newest first"""
+    feed_posts = posts[:max_entries] if max_entries else posts
+    template_variables = copy(template_variables)
+    template_variables['all_posts'] = feed_posts
+    # The feed changes only when its entries do, so it's dated by its newest
+    # entry rather than by the build, and isn't rewritten by every build
+    template_variables['updated'] = (
+        feed_posts[0]['date'].isoformat() if feed_posts
+        else template_variables['now'])
+    body_posts = (() if template_variables.get('feed_content') == 'teaser'
+                  else feed_posts)
+    generate_static_page(template_variables, output_dir, template,
+                         page_queue, 'atom.xml', body_posts)
+
+
+def generate_static_files(site_config, posts, categories, template_environment,
+                          page_queue):
     """Generate all 'static' files, files not based on markdown conversion"""
     # Generate an index.html at both the root level and 
     # the 'blog' level, so both www.foo.com and
@@ -156,7 +170,8 @@ def generate_static_files(site_config, posts, categories, template_environment):
             except KeyError:
                 path = os.path.join(site_config['output_dir'], entry_name)
             template = template_environment.get_template(template_path)
-            generate_static_page(site_config, path, template)
+            generate_static_page(site_config, path, template,
+                                 page_queue=page_queue)
 
     canonical_url_base = site_config['url']
     canonical_blog_base = '{url}/{blog_prefix}/'.format(
@@ -170,42 +185,51 @@ def generate_static_files(site_config, posts, categories, template_environment):
     template_variables['canonical_url'] = template_variables['url']
     template_variables['current_posts'] = posts[:5]
     generate_static_page(template_variables,
-                         site_config['output_dir'], list_template)
+                         site_config['output_dir'], list_template,
+                         page_queue=page_queue)
 
     template_variables['canonical_url'] = canonical_blog_base
     generate_static_page(template_variables,
-                         site_config['blog_dir'], list_template)
+                         site_config['blog_dir'], list_template,
+                         page_queue=page_queue)
 
     # Generate 'about-me' page
     template_variables['canonical_url'] = canonical_url_base + '/about-me/'
     generate_static_page(template_variables,
                          os.path.join(site_config['output_dir'], 'about-me'),
-                         about_template)
+                         about_template, page_queue=page_queue)
 
     # Generate blog archives page
     template_variables['all_posts'] = posts
     template_variables['canonical_url'] = canonical_blog_base + 'archives/'
     generate_static_page(template_variables,
                          os.path.join(site_config['blog_dir'],
-                         'archives'), archives_template)
+                         'archives'), archives_template,
+                         page_queue=page_queue)
 
     # Generate atom.xml feed
     template_variables['now'] = datetime.datetime.now().isoformat()
-    generate_static_page(template_variables, site_config['output_dir'],
-                         atom_template, 'atom.xml')
+    feed_entries = site_config.get('feed_entries', DEFAULT_FEED_ENTRIES)
+    category_feed_entries = site_config.get('category_feed_entries')
+    if category_feed_entries is None:
+        category_feed_entries = feed_entries
+    generate_feed(template_variables, site_config['output_dir'],
+                  atom_template, page_queue, posts, feed_entries)
 
     # Generate a category "archive" page listing the posts in each category
     for category, posts in categories.items():
         template_variables['all_posts'] = posts
         generate_static_page(template_variables, os.path.join(
             site_config['blog_dir'],
-           'categories', category), archives_template)
-        generate_static_page(template_variables, os.path.join(
-            site_config['blog_dir'],
-            'categories', category), atom_template, 'atom.xml')
+           'categories', category), archives_template,
+           page_queue=page_queue)
+        generate_feed(template_variables, os.path.join(
+            site_config['blog_dir'], 'categories', category),
+            atom_template, page_queue, posts, category_feed_entries)
 
 
-def generate_pagination_pages(site_config, all_posts, template):
+def generate_pagination_pages(site_config, all_posts, template,
+                              page_queue):
     """Generate the additional index.html files required for pagination"""
     template_variables = copy(site_config)
     num_posts = len(all_posts)
@@ -225,50 +249,123 @@ def generate_pagination_pages(site_config, all_posts, template):
 
         output_dir = os.path.join(site_config['blog_dir'],
                                   'page', str(current_page))
-        generate_static_page(template_variables, output_dir, template)
+        generate_static_page(template_variables, output_dir, template,
+                             page_queue=page_queue)
 
 
-def generate_all_files(site_config):
-    """Generate all HTML files from the content directory using the site-wide
-    configuration"""
-    all_posts = get_all_posts(site_config['content_dir'],
-                              site_config['blog_prefix'],
-                              site_config['url'],
-                              site_config['blog_root'])
-    all_posts.sort(key=lambda i: i['date'], reverse=True)
+def prepare_posts(all_posts):
+    """Return all_posts sorted newest first, each linked to the post before
+    it, and the posts in each category"""
+    all_posts = sorted(all_posts, key=lambda i: i['date'], reverse=True)
     categories = collections.defaultdict(list)
     for post in all_posts:
         for category in post['categories']:
             categories[category].append(post)
 
-    template_environment = jinja2.Environment(loader=jinja2.FileSystemLoader(
-                                              site_config['template_dir']))
-
-    generate_static_files(
-            site_config, 
-            all_posts, 
-            categories, 
-            template_environment)
-
-    generate_pagination_pages(
-            site_config, 
-            all_posts, 
-            template_environment.get_template('list.html'))
-
+    # Each post links to the one before it. Only the details needed for the
+    # link are kept, so pages can be handed to other processes without
+    # dragging the whole chain of posts along.
     for index, post in enumerate(all_posts):
-        try:
-            post['post_previous'] = all_posts[index + 1]
-        except IndexError:
-            post['post_previous'] = all_posts[0]
-        generate_post(post, site_config, template_environment)
+        previous = all_posts[(index + 1) % len(all_posts)]
+        post['post_previous'] = {key: previous[key] for key in (
+            'title', 'relative_url', 'canonical_url', 'source_hash')}
+    return (all_posts, categories)
 
 
-def copy_static_content(output_dir, root_dir):
-    """Copy (if necessary) the static content to the appropriate directory"""
-    if os.path.exists(output_dir):
-        print ('Removing old content...')
-        shutil.rmtree(output_dir)
-    shutil.copytree(os.path.join(root_dir, 'static'), output_dir)
+def generate_all_files(site_config, build_manifest=None, jobs=1,
+                       all_posts=None, template_environment=None,
+                       profile=None):
+    """Generate all HTML files from the content directory using the site-wide
+    configuration, and all_posts and template_environment if given"""
+    post_cache = disk_cache.get_cache(site_config, 'posts')
+    with profiler.phase(profile, 'read posts'):
+        if all_posts is None:
+            all_posts = get_all_posts(site_config['content_dir'],
+                                      site_config['blog_prefix'],
+                                      site_config['url'],
+                                      site_config['blog_root'],
+                                      post_cache)
+        (all_posts, categories) = prepare_posts(all_posts)
+
+    if not template_environment:
+        template_environment = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(site_config['template_dir']))
+    with profiler.phase(profile, 'assets'):
+        site_config = dict(site_config, asset_url=assets.build_assets(
+            template_environment, os.path.join(os.getcwd(), 'static'),
+            site_config['output_dir'], build_manifest,
+            site_config.get('blog_root')))
+
+    with profiler.phase(profile, 'queue pages'):
+        page_queue = renderer.PageQueue(build_manifest)
+
+        generate_static_files(
+                site_config, 
+                all_posts, 
+                categories, 
+                template_environment,
+                page_queue)
+
+        generate_pagination_pages(
+                site_config, 
+                all_posts, 
+                template_environment.get_template('list.html'),
+                page_queue)
+
+        for post in all_posts:
+            generate_post(post, site_config, template_environment,
+                          page_queue)
+
+    # Convert the bodies the queued pages need up front, in parallel, rather
+    # than one at a time as each page is rendered
+    highlight_cache = disk_cache.get_cache(site_config, 'highlight')
+    converter.set_highlight_cache(highlight_cache)
+    with profiler.phase(profile, 'convert posts'):
+        converter.load_bodies(page_queue.body_posts.values(), jobs, profile)
+    page_queue.render(site_config['template_dir'], jobs,
+                      template_environment, profile)
+
+    search_cache = disk_cache.get_cache(site_config, 'search')
+    with profiler.phase(profile, 'search index'):
+        search.write_index(site_config['output_dir'], all_posts,
+                           build_manifest, search_cache)
+    with profiler.phase(profile, 'evict cache'):
+        post_cache.evict()
+        search_cache.evict()
+        highlight_cache.evict()
+
+
+def copy_static_content(output_dir, root_dir, build_manifest=None,
+                        profile=None):
+    """Copy (if necessary) the static content to the appropriate directory,
+    counting the bytes copied in profile, if given"""
+    if not build_manifest:
+        if os.path.exists(output_dir):
+            print ('Removing old content...')
+            shutil.rmtree(output_dir)
+        shutil.copytree(os.path.join(root_dir, 'static'), output_dir)
+        return
+
+    # Only copy files whose size or modification time differs from the
+    # copy made by the previous build. Generated files take precedence over
+    # static files of the same name (static/atom.xml, for example).
+    static_dir = os.path.join(root_dir, 'static')
+    for directory, _, file_names in os.walk(static_dir):
+        for file_name in file_names:
+            source_path = os.path.join(directory, file_name)
+            output_path = os.path.join(
+                output_dir, os.path.relpath(source_path, static_dir))
+            if build_manifest.is_recorded(output_path):
+                continue
+            source_stat = os.stat(source_path)
+            signature = '{size}:{mtime}'.format(
+                size=source_stat.st_size, mtime=source_stat.st_mtime_ns)
+            if build_manifest.needs_update(output_path, signature):
+                create_path_to_file(output_path)
+                staging.remove_file(output_path)
+                shutil.copy2(source_path, output_path)
+                if profile:
+                    profile.record_write(source_stat.st_size)
 
 
 def create_post(title, content_dir):
@@ -292,25 +389,80 @@ def create_post(title, content_dir):
 
 def serve(**kwargs):
     """Serve static HTML pages indefinitely"""
-    root = kwargs['root']
+    root = os.path.abspath(kwargs['root'])
+    server_address = (kwargs['host'], int(kwargs['port']))
+    workers = kwargs['workers']
+    # Made absolute before changing directory, so a relative path is
+    # relative to where Blug was run from
+    access_log_path = (os.path.abspath(kwargs['access_log'])
+                       if kwargs['access_log'] else None)
+    server_stats = stats.ServerStats() if kwargs['stats'] else None
+    search_index = None
+    if kwargs['search']:
+        search_index = search.SearchIndex.open(root)
+        if search_index is None:
+            raise EnvironmentError(
+                'No search index found in [{root}]; generate the site '
+                'first'.format(root=root))
     os.chdir(root)
 
+    def open_access_log(httpd):
+        if access_log_path:
+            httpd.access_log = AccessLog(access_log_path, kwargs['log_format'],
+                                         kwargs['log_sample'])
+
+    def close_access_log(httpd):
+        if httpd.access_log:
+            httpd.access_log.close()
+
+    def start_worker(httpd):
+        """Open the access log and start reloading the site on SIGHUP or a
+        new build"""
+        open_access_log(httpd)
+        site_reloader = reloader.Reloader(
+            httpd, root, kwargs['search'], kwargs['reload_interval'] or None,
+            server_stats)
+        signal.signal(prefork.RELOAD_SIGNAL, site_reloader.request)
+        site_reloader.start()
 
     if kwargs['simple']:
         import http.server
         handler = http.server.SimpleHTTPRequestHandler
         handler.protocol_version = "HTTP/1.0"
-        httpd = http.server.HTTPServer((kwargs['host'],
-                                        int(kwargs['port'])), handler)
+        httpd = http.server.HTTPServer(server_address, handler)
+        print("serving from {path} on port {port}".format(
+            path=root, port=kwargs['port']))
+        httpd.serve_forever()
+        return
+
+    elif kwargs['engine'] == 'asyncio':
+        httpd = async_server.AsyncBlugServer(
+            root, server_address,
+            cache_size=kwargs['cache_size'] * 1024 * 1024,
+            stats=server_stats, search_index=search_index)
 
     else:
         handler = blug_server.FileCacheRequestHandler
-        httpd = blug_server.BlugHttpServer(root, (kwargs['host'],
-                                           int(kwargs['port'])), handler)
+        # With several workers, each worker listens on its own socket
+        httpd = blug_server.BlugHttpServer(
+            root, server_address, handler,
+            cache_size=kwargs['cache_size'] * 1024 * 1024,
+            stats=server_stats, search_index=search_index,
+            bind_and_activate=workers <= 1)
 
     print("serving from {path} on port {port}".format(path=root,
                                                       port=kwargs['port']))
-    httpd.serve_forever()
+    if workers > 1:
+        print('with {} worker processes'.format(workers))
+        prefork.Supervisor(httpd, server_address, workers,
+                           initializer=start_worker,
+                           finalizer=close_access_log).run()
+        return
+    start_worker(httpd)
+    try:
+        httpd.serve_forever()
+    finally:
+        close_access_log(httpd)
 
 
 def create_new_post(**kwargs):
@@ -320,20 +472,151 @@ def create_new_post(**kwargs):
     create_post(kwargs['title'], site_config['content_dir'])
 
 
-def generate_site():
+def manage_cache(**kwargs):
+    """Display statistics about, or clear, Blug's on-disk caches"""
+    site_config = config.CONFIG
+    for name in CACHE_NAMES:
+        cache = disk_cache.get_cache(site_config, name)
+        if kwargs['action'] == 'clear':
+            print ('Removed {count} entries from {directory}'.format(
+                count=cache.clear(), directory=cache.directory))
+        else:
+            print (cache)
+
+
+def build_site(site_config, full=False, jobs=1, all_posts=None,
+               template_environment=None, profile=None):
+    """Generate the site described by site_config into a new build and
+    publish it, returning the build's manifest. Where the time goes is
+    recorded in profile, if given."""
+    # Generate into a new build directory, starting from hard links to the
+    # files of the current build, and only publish it once it's complete
+    output_dir = site_config['output_dir']
+    build_config = copy(site_config)
+    with profiler.phase(profile, 'create build'):
+        build_config['output_dir'] = staging.create_build(
+            output_dir, link_previous=not full)
+        build_config['blog_dir'] = os.path.join(
+            build_config['output_dir'], 
+            build_config['blog_prefix'])
+        build_manifest = manifest.BuildManifest(build_config['output_dir'],
+                                                full)
+
+    try:
+        generate_all_files(build_config, build_manifest, jobs, all_posts,
+                           template_environment, profile)
+        with profiler.phase(profile, 'copy static content'):
+            copy_static_content(build_config['output_dir'], os.getcwd(),
+                                build_manifest, profile)
+
+        with profiler.phase(profile, 'remove stale files'):
+            for path in build_manifest.remove_stale_outputs():
+                print ('Removed stale file {path}'.format(path=path))
+        with profiler.phase(profile, 'hash files'):
+            file_manifest = deploy.update_file_manifest(
+                build_config['output_dir'])
+        with profiler.phase(profile, 'write site pack'):
+            pack_size = sitepack.write_pack(build_config['output_dir'],
+                                            blug_server.FileCache.FILE_TYPES,
+                                            file_manifest)
+            if profile and pack_size is not None:
+                profile.record_write(pack_size)
+        build_manifest.save()
+    except BaseException:
+        staging.discard_build(build_config['output_dir'])
+        raise
+    with profiler.phase(profile, 'publish build'):
+        staging.publish_build(output_dir, build_config['output_dir'])
+    return build_manifest
+
+
+def generate_site(**kwargs):
     """Generate the static HTML pages based on the configuration 
     file and content directory"""
     site_config = config.CONFIG
-
-    site_config['blog_dir'] = os.path.join(
-        site_config['output_dir'], 
-        site_config['blog_prefix'])
+    profile = None
+    if kwargs.get('profile') or kwargs.get('profile_output'):
+        profile = profiler.BuildProfile()
     print ('Generating...')
+    if kwargs.get('profile_output'):
+        import cProfile
+        code_profile = cProfile.Profile()
+        build_manifest = code_profile.runcall(
+            build_site, site_config, kwargs.get('full'),
+            kwargs.get('jobs', 1), profile=profile)
+        code_profile.dump_stats(kwargs['profile_output'])
+    else:
+        build_manifest = build_site(site_config, kwargs.get('full'),
+                                    kwargs.get('jobs', 1), profile=profile)
+    print (build_manifest)
+    if profile:
+        print (profile.report(kwargs.get('profile_top')))
+    return True
 
-    copy_static_content(site_config['output_dir'], os.getcwd())
-    generate_all_files(site_config)
 
-    return True
+def update_posts(posts, site_config, post_cache=None):
+    """Bring posts, which maps the path of each post to the size and
+    modification time it was read with and the post, up to date with the
+    content directory"""
+    post_file_paths = get_post_file_paths(site_config['content_dir'])
+    for post_file_path in set(posts) - set(post_file_paths):
+        del posts[post_file_path]
+    for post_file_path in post_file_paths:
+        post_stat = os.stat(post_file_path)
+        signature = (post_stat.st_size, post_stat.st_mtime_ns)
+        if (post_file_path not in posts or
+                posts[post_file_path][0] != signature):
+            posts[post_file_path] = (signature, get_post(
+                post_file_path, site_config['blog_prefix'],
+                site_config['url'], site_config['blog_root'], post_cache))
+
+
+def watch_site(**kwargs):
+    """Generate the site, then regenerate the affected files whenever a post,
+    template or static file changes. Posts and templates are kept in memory
+    between builds, so only changed posts are read again."""
+    site_config = config.CONFIG
+    post_cache = disk_cache.get_cache(site_config, 'posts')
+    template_environment = jinja2.Environment(loader=jinja2.FileSystemLoader(
+                                              site_config['template_dir']))
+
+    # Posts by path, along with the size and modification time they were
+    # read with
+    posts = dict()
+
+    def rebuild():
+        """Generate the site from the current posts"""
+        start_time = time.time()
+        try:
+            update_posts(posts, site_config, post_cache)
+            build_manifest = build_site(
+                site_config, all_posts=[post for (_, post) in posts.values()],
+                template_environment=template_environment)
+        except Exception as exception:
+            print ('Unable to generate site: {error}'.format(error=exception))
+            return
+        print ('{manifest} ({time:.0f} ms)'.format(
+            manifest=build_manifest, time=(time.time() - start_time) * 1000))
+
+    print ('Generating...')
+    rebuild()
+    site_watcher = watcher.get_watcher([
+        site_config['content_dir'], site_config['template_dir'],
+        os.path.join(os.getcwd(), 'static')])
+    print ('Watching for changes ({watcher})...'.format(
+        watcher=type(site_watcher).__name__))
+    try:
+        while True:
+            changed_paths = site_watcher.wait()
+            print ('Regenerating after changes to {paths}'.format(
+                paths=', '.join(sorted(
+                    os.path.relpath(path) for path in changed_paths))))
+            rebuild()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site_watcher.close()
+
 
 def main():
     """Main execution of blug"""
@@ -354,8 +637,39 @@ def main():
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
         help='Generate the complete static site using the posts\
                 in the \'content\' directory')
+    generate_parser.add_argument('--full', action='store_true',
+            help='Regenerate every file, not just those whose inputs changed')
+    generate_parser.add_argument('-j', '--jobs', type=int,
+            default=os.cpu_count(),
+            help='Number of processes to convert posts and render pages with')
+    generate_parser.add_argument('--profile', action='store_true',
+            help='Report the time taken by each phase of the build and the \
+                    slowest posts, templates and pages')
+    generate_parser.add_argument('--profile-top', type=int,
+            default=profiler.DEFAULT_TOP,
+            help='Number of the slowest posts, templates and pages to report')
+    generate_parser.add_argument('--profile-output',
+            help='File to write cProfile statistics of the build to (for \
+                    pstats, snakeviz or flameprof); implies --profile. Only \
+                    the main process is profiled, so use with -j 1')
     generate_parser.set_defaults(func=generate_site)
 
+    watch_parser = subparser.add_parser(
+        'watch',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        help='Generate the site, then regenerate it whenever a post, \
+                template or static file changes')
+    watch_parser.set_defaults(func=watch_site)
+
+    cache_parser = subparser.add_parser(
+        'cache',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        help='Display statistics about, or clear, the cache of converted \
+                posts')
+    cache_parser.add_argument('action', choices=['stats', 'clear'],
+            help='Action to perform on the cache')
+    cache_parser.set_defaults(func=manage_cache)
+
     serve_parser = subparser.add_parser(
         'serve',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -373,15 +687,41 @@ def main():
             help='Root path to serve files from')
     serve_parser.add_argument('--simple', action='store_true',
             help='Use SimpleHTTPServer instead of Blug\'s web server')
+    serve_parser.add_argument('--engine', choices=['threads', 'asyncio'],
+            default='threads',
+            help='Serve each connection from its own thread, or every \
+                    connection from a single asyncio event loop')
+    serve_parser.add_argument('-w', '--workers', type=int, default=1,
+            help='Number of processes to serve from (each with its own \
+                    threads or event loop)')
+    serve_parser.add_argument('--cache-size', type=int,
+            default=blug_server.FileCache.DEFAULT_MAX_SIZE // (1024 * 1024),
+            help='Megabytes of memory to cache files in (when the site \
+                    has no site pack)')
+    serve_parser.add_argument('--access-log', default='blug.log',
+            help='File to log requests to (an empty string disables \
+                    logging)')
+    serve_parser.add_argument('--log-format', choices=LOG_FORMATS,
+            default='combined',
+            help='Log requests in the Combined Log Format or as JSON lines')
+    serve_parser.add_argument('--log-sample', type=float, default=1.0,
+            help='Fraction of requests to log')
+    serve_parser.add_argument('--stats', action='store_true',
+            help='Serve live metrics at {} (as JSON, or for Prometheus \
+                    with ?format=prometheus)'.format(blug_server.STATS_PATH))
+    serve_parser.add_argument('--search', action='store_true',
+            help='Answer searches of the posts at {}?q=<words> from the \
+                    site\'s search index'.format(blug_server.SEARCH_PATH))
+    serve_parser.add_argument('--reload-interval', type=float,
+            default=reloader.DEFAULT_INTERVAL,
+            help='Seconds between checks for a new build to reload the \
+                    site from (0 to only reload on SIGHUP)')
     serve_parser.set_defaults(func=serve)
 
     parsed_arguments = argument_parser.parse_args()
     arguments = vars(parsed_arguments)
     function = arguments.pop('func')
-    if function == generate_site:
-        function()
-    else:
-        function(**arguments)
+    function(**arguments)
     print ('Complete')
 
 
@@ -1,14 +1,23 @@
 """HTTP server and utilities"""
 
 import os
+import time
+import email.utils
+import mimetypes
+import urllib.parse
+import threading
+import collections
 from http import server
+from http import HTTPStatus
 import resource
-import datetime
-import time
 import gzip
 import socketserver
-import logging
-import logging.handlers
+
+import deploy
+import manifest
+import staging
+import sitepack
+import assets
 
 RUSAGE = """0	{}	time in user mode (float)
 {}	time in system mode (float)
@@ -30,21 +39,314 @@ RUSAGE = """0	{}	time in user mode (float)
 EOL1 = b'\r\n'
 EOL2 = b'\n\n'
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s - %(message)s')
-file_logger = logging.handlers.RotatingFileHandler('blug.log', maxBytes=100000000, backupCount=5)
-file_logger.setLevel(logging.INFO)
-file_logger.setFormatter(formatter)
-logger.addHandler(file_logger)
+
+SERVER_VERSION = 'Blug/1.0'
+# Where the server's metrics are served, if it is given a ServerStats
+STATS_PATH = '/__stats'
+# Where searches are answered, if it is given a search.SearchIndex
+SEARCH_PATH = '/search'
+NOT_FOUND_BODY = (server.DEFAULT_ERROR_MESSAGE % {
+    'code': 404, 'message': 'File not found',
+    'explain': 'Nothing matches the given URI'}).encode('utf-8')
+NOT_FOUND_HEADERS = [('Content-Type', server.DEFAULT_ERROR_CONTENT_TYPE),
+                     ('Content-Length', str(len(NOT_FOUND_BODY)))]
+SERVER_ERROR_BODY = (server.DEFAULT_ERROR_MESSAGE % {
+    'code': 500, 'message': 'Internal Server Error',
+    'explain': 'The file could not be read'}).encode('utf-8')
+SERVER_ERROR_HEADERS = [('Content-Type', server.DEFAULT_ERROR_CONTENT_TYPE),
+                        ('Content-Length', str(len(SERVER_ERROR_BODY)))]
+# Fingerprinted assets (see assets.py) never change
+IMMUTABLE_PREFIX = '/{}/'.format(assets.ASSETS_DIR)
+IMMUTABLE = 'public, max-age=31536000, immutable'
+EXPIRES = email.utils.formatdate(time.time() + 365 * 24 * 60 * 60,
+                                 usegmt=True)
+# The end of every response head
+CLOSE = b'Connection: close\r\n\r\n'
+KEEP_ALIVE = b'Connection: keep-alive\r\n\r\n'
+
+# One of a route's responses. The head holds everything but the Date and
+# Connection headers; the body is a memoryview, the name of a (large) file to
+# be sent whole, or None if it is fetched from the FileCache when needed.
+Response = collections.namedtuple('Response', [
+    'status', 'etag', 'head', 'body', 'not_modified_head'])
+
+_date_header = (0, b'')
+
+
+def date_header():
+    """Return the Date header line, formatted at most once a second"""
+    global _date_header
+    now = int(time.time())
+    if _date_header[0] != now:
+        _date_header = (now, 'Date: {}\r\n'.format(
+            email.utils.formatdate(now, usegmt=True)).encode('ascii'))
+    return _date_header[1]
+
+
+def format_head(status, headers):
+    """Return the status line and headers of a response as bytes"""
+    lines = ['HTTP/1.1 {} {}'.format(status, HTTPStatus(status).phrase),
+             'Server: ' + SERVER_VERSION]
+    lines.extend('{}: {}'.format(keyword, value)
+                 for (keyword, value) in headers)
+    return ('\r\n'.join(lines) + '\r\n').encode('latin-1')
+
+
+def dynamic_response(server, generation, url):
+    """Return the status, head, body and stats path of the response to url,
+    if server answers url from memory (its metrics or search), or None"""
+    path = url.split('?', 1)[0]
+    if server.stats and path == STATS_PATH:
+        return server.stats.respond(url, generation.file_cache) + (
+            STATS_PATH,)
+    if generation.search_index and path == SEARCH_PATH:
+        return generation.search_index.respond(url) + (SEARCH_PATH,)
+    return None
+
+
+def is_not_modified(request_headers, etag, mtime):
+    """Return True if the client's cached copy, as described by its
+    conditional headers, is current"""
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return any(tag.strip() in ('*', etag, 'W/' + etag)
+                   for tag in if_none_match.split(','))
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError, IndexError):
+            return False
+        return since is not None and mtime <= since.timestamp()
+    return False
+
+
+def keep_alive(request_version, request_headers):
+    """Return True if the connection a request arrived on should persist.
+    HTTP/1.1 connections persist unless the client says otherwise; HTTP/1.0
+    connections only if the client asks."""
+    connection = request_headers.get('connection', '').lower()
+    if request_version >= 'HTTP/1.1':
+        return 'close' not in connection
+    return 'keep-alive' in connection
+
+
+def send_buffers(connection, buffers):
+    """Send every buffer on connection, in as few system calls as
+    possible"""
+    buffers = [memoryview(buffer) for buffer in buffers]
+    while buffers:
+        sent = connection.sendmsg(buffers)
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers.pop(0))
+        if sent:
+            buffers[0] = buffers[0][sent:]
+
+
+class Route():
+    """A servable URL and its prebuilt responses"""
+
+    __slots__ = ('path', 'mtime', 'identity', 'gzip', 'digest')
+
+    def __init__(self, path, mtime, identity, gzip_response=None,
+                 digest=None):
+        self.path = path
+        self.mtime = mtime
+        self.identity = identity
+        # The content hash the responses were built for
+        self.digest = digest
+        # None until it is known whether path has a compressed body worth
+        # sending, then False or the Response
+        self.gzip = gzip_response
+
+
+class RouteTable():
+    """Every URL the server answers, mapped to its prebuilt responses"""
+
+    def __init__(self, file_cache):
+        self.file_cache = file_cache
+        self.routes = dict()
+        self.not_found = Route(None, None, Response(
+            404, None, format_head(404, NOT_FOUND_HEADERS),
+            memoryview(NOT_FOUND_BODY), None), False)
+        self.server_error = Route(None, None, Response(
+            500, None, format_head(500, SERVER_ERROR_HEADERS),
+            memoryview(SERVER_ERROR_BODY), None), False)
+        for (path, digest, size, mtime) in file_cache.entries():
+            self.routes[path] = self._build_route(path, digest, size, mtime)
+        for path in [path for path in self.routes
+                     if path.endswith('/index.html')]:
+            directory = path[:-len('index.html')]
+            self.routes.setdefault(directory, self.routes[path])
+            if directory != '/':
+                location = urllib.parse.quote(directory)
+                self.routes.setdefault(directory[:-1], Route(
+                    None, None, Response(301, None, format_head(
+                        301, [('Location', location),
+                              ('Content-Length', '0')]), None, None), False))
+
+    def _build_route(self, path, digest, size, mtime_ns, gzip_size=None):
+        """Return the route for path; gzip_size is the size of its
+        compressed body, if known"""
+        mtime = mtime_ns // 1000000000
+        last_modified = email.utils.formatdate(mtime, usegmt=True)
+        content_type = (mimetypes.guess_type(path)[0] or
+                        'application/octet-stream')
+        headers = [('Content-type', content_type + '; charset=UTF-8')]
+        if content_type != 'text/html':
+            headers.append(('Expires', EXPIRES))
+        if path.startswith(IMMUTABLE_PREFIX):
+            headers.append(('Cache-Control', IMMUTABLE))
+
+        def response(etag, length, body, encoding_headers=()):
+            return Response(200, etag, format_head(200, headers + list(
+                encoding_headers) + [
+                    ('Content-Length', str(length)), ('ETag', etag),
+                    ('Last-Modified', last_modified),
+                    ('Vary', 'Accept-Encoding')]), body, format_head(
+                        304, [('ETag', etag),
+                              ('Last-Modified', last_modified)]))
+
+        etag = '"{}"'.format(digest)
+        gzip_etag = '"{}-gzip"'.format(digest)
+        gzip_headers = [('Content-Encoding', 'gzip')]
+        file_name = self.file_cache.get_file(path)
+        if file_name:
+            return Route(path, mtime, response(etag, size, file_name), False,
+                         digest)
+        pack = self.file_cache.pack
+        if pack:
+            entry = pack.index[path]
+            return Route(path, mtime, response(
+                etag, size, pack.get_body_by_entry(entry)), bool(
+                    entry['gzip']) and response(
+                        gzip_etag, entry['gzip'][1],
+                        pack.get_body_by_entry(entry, zipped=True),
+                        gzip_headers), digest)
+        # Compressed bodies (and so their sizes) are only known once they
+        # have been needed
+        return Route(path, mtime, response(etag, size, None), gzip_size and
+                     response(gzip_etag, gzip_size, None, gzip_headers),
+                     digest)
+
+    def lookup(self, url):
+        """Return the route for url"""
+        route = self.routes.get(url)
+        if route is None:
+            route = self.routes.get(urllib.parse.unquote(
+                url.split('?', 1)[0].split('#', 1)[0]), self.not_found)
+        return route
+
+    def respond(self, url, request_headers):
+        """Return the status, head and body of the response to a GET of
+        url, along with its route and whether the body is compressed"""
+        route = self.lookup(url)
+        try:
+            if route.path and self.file_cache.refresh(route.path):
+                self._rebuild(route)
+            response = route.identity
+            if (route.gzip is not False and
+                    'gzip' in request_headers.get('accept-encoding', '')):
+                if route.gzip is None:
+                    self._find_gzip(route)
+                response = route.gzip or response
+        except OSError as exception:
+            return self._error(exception)
+        zipped = response is route.gzip
+        if response.etag and (
+                'if-none-match' in request_headers or
+                'if-modified-since' in request_headers) and is_not_modified(
+                    request_headers, response.etag, route.mtime):
+            return (304, response.not_modified_head, None, route, zipped)
+        body = response.body
+        if body is None and route.path:
+            try:
+                body = self.file_cache.get_body(route.path, zipped)[0]
+            except OSError as exception:
+                return self._error(exception)
+            if self.file_cache.index[route.path][1] != route.digest:
+                # The file changed on disk since the route was built; the
+                # head must describe the body actually loaded
+                self._rebuild(route)
+                return self.respond(url, request_headers)
+        elif route.path and self.file_cache.pack:
+            # The body was mapped from the pack when the table was built, so
+            # the FileCache never sees the request
+            self.file_cache.hits += 1
+        return (response.status, response.head, body, route, zipped)
+
+    def _error(self, exception):
+        """Return the response to a request for a file that couldn't be
+        read"""
+        route = (self.not_found if isinstance(exception, FileNotFoundError)
+                 else self.server_error)
+        return (route.identity.status, route.identity.head,
+                route.identity.body, route, False)
+
+    def _rebuild(self, route):
+        """Rebuild route, in place (so every URL sharing it sees the
+        change), for the file as it now is"""
+        (_, digest, size, mtime) = self.file_cache.index[route.path]
+        rebuilt = self._build_route(route.path, digest, size, mtime)
+        (route.mtime, route.identity, route.gzip, route.digest) = (
+            rebuilt.mtime, rebuilt.identity, rebuilt.gzip, rebuilt.digest)
+
+    def _find_gzip(self, route):
+        """Find out whether route has a compressed body worth sending"""
+        (body, zipped) = self.file_cache.get_body(route.path, True)
+        if not zipped:
+            route.gzip = False
+            return
+        (_, digest, size, mtime) = self.file_cache.index[route.path]
+        route.gzip = self._build_route(route.path, digest, size, mtime,
+                                       len(body)).gzip
+
+
+class Generation():
+    """Everything a server answers requests from, built from a single build
+    of the site and swapped in with a single assignment (see reloader.py)"""
+
+    def __init__(self, root, cache_size=None, search_index=None):
+        if cache_size is None:
+            cache_size = FileCache.DEFAULT_MAX_SIZE
+        # root is usually a symbolic link to the current build; the build
+        # itself is served, so the generation's files stay the same when
+        # the next build is published
+        self.root = os.path.realpath(root)
+        # Keeps the build from being removed while it's served
+        self.serving_marker = staging.mark_serving(self.root)
+        self.file_cache = FileCache(self.root, max_size=cache_size)
+        self.routes = RouteTable(self.file_cache)
+        self.search_index = search_index
+
+    def release(self):
+        """Let the build be removed once nothing is served from it"""
+        staging.unmark_serving(self.serving_marker)
+        self.serving_marker = None
 
 
 class FileCacheRequestHandler(server.SimpleHTTPRequestHandler):
     """Request handler that serves cached versions of static files"""
 
-    server_version = 'Blug/1.0'
-    expire_time = datetime.datetime.now() + datetime.timedelta(days=365)
-    timestamp = time.time()
+    server_version = SERVER_VERSION
+    protocol_version = 'HTTP/1.1'
+    # Seconds a persistent connection may sit idle before it is closed
+    timeout = 15
+    # Requests served on a connection before it is closed, so that a single
+    # client can't hold on to a thread forever
+    max_requests = 100
+
+    def setup(self):
+        server.SimpleHTTPRequestHandler.setup(self)
+        self.requests_handled = 0
+        if self.server.stats:
+            self.server.stats.connection_opened()
+
+    def finish(self):
+        server.SimpleHTTPRequestHandler.finish(self)
+        if self.server.stats:
+            self.server.stats.connection_closed()
 
     def parse_request(self):
         """Parse a request (internal).
@@ -59,7 +361,8 @@ class FileCacheRequestHandler(server.SimpleHTTPRequestHandler):
         """
         self.command = None  # set in case of error on the first line
         self.request_version = version = self.default_request_version
-        self.close_connection = 1
+        self.close_connection = True
+        self.connection_header_sent = False
         requestline = str(self.raw_requestline, 'iso-8859-1')
         requestline = requestline.rstrip('\r\n')
         self.requestline = requestline
@@ -85,8 +388,32 @@ class FileCacheRequestHandler(server.SimpleHTTPRequestHandler):
         # Examine the headers and look for a Connection directive.
         self.headers = self.parse_headers(self.rfile)
 
+        # HTTP/1.1 connections persist unless the client says otherwise;
+        # HTTP/1.0 connections only if the client asks. Pipelined requests
+        # are simply read, and answered, in turn from the same buffer.
+        self.close_connection = not keep_alive(version, self.headers)
+        self.requests_handled += 1
+        if self.requests_handled >= self.max_requests:
+            self.close_connection = True
+
         return True
 
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'connection':
+            self.connection_header_sent = True
+        server.SimpleHTTPRequestHandler.send_header(self, keyword, value)
+
+    def end_headers(self):
+        """Tell the client whether the connection persists before ending the
+        headers"""
+        if (self.request_version != 'HTTP/0.9' and
+                not self.connection_header_sent):
+            if self.close_connection:
+                self.send_header('Connection', 'close')
+            elif self.request_version < 'HTTP/1.1':
+                self.send_header('Connection', 'keep-alive')
+        server.SimpleHTTPRequestHandler.end_headers(self)
+
     def parse_headers(self, header_file):
         headers = {}
         while True:
@@ -94,96 +421,265 @@ class FileCacheRequestHandler(server.SimpleHTTPRequestHandler):
             if line in (b'\r\n', b'\n', b''):
                 break
             key, _, value = line.decode('iso-8859-1').partition(':')
-            headers[key] = value.strip()
+            # Header names are case-insensitive
+            headers[key.strip().lower()] = value.strip()
         return headers
 
     def do_GET(self):
         """Return the cached buffer created during initialization"""
-        path = self.translate_path(self.path)
-
-        if os.path.isdir(path):
-            self.path = os.path.join(self.path, 'index.html')
-
-        self.path = self.path.split('?', 1)[0]
-        self.path = self.path.split('#', 1)[0]
-        cType = self.guess_type(self.path)
-        use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
-        file_buffer = self.server.file_cache.get_resource(self.path, zipped=use_gzip)
-        if not file_buffer:
-            self.send_error(404, "File not found")
-            return None
-
-        self.send_response(200)
-        self.send_header("Content-type", cType + '; charset=UTF-8')
-        if cType != 'text/html':
-            self.send_header('Expires', self.expire_time)
-        if use_gzip:
-            self.send_header('Content-Encoding', 'gzip')
-        self.send_header("Content-Length", len(file_buffer))
-        self.send_header("Last-Modified", self.date_time_string(self.timestamp))
-        self.end_headers()
+        self.send_route(include_body=True)
+
+    def do_HEAD(self):
+        self.send_route(include_body=False)
+
+    def send_route(self, include_body):
+        """Send the prebuilt response for the requested path"""
+        started = time.perf_counter()
+        stats = self.server.stats
+        generation = self.server.generation
+        response = dynamic_response(self.server, generation, self.path)
+        if response:
+            (status, head, body, path) = response
+            zipped = False
+        else:
+            (status, head, body, route, zipped) = generation.routes.respond(
+                self.path, self.headers)
+            path = route.path
+        head += date_header() + (CLOSE if self.close_connection else
+                                 KEEP_ALIVE)
+        size = 0
         try:
-            self.wfile.write(file_buffer)
-            file_buffer.release()
+            if body is None or not include_body:
+                self.wfile.write(head)
+            elif isinstance(body, str):
+                # A large file served straight from disk
+                self.wfile.write(head)
+                with open(body, 'rb') as input_file:
+                    size = self.connection.sendfile(input_file)
+            else:
+                send_buffers(self.connection, (head, body))
+                size = len(body)
         except IOError:
-            pass
+            self.close_connection = True
+        if stats:
+            stats.record(path, status, size, zipped,
+                         time.perf_counter() - started)
+        self.log_request(status, size)
 
     def log_request(self, code='-', size='-'):
-        logger.info('{} - {}'.format(self.address_string(), self.headers))
+        """Hand the request to the server's access log, if it has one"""
+        if self.server.access_log:
+            self.server.access_log.log(
+                self.client_address[0], self.command, self.path,
+                self.request_version, code, size if size != '-' else 0,
+                self.headers.get('referer'), self.headers.get('user-agent'))
 
 
 class BlugHttpServer(socketserver.ThreadingMixIn, server.HTTPServer):
     """An extension to http.server.HTTPServer utilizing the FileCacheRequestHandler"""
 
-    def __init__(self, root, *args, **kwargs):
-        self.file_cache = FileCache(root)
+    # Threads serving idle persistent connections mustn't keep the server
+    # from shutting down
+    daemon_threads = True
+
+    def __init__(self, root, *args, cache_size=None, access_log=None,
+                 stats=None, search_index=None, **kwargs):
+        self.generation = Generation(root, cache_size, search_index)
+        self.access_log = access_log
+        self.stats = stats
         server.HTTPServer.__init__(self, *args, **kwargs)
 
+    def listen_on(self, sock):
+        """Serve connections accepted on sock, an already listening socket,
+        rather than binding a socket of its own (see prefork.py)"""
+        self.socket.close()
+        self.socket = sock
+        self.server_address = sock.getsockname()[:2]
+
 
 class FileCache():
-    """An in-memory cache of static files"""
+    """A cache of static files, bounded to max_size bytes of memory, or served
+    from the site pack in directory if it has one"""
 
-    FILE_TYPES = ['.html', '.js', '.gif', '.css', '.png', '.jpg', '.xml']
+    FILE_TYPES = ['.html', '.js', '.gif', '.css', '.png', '.jpg', '.xml',
+                  '.json']
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+    # Bodies smaller than this gain nothing from compression
+    MINIMUM_GZIP_SIZE = sitepack.MINIMUM_GZIP_SIZE
 
-    def __init__(self, base, debug=0):
+    def __init__(self, base, debug=0, max_size=DEFAULT_MAX_SIZE):
         self.base = os.path.normpath(base)
-        self.cache = dict()
-        self.gzip_cache = dict()
+        self.max_size = max_size
+        # Files larger than this would push too much else out of the cache
+        self.max_entry_size = max_size // 8
+        self.index = dict()
+        self.cache = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
         self._debug = debug
-        self.build_cache(self.base)
-
-    def build_cache(self, base_dir, current_dir=None):
-        """Builds a cache of file contents recursively from the base_dir"""
-        if not current_dir:
-            current_dir = os.path.relpath(base_dir)
-        for name in os.listdir(current_dir):
-            name = os.path.join(current_dir, name)
-            if not os.path.splitext(name)[1] in self.FILE_TYPES:
-                if os.path.isdir(name):
-                    self.build_cache(base_dir, name)
-            else:
-                with open(name, 'rb') as input_file:
-                    data = bytes(input_file.read())
-                    self.cache[name[1:]] = data
-                    self.gzip_cache[name[1:]] = gzip.compress(data)
+        self.pack = sitepack.SitePack.open(self.base)
+        if not self.pack:
+            self.build_cache(self.base)
+
+    def build_cache(self, base_dir):
+        """Builds an index of the files below base_dir, reusing the hashes
+        in the build's file manifest where it has one"""
+        # base_dir is usually a symbolic link to the current build, so paths
+        # are made relative to it rather than to the working directory
+        file_manifest = deploy.build_file_manifest(
+            base_dir, deploy.read_file_manifest(base_dir))
+        for relative_path, entry in file_manifest.items():
+            if os.path.splitext(relative_path)[1] in self.FILE_TYPES:
+                self.index[deploy.url_path(relative_path)] = (
+                    relative_path, entry['hash'], entry['size'],
+                    entry['mtime'])
+
+    def entries(self):
+        """Yield the path, content hash, size and modification time (in
+        nanoseconds) of every file in the cache"""
+        if self.pack:
+            for path, entry in self.pack.index.items():
+                yield (path, entry['hash'], entry['size'], entry['mtime'])
+        else:
+            for path, (_, digest, size, mtime) in self.index.items():
+                yield (path, digest, size, mtime)
+
+    def _load(self, relative_path):
+        """Return the raw and compressed bodies of a file"""
+        with open(os.path.join(self.base, relative_path), 'rb') as input_file:
+            raw = input_file.read()
+        zipped = None
+        if len(raw) >= self.MINIMUM_GZIP_SIZE:
+            zipped = gzip.compress(raw)
+            if len(zipped) >= len(raw):
+                zipped = None
+        return (raw, zipped)
+
+    def refresh(self, path):
+        """Bring the index entry of path, a file sent from disk, up to date with
+        the file, returning True if it changed"""
+        if self.pack or path not in self.index:
+            return False
+        (relative_path, _, size, mtime) = self.index[path]
+        if size <= self.max_entry_size:
+            return False
+        full_path = os.path.join(self.base, relative_path)
+        file_stat = os.stat(full_path)
+        if (file_stat.st_size, file_stat.st_mtime_ns) == (size, mtime):
+            return False
+        self.index[path] = (relative_path, deploy.hash_file(full_path),
+                            file_stat.st_size, file_stat.st_mtime_ns)
+        return True
+
+    def get_file(self, path):
+        """Return the name of the file path is served from if it is too
+        large to be cached, and so should be sent straight from disk, or
+        None"""
+        if self.pack:
+            # Files too large to be packed are left on disk
+            entry = self.pack.index.get(path)
+            if entry and not entry['raw']:
+                return os.path.join(self.base, *path.split('/'))
+            return None
+        if path not in self.index:
+            return None
+        (relative_path, _, size, _) = self.index[path]
+        if size > self.max_entry_size:
+            return os.path.join(self.base, relative_path)
+        return None
+
+    def get_body(self, path, accept_gzip=False):
+        """Return a memoryview of the body of path (compressed, if accepted
+        and worthwhile) and whether it is compressed, or (None, False) if
+        path isn't cached"""
+        if self.pack:
+            entry = self.pack.index.get(path)
+            if not entry:
+                return (None, False)
+            if not entry['raw']:
+                # Too large to be packed; see get_file()
+                self.misses += 1
+                with open(self.get_file(path), 'rb') as input_file:
+                    return (memoryview(input_file.read()), False)
+            zipped = bool(accept_gzip and entry['gzip'])
+            self.hits += 1
+            return (self.pack.get_body_by_entry(entry, zipped), zipped)
+
+        if path not in self.index:
+            return (None, False)
+        (relative_path, digest, size, _) = self.index[path]
+        if size > self.max_entry_size:
+            # Too large to cache; see get_file()
+            self.misses += 1
+            (raw, zipped) = self._load(relative_path)
+            return (memoryview(raw), False)
+        with self._lock:
+            bodies = self.cache.get(digest)
+            if bodies:
+                self.cache.move_to_end(digest)
+                self.hits += 1
+        if not bodies:
+            bodies = self._load(relative_path)
+            loaded_digest = manifest.hash_bytes(bodies[0])
+            if loaded_digest != digest:
+                # Changed since it was indexed; index what was loaded
+                self.index[path] = (relative_path, loaded_digest,
+                                    len(bodies[0]), os.stat(os.path.join(
+                                        self.base, relative_path)).st_mtime_ns)
+                digest = loaded_digest
+            self._add(digest, bodies)
+        (raw, zipped) = bodies
+        if accept_gzip and zipped:
+            return (memoryview(zipped), True)
+        return (memoryview(raw), False)
+
+    def _add(self, digest, bodies):
+        """Cache the bodies of a file, evicting the least recently used
+        files to make room"""
+        size = sum(len(body) for body in bodies if body)
+        with self._lock:
+            self.misses += 1
+            if digest in self.cache:
+                return
+            self.cache[digest] = bodies
+            self.size += size
+            while self.size > self.max_size:
+                (_, evicted) = self.cache.popitem(last=False)
+                self.size -= sum(len(body) for body in evicted if body)
+                self.evictions += 1
 
     def get_resource(self, path, zipped=False):
         """Returns the cached version of the file"""
-        if zipped and path in self.gzip_cache:
-            return memoryview(self.gzip_cache[path])
-        if path in self.cache:
-            return memoryview(self.cache[path])
-        return None
+        return self.get_body(path, zipped)[0]
 
     def _get_cache_stats(self):
         """Returns statistics of the current cache"""
         stat_list = list()
-        for filename, file_buffer in self.cache.items():
+        if self.pack:
+            sizes = ((filename, entry['size'])
+                     for (filename, entry) in self.pack.index.items())
+        else:
+            sizes = ((filename, size)
+                     for (filename, (_, _, size, _)) in self.index.items())
+        for filename, size in sizes:
             path, name = os.path.split(filename)
             stat_list.append(('{name}: {size} B ({path}'.format(
                 name=name,
                 path=path,
-                size=len(self.cache[filename]))))
+                size=size)))
+        if self.pack:
+            stat_list.append('{} files mapped from {}'.format(
+                len(self.pack.index), self.pack.path))
+        else:
+            stat_list.append('{entries} files cached: {size} of {max_size} B'
+                             .format(entries=len(self.cache), size=self.size,
+                                     max_size=self.max_size))
+        stat_list.append('{hits} hits, {misses} misses, {evictions} evictions'
+                         .format(hits=self.hits, misses=self.misses,
+                                 evictions=self.evictions))
         return stat_list
 
     def __str__(self):
@@ -0,0 +1,315 @@
+"""Conversion of Markdown posts to HTML, optionally spread over a pool of
+worker processes"""
+
+import re
+import time
+import datetime
+import concurrent.futures
+
+import markdown
+import pygments
+from markdown.extensions import codehilite
+from markdown.extensions import meta as markdown_meta
+
+import manifest
+
+MARKDOWN_EXTENSIONS = [
+    'fenced_code',
+    'codehilite',
+    'tables',
+    'footnotes',
+    'meta',
+]
+
+# Part of every cache key; bump it whenever a change to this module changes
+# what it makes of a post
+CACHE_VERSION = 1
+
+# Definitions of reference-style links, footnotes and abbreviations, which
+# may be used anywhere in a post
+DEFINITION_RE = re.compile(r'^ {0,3}\*?\[[^\]]+\]:', re.MULTILINE)
+
+# Each process (the main one or a pool worker) keeps a single configured
+# converter, since creating one and loading its extensions is not free
+_markdown_generator = None
+# Where highlighted code blocks are cached, if anywhere
+_highlight_cache = None
+
+
+def set_highlight_cache(cache):
+    """Cache the highlighting of code blocks in cache (a DiskCache), or
+    stop caching it if cache is None"""
+    global _highlight_cache
+    _highlight_cache = cache
+
+
+def highlight(code, lexer, formatter, outfile=None):
+    """pygments.highlight(), memoized in the highlight cache"""
+    if _highlight_cache is None or outfile is not None:
+        return pygments.highlight(code, lexer, formatter, outfile)
+    key = manifest.hash_bytes(repr((
+        pygments.__version__, type(lexer).__module__, type(lexer).__name__,
+        sorted(lexer.options.items()), type(formatter).__module__,
+        type(formatter).__name__, sorted(formatter.options.items()),
+        code)).encode('utf-8'))
+    highlighted = _highlight_cache.get(key)
+    if highlighted is None:
+        highlighted = pygments.highlight(code, lexer, formatter)
+        _highlight_cache.set(key, highlighted)
+    return highlighted
+
+
+def get_markdown_generator():
+    """Return this process's Markdown converter, ready for a new document"""
+    global _markdown_generator
+    if _markdown_generator is None:
+        # codehilite highlights every code block (fenced or indented) by
+        # calling the highlight() it imported from Pygments
+        codehilite.highlight = highlight
+        _markdown_generator = markdown.Markdown(
+            extensions=MARKDOWN_EXTENSIONS)
+    _markdown_generator.reset()
+    return _markdown_generator
+
+
+def post_metadata(meta):
+    """Return the title, categories and date of a post given the metadata
+    read from its header, in the form the meta extension provides"""
+    post = dict()
+    post['title'] = meta['title'][0]
+    post['categories'] = meta['categories'][0].split()
+
+    # Construct datetime from the *incredibly useful* string YAML
+    # provides
+    post['date'] = datetime.datetime.strptime(
+        (meta['date'][0].strip()), '%Y-%m-%d %H:%M')
+    return post
+
+
+def read_front_matter(post_file_buffer):
+    """Return the metadata at the top of post_file_buffer without converting
+    anything, following the same rules as the meta extension"""
+    meta = dict()
+    key = None
+    lines = post_file_buffer.split('\n')
+    if lines and markdown_meta.BEGIN_RE.match(lines[0]):
+        lines.pop(0)
+    for line in lines:
+        if line.strip() == '' or markdown_meta.END_RE.match(line):
+            break
+        key_match = markdown_meta.META_RE.match(line)
+        if key_match:
+            key = key_match.group('key').lower().strip()
+            meta.setdefault(key, list()).append(
+                key_match.group('value').strip())
+            continue
+        more_match = markdown_meta.META_MORE_RE.match(line)
+        if not (more_match and key):
+            break
+        meta[key].append(more_match.group('value').strip())
+    return meta
+
+
+def convert_post(post_file_buffer):
+    """Return a dictionary of the HTML and metadata for the Markdown in
+    post_file_buffer"""
+    # Generate HTML from Markdown, splitting between the teaser (the
+    # content to display on the front page until <!--more--> is reached)
+    # and the post proper
+    mardown_generator = get_markdown_generator()
+    generated_html = mardown_generator.convert(post_file_buffer)
+    post = post_metadata(mardown_generator.Meta)
+    post['body'] = generated_html
+    (post['teaser'], _, _) = generated_html.partition('<!--more-->')
+    return post
+
+
+def convert_teaser(post_file_buffer):
+    """Return the HTML for the part of post_file_buffer before <!--more-->,
+    converting only that part where possible"""
+    (teaser, separator, rest) = post_file_buffer.partition('<!--more-->')
+    # The teaser may use links, footnotes or abbreviations defined after
+    # <!--more-->, and footnotes are placed at the end of the whole post; a
+    # teaser that might depend on either has to come from the full
+    # conversion
+    if separator and '[^' not in teaser and not DEFINITION_RE.search(rest):
+        # The newline matches what precedes <!--more--> in the full
+        # conversion
+        return get_markdown_generator().convert(teaser) + '\n'
+    return convert_post(post_file_buffer)['teaser']
+
+
+def cache_key(post_file_buffer):
+    """Return the parse cache key for post_file_buffer, which covers
+    everything that affects its conversion"""
+    return manifest.hash_bytes('\0'.join(
+        [post_file_buffer, ','.join(MARKDOWN_EXTENSIONS), str(CACHE_VERSION),
+         markdown.__version__, pygments.__version__]).encode('ascii'))
+
+
+def read_post_file(post_file_path):
+    """Return the contents of the post at post_file_path"""
+    try:
+        with open(post_file_path, encoding='ascii') as post_file:
+            return post_file.read()
+    except (IOError, UnicodeDecodeError) as exception:
+        raise EnvironmentError('Unable to read post [{post}]: {error}'.format(
+            post=post_file_path, error=repr(exception)))
+
+
+def convert_post_file(post_file_path):
+    """Return the body and teaser HTML of the post at post_file_path"""
+    post_file_buffer = read_post_file(post_file_path)
+    try:
+        post = convert_post(post_file_buffer)
+    except Exception as exception:
+        raise EnvironmentError('Unable to convert post [{post}]: {error}'.format(
+            post=post_file_path, error=repr(exception)))
+    if not post['body']:
+        raise EnvironmentError('No content for post [{post}] found.'.format(
+            post=post_file_path))
+    return {'body': post['body'], 'teaser': post['teaser']}
+
+
+def convert_teaser_file(post_file_path):
+    """Return the teaser HTML of the post at post_file_path"""
+    post_file_buffer = read_post_file(post_file_path)
+    try:
+        return convert_teaser(post_file_buffer)
+    except Exception as exception:
+        raise EnvironmentError('Unable to convert post [{post}]: {error}'.format(
+            post=post_file_path, error=repr(exception)))
+
+
+def convert_post_file_timed(post_file_path):
+    """Return the result of convert_post_file() and how long it took"""
+    started = time.perf_counter()
+    converted = convert_post_file(post_file_path)
+    return (converted, time.perf_counter() - started)
+
+
+def summary_cache_key(source_cache_key):
+    """Return the cache key for the metadata and teaser of the post whose
+    cache key is source_cache_key"""
+    return manifest.hash_bytes((source_cache_key + ':summary').encode('ascii'))
+
+
+class Post(dict):
+    """A post whose metadata is read up front but whose body and teaser are
+    only converted the first time they're used"""
+
+    def __init__(self, source_path, source_cache_key, cache=None, **kwargs):
+        dict.__init__(self, **kwargs)
+        self.source_path = source_path
+        self.cache_key = source_cache_key
+        self.cache = cache
+        self.metadata = kwargs
+
+    def _save_summary(self):
+        """Cache the metadata and teaser, which is all that pages listing
+        the post need; the body is cached on its own, so those pages don't
+        have to read it"""
+        if self.cache:
+            self.cache.set(summary_cache_key(self.cache_key), {
+                'metadata': self.metadata, 'teaser': self['teaser']})
+
+    def load_body(self, converted=None):
+        """Convert (or use the already converted) body and teaser. A teaser
+        already loaded is kept, so it's the same wherever it's used."""
+        if converted is None and self.cache:
+            converted = self.cache.get(self.cache_key)
+        if converted is None:
+            converted = convert_post_file(self.source_path)
+            if self.cache:
+                self.cache.set(self.cache_key, converted)
+        self['body'] = converted['body']
+        if 'teaser' not in self:
+            self['teaser'] = converted['teaser']
+            self._save_summary()
+
+    def load_teaser(self):
+        """Convert only the teaser, unless the whole post already has
+        been"""
+        converted = self.cache.get(self.cache_key) if self.cache else None
+        if converted is not None:
+            self['teaser'] = converted['teaser']
+        else:
+            self['teaser'] = convert_teaser_file(self.source_path)
+        self._save_summary()
+
+    def __missing__(self, key):
+        if key == 'body':
+            self.load_body()
+        elif key == 'teaser':
+            self.load_teaser()
+        else:
+            raise KeyError(key)
+        return self[key]
+
+
+def load_post(post_file_path, cache=None):
+    """Return a Post for the file at post_file_path, reading only its
+    metadata (and, if it's cached, its teaser)"""
+    post_file_buffer = read_post_file(post_file_path)
+    source_cache_key = cache_key(post_file_buffer)
+    summary = cache.get(summary_cache_key(source_cache_key)) if cache else None
+    if summary is None:
+        try:
+            summary = {'metadata': post_metadata(
+                read_front_matter(post_file_buffer))}
+        except Exception as exception:
+            raise EnvironmentError(
+                'Unable to read post [{post}]: {error}'.format(
+                    post=post_file_path, error=repr(exception)))
+        if cache:
+            cache.set(summary_cache_key(source_cache_key), summary)
+    post = Post(post_file_path, source_cache_key, cache,
+                **summary['metadata'])
+    if 'teaser' in summary:
+        post['teaser'] = summary['teaser']
+    post['source_hash'] = manifest.hash_bytes(post_file_buffer.encode('ascii'))
+    return post
+
+
+def load_bodies(posts, jobs=1, profile=None):
+    """Convert the bodies of every post in posts that hasn't been converted
+    yet, using up to jobs worker processes for those not already cached. The
+    time taken by each conversion is recorded in profile, if given."""
+    pending = list()
+    for post in posts:
+        if 'body' in post:
+            continue
+        converted = post.cache.get(post.cache_key) if post.cache else None
+        if converted is not None:
+            post.load_body(converted)
+        else:
+            pending.append(post)
+
+    if jobs <= 1 or len(pending) <= 1:
+        for post in pending:
+            if profile:
+                (converted, seconds) = convert_post_file_timed(
+                    post.source_path)
+                profile.record_post(post.source_path, seconds)
+                if post.cache:
+                    post.cache.set(post.cache_key, converted)
+                post.load_body(converted)
+            else:
+                post.load_body()
+        return len(pending)
+
+    chunk_size = max(1, len(pending) // (jobs * 4))
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=set_highlight_cache,
+            initargs=(_highlight_cache,)) as executor:
+        for (post, converted) in zip(pending, executor.map(
+                convert_post_file_timed if profile else convert_post_file,
+                [post.source_path for post in pending],
+                chunksize=chunk_size)):
+            if profile:
+                (converted, seconds) = converted
+                profile.record_post(post.source_path, seconds)
+            if post.cache:
+                post.cache.set(post.cache_key, converted)
+            post.load_body(converted)
+    return len(pending)
@@ -0,0 +1,294 @@
+"""Deploying only the files that changed since the last deploy, and the file
+helpers the rest of Blug shares. Depends only on the standard library, so it
+can be copied to and run on the host being deployed to."""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import datetime
+import tempfile
+
+FILE_MANIFEST_NAME = '.blug-files.json'
+DELETED_FILES_NAME = 'deleted.json'
+BUNDLE_FILES_DIR = 'files'
+
+# Bytes read at a time when hashing a file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Files Blug keeps in the output directory for its own use, which aren't
+# part of the site
+PRIVATE_PREFIX = '.blug-'
+
+# The number of releases (including the current one) to keep at a deploy
+# destination, so that requests being served from the previous release can
+# finish
+KEEP_RELEASES = 2
+
+
+def hash_bytes(data):
+    """Return the hex digest used for file contents throughout Blug"""
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_file(path):
+    """Return the hex digest of the contents of the file at path"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def url_path(relative_path):
+    """Return the URL path of a file, given its path relative to the site"""
+    return '/' + relative_path.replace(os.sep, '/')
+
+
+def link_tree(source_dir, destination_dir):
+    """Recreate the tree at source_dir at destination_dir using hard links,
+    falling back to copying if they're on different filesystems"""
+    # Linked files are shared with source_dir, so anything later written to
+    # destination_dir must replace files rather than overwrite them
+    for directory, _, file_names in os.walk(source_dir):
+        target_dir = os.path.join(destination_dir,
+                                  os.path.relpath(directory, source_dir))
+        os.makedirs(target_dir, exist_ok=True)
+        for file_name in file_names:
+            source_path = os.path.join(directory, file_name)
+            target_path = os.path.join(target_dir, file_name)
+            try:
+                os.link(source_path, target_path)
+            except OSError:
+                shutil.copy2(source_path, target_path)
+
+
+def read_manifest_file(path):
+    """Return the file manifest stored at path, or None"""
+    try:
+        with open(path) as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, ValueError):
+        return None
+
+
+def read_file_manifest(directory):
+    """Return the file manifest stored in directory, or None"""
+    return read_manifest_file(os.path.join(directory, FILE_MANIFEST_NAME))
+
+
+def build_file_manifest(directory, previous=None):
+    """Return a dictionary mapping the path (relative to directory) of every
+    file in directory to its hash, size and modification time, reusing the
+    hashes in previous for files that haven't changed"""
+    previous = previous or dict()
+    file_manifest = dict()
+    for current_dir, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            path = os.path.join(current_dir, file_name)
+            relative_path = os.path.relpath(path, directory)
+            if relative_path.startswith(PRIVATE_PREFIX):
+                continue
+            file_stat = os.stat(path)
+            entry = previous.get(relative_path)
+            if not (entry and entry['size'] == file_stat.st_size and
+                    entry['mtime'] == file_stat.st_mtime_ns):
+                entry = {'hash': hash_file(path), 'size': file_stat.st_size,
+                         'mtime': file_stat.st_mtime_ns}
+            file_manifest[relative_path] = entry
+    return file_manifest
+
+
+def write_file_manifest(directory, file_manifest):
+    """Store file_manifest in directory"""
+    write_manifest_file(os.path.join(directory, FILE_MANIFEST_NAME),
+                        file_manifest)
+
+
+def write_manifest_file(path, file_manifest):
+    """Store file_manifest at path"""
+    # The manifest may be a hard link shared with another build (or, at a
+    # deploy destination, be read concurrently); replace rather than
+    # overwrite it
+    temporary_path = path + '.new'
+    with open(temporary_path, 'w') as manifest_file:
+        json.dump(file_manifest, manifest_file, indent=0, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def update_file_manifest(directory):
+    """Bring the file manifest stored in directory up to date and return
+    it"""
+    file_manifest = build_file_manifest(directory,
+                                        read_file_manifest(directory))
+    write_file_manifest(directory, file_manifest)
+    return file_manifest
+
+
+def plan_deploy(local_manifest, remote_manifest):
+    """Return the (sorted) paths that must be copied and the paths that must
+    be deleted to turn remote_manifest into local_manifest"""
+    changed = sorted(
+        path for (path, entry) in local_manifest.items()
+        if remote_manifest.get(path, {}).get('hash') != entry['hash'])
+    deleted = sorted(path for path in remote_manifest
+                     if path not in local_manifest)
+    return (changed, deleted)
+
+
+def create_bundle(source_dir, remote_manifest, bundle_dir):
+    """Write the files in source_dir that differ from remote_manifest, the
+    list of files to delete and source_dir's manifest to bundle_dir. Return
+    the paths changed and deleted."""
+    local_manifest = read_file_manifest(source_dir)
+    if local_manifest is None:
+        local_manifest = build_file_manifest(source_dir)
+    (changed, deleted) = plan_deploy(local_manifest, remote_manifest or {})
+
+    for path in changed:
+        bundle_path = os.path.join(bundle_dir, BUNDLE_FILES_DIR, path)
+        os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
+        shutil.copy2(os.path.join(source_dir, path), bundle_path)
+    with open(os.path.join(bundle_dir, DELETED_FILES_NAME), 'w') as deleted_file:
+        json.dump(deleted, deleted_file)
+    write_file_manifest(bundle_dir, local_manifest)
+    return (changed, deleted)
+
+
+def get_releases_dir(destination_dir):
+    """Return the directory releases deployed to destination_dir are kept
+    in"""
+    return os.path.normpath(destination_dir) + '.releases'
+
+
+def get_deployed_manifest_path(destination_dir):
+    """Return where the manifest of what was deployed to destination_dir is
+    kept; it lives beside the document root rather than in it"""
+    return os.path.normpath(destination_dir) + '.files.json'
+
+
+def publish_release(destination_dir, release_dir):
+    """Atomically make release_dir the contents of destination_dir"""
+    releases_dir = get_releases_dir(destination_dir)
+    if os.path.isdir(destination_dir) and not os.path.islink(destination_dir):
+        # A destination deployed to before releases existed; move it aside so
+        # the symbolic link can take its place
+        os.rename(destination_dir, os.path.join(releases_dir, '0-unstaged'))
+
+    temporary_link = os.path.normpath(destination_dir) + '.new'
+    if os.path.lexists(temporary_link):
+        os.unlink(temporary_link)
+    os.symlink(os.path.relpath(release_dir, os.path.dirname(
+        os.path.abspath(destination_dir))), temporary_link)
+    os.replace(temporary_link, destination_dir)
+
+
+def remove_old_releases(destination_dir, keep=KEEP_RELEASES):
+    """Remove all but the newest keep releases, never removing the current
+    one"""
+    releases_dir = get_releases_dir(destination_dir)
+    current_release = os.path.realpath(destination_dir)
+    for release in sorted(os.listdir(releases_dir), reverse=True)[keep:]:
+        release_dir = os.path.join(releases_dir, release)
+        if os.path.realpath(release_dir) != current_release:
+            shutil.rmtree(release_dir, ignore_errors=True)
+
+
+def apply_bundle(bundle_dir, destination_dir):
+    """Apply a bundle created by create_bundle() to destination_dir"""
+    files_dir = os.path.join(bundle_dir, BUNDLE_FILES_DIR)
+    with open(os.path.join(bundle_dir, DELETED_FILES_NAME)) as deleted_file:
+        deleted = json.load(deleted_file)
+
+    release_dir = os.path.join(
+        get_releases_dir(destination_dir),
+        datetime.datetime.now().strftime('%Y%m%d%H%M%S%f'))
+    if os.path.isdir(destination_dir):
+        link_tree(os.path.realpath(destination_dir), release_dir)
+    else:
+        os.makedirs(release_dir)
+    try:
+        # Deploys made before the manifest moved out of the document root
+        # left it in the site
+        legacy_manifest = os.path.join(release_dir, FILE_MANIFEST_NAME)
+        if os.path.exists(legacy_manifest):
+            os.unlink(legacy_manifest)
+
+        changed = list()
+        if os.path.isdir(files_dir):
+            for current_dir, _, file_names in os.walk(files_dir):
+                for file_name in file_names:
+                    path = os.path.relpath(
+                        os.path.join(current_dir, file_name), files_dir)
+                    release_path = os.path.join(release_dir, path)
+                    os.makedirs(os.path.dirname(release_path), exist_ok=True)
+                    if os.path.exists(release_path):
+                        os.unlink(release_path)
+                    shutil.copy2(os.path.join(files_dir, path), release_path)
+                    changed.append(path)
+
+        for path in deleted:
+            release_path = os.path.join(release_dir, path)
+            if os.path.exists(release_path):
+                os.unlink(release_path)
+            directory = os.path.dirname(release_path)
+            while os.path.normpath(directory) != os.path.normpath(release_dir):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+    except BaseException:
+        shutil.rmtree(release_dir, ignore_errors=True)
+        raise
+
+    publish_release(destination_dir, release_dir)
+    write_manifest_file(get_deployed_manifest_path(destination_dir),
+                        read_file_manifest(bundle_dir))
+    remove_old_releases(destination_dir)
+    return (sorted(changed), deleted)
+
+
+def get_remote_manifest(destination_dir):
+    """Return the manifest of what was deployed to destination_dir. A
+    destination deployed to before manifests existed is hashed instead."""
+    remote_manifest = read_manifest_file(
+        get_deployed_manifest_path(destination_dir))
+    if remote_manifest is None:
+        remote_manifest = read_file_manifest(destination_dir)
+    if remote_manifest is None and os.path.isdir(destination_dir):
+        remote_manifest = build_file_manifest(destination_dir)
+    return remote_manifest or dict()
+
+
+def deploy_to_directory(source_dir, destination_dir):
+    """Deploy the changes between source_dir and what was previously deployed
+    to destination_dir, a directory on this machine; return the paths changed
+    and deleted"""
+    bundle_dir = tempfile.mkdtemp()
+    try:
+        create_bundle(source_dir, get_remote_manifest(destination_dir),
+                      bundle_dir)
+        return apply_bundle(bundle_dir, destination_dir)
+    finally:
+        shutil.rmtree(bundle_dir, ignore_errors=True)
+
+
+def main():
+    """Report the deployed manifest of, or apply a bundle to, a directory on
+    the host being deployed to"""
+    if len(sys.argv) == 3 and sys.argv[1] == 'manifest':
+        json.dump(get_remote_manifest(sys.argv[2]), sys.stdout)
+    elif len(sys.argv) == 4 and sys.argv[1] == 'apply':
+        (changed, deleted) = apply_bundle(sys.argv[2], sys.argv[3])
+        print ('{changed} files updated, {deleted} deleted'.format(
+            changed=len(changed), deleted=len(deleted)))
+    else:
+        sys.exit('usage: {program} manifest <destination_dir>\n'
+                 '       {program} apply <bundle_dir> <destination_dir>'.format(
+                     program=sys.argv[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""A persistent, size-capped cache of values on disk"""
+
+import os
+import pickle
+import tempfile
+
+DEFAULT_CACHE_DIR = '.blug-cache'
+DEFAULT_CACHE_SIZE_MB = 100
+
+
+class DiskCache():
+    """A store of pickled values keyed by hex digests, evicting the least
+    recently used entries beyond max_size bytes"""
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        """Return the path of the file holding the entry for key"""
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        """Return the value stored for key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as entry_file:
+                value = pickle.load(entry_file)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store value for key"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial
+        # entry
+        (handle, temporary_path) = tempfile.mkstemp(
+            dir=os.path.dirname(path))
+        with os.fdopen(handle, 'wb') as entry_file:
+            pickle.dump(value, entry_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    def _entries(self):
+        """Return (modification time, size, path) for every entry"""
+        entries = list()
+        if not os.path.exists(self.directory):
+            return entries
+        for directory, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                try:
+                    entry_stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((entry_stat.st_mtime, entry_stat.st_size,
+                                path))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is no
+        larger than max_size; return the number of entries removed"""
+        entries = self._entries()
+        size = sum(entry[1] for entry in entries)
+        evicted = 0
+        for (_, entry_size, path) in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            size -= entry_size
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        """Remove every entry; return the number of entries removed"""
+        entries = self._entries()
+        for (_, _, path) in entries:
+            os.unlink(path)
+        return len(entries)
+
+    def stats(self):
+        """Return a dictionary describing the contents of the cache"""
+        entries = self._entries()
+        return {
+            'directory': self.directory,
+            'entries': len(entries),
+            'size': sum(entry[1] for entry in entries),
+            'max_size': self.max_size,
+        }
+
+    def __str__(self):
+        return ('{directory}: {entries} entries, {size} B '
+                '(max {max_size} B)').format(**self.stats())
+
+
+def get_cache(site_config, name):
+    """Return the DiskCache called name configured by site_config"""
+    cache_size = site_config.get('cache_size_mb') or DEFAULT_CACHE_SIZE_MB
+    return DiskCache(
+        os.path.join(site_config.get('cache_dir') or DEFAULT_CACHE_DIR, name),
+        cache_size * 1024 * 1024)
@@ -0,0 +1,281 @@
+#! /usr/bin/env python
+"""A load test of the Blug server, and of the standard library's server for
+comparison, needing nothing but Python"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+
+import deploy
+import blug_server
+
+BLUG_DIR = os.path.dirname(os.path.abspath(__file__))
+# Run as 'python -c <script> <root> <port>' in BLUG_DIR
+SERVER_SCRIPTS = {
+    'blug': '''
+import sys
+import blug_server
+blug_server.BlugHttpServer(
+    sys.argv[1], ('localhost', int(sys.argv[2])),
+    blug_server.FileCacheRequestHandler).serve_forever()
+''',
+    'asyncio': '''
+import sys
+import async_server
+async_server.AsyncBlugServer(
+    sys.argv[1], ('localhost', int(sys.argv[2]))).serve_forever()
+''',
+    # What 'blug.py serve --simple' runs
+    'simple': '''
+import os
+import sys
+import http.server
+os.chdir(sys.argv[1])
+handler = http.server.SimpleHTTPRequestHandler
+handler.protocol_version = "HTTP/1.0"
+handler.log_message = lambda *args: None
+http.server.HTTPServer(('localhost', int(sys.argv[2])),
+                       handler).serve_forever()
+''',
+}
+DEFAULT_SERVERS = ['blug', 'simple']
+PERCENTILES = (50, 99, 99.9)
+STARTUP_TIMEOUT = 60
+
+
+def get_urls(root):
+    """Return the URL of every file the Blug server would serve from root"""
+    urls = list()
+    for directory, directory_names, file_names in os.walk(root):
+        directory_names[:] = [name for name in directory_names
+                              if not name.startswith('.')]
+        for file_name in file_names:
+            if (file_name.startswith(deploy.PRIVATE_PREFIX) or
+                    os.path.splitext(file_name)[1] not in
+                    blug_server.FileCache.FILE_TYPES):
+                continue
+            url = deploy.url_path(os.path.relpath(
+                os.path.join(directory, file_name), root))
+            if file_name == 'index.html':
+                url = url[:-len('index.html')]
+            urls.append(url)
+    return sorted(urls)
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name, root, port):
+    """Start the server called name, serving root on port, and return the
+    process and how long it took to answer its first request"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVER_SCRIPTS[name], root, str(port)],
+        cwd=BLUG_DIR)
+    while True:
+        try:
+            connection = http.client.HTTPConnection('localhost', port,
+                                                    timeout=1)
+            connection.request('HEAD', '/')
+            connection.getresponse().read()
+            connection.close()
+            return (process, time.perf_counter() - started)
+        except OSError:
+            if (process.poll() is not None or
+                    time.perf_counter() - started > STARTUP_TIMEOUT):
+                process.kill()
+                process.wait()
+                raise EnvironmentError(
+                    'The [{}] server failed to start'.format(name))
+            time.sleep(0.01)
+
+
+def stop_server(process):
+    """Stop the server and return its resource usage"""
+    process.terminate()
+    (_, _, usage) = os.wait4(process.pid, 0)
+    # Keep Popen from waiting for the process a second time
+    process.returncode = 0
+    return usage
+
+
+class Client(threading.Thread):
+    """Requests random URLs from a server until told to stop, recording the
+    latency of each request"""
+
+    def __init__(self, port, urls, keep_alive, gzip_fraction, stop, seed):
+        super().__init__(daemon=True)
+        self.port = port
+        self.urls = urls
+        self.keep_alive = keep_alive
+        self.gzip_fraction = gzip_fraction
+        self.stop = stop
+        self.random = random.Random(seed)
+        self.latencies = list()
+        self.statuses = dict()
+        self.errors = 0
+        self.bytes = 0
+
+    def run(self):
+        connection = None
+        while not self.stop.is_set():
+            headers = dict()
+            if self.random.random() < self.gzip_fraction:
+                headers['Accept-Encoding'] = 'gzip'
+            if not self.keep_alive:
+                headers['Connection'] = 'close'
+            url = self.random.choice(self.urls)
+            started = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(
+                        'localhost', self.port, timeout=30)
+                connection.request('GET', url, headers=headers)
+                response = connection.getresponse()
+                self.bytes += len(response.read())
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                if connection:
+                    connection.close()
+                connection = None
+                continue
+            self.latencies.append(time.perf_counter() - started)
+            self.statuses[response.status] = (
+                self.statuses.get(response.status, 0) + 1)
+            if not self.keep_alive or response.will_close:
+                connection.close()
+                connection = None
+        if connection:
+            connection.close()
+
+
+def percentile(ordered, percent):
+    """Return the value percent of the way through ordered, a sorted list"""
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def load_test(name, root, urls, concurrency=16, duration=10, keep_alive=True,
+              gzip_fraction=0.5, seed=0):
+    """Start the server called name, load it for duration seconds and
+    return what was measured"""
+    port = get_free_port()
+    (process, startup_time) = start_server(name, root, port)
+    try:
+        stop = threading.Event()
+        clients = [Client(port, urls, keep_alive, gzip_fraction, stop,
+                          seed + index) for index in range(concurrency)]
+        started = time.perf_counter()
+        for client in clients:
+            client.start()
+        time.sleep(duration)
+        stop.set()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        usage = stop_server(process)
+
+    latencies = sorted(latency for client in clients
+                       for latency in client.latencies)
+    statuses = dict()
+    for client in clients:
+        for status, count in client.statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        'server': name,
+        'concurrency': concurrency,
+        'keep_alive': keep_alive,
+        'gzip_fraction': gzip_fraction,
+        'requests': len(latencies),
+        'errors': sum(client.errors for client in clients),
+        'statuses': statuses,
+        'bytes': sum(client.bytes for client in clients),
+        'requests_per_second': len(latencies) / elapsed,
+        'latency': {'p{:g}'.format(percent): percentile(latencies, percent)
+                    for percent in PERCENTILES},
+        'startup_seconds': startup_time,
+        'max_rss_kilobytes': usage.ru_maxrss,
+        'cpu_seconds': usage.ru_utime + usage.ru_stime,
+        'usage': usage,
+    }
+
+
+def print_result(result, verbose=False):
+    print ('{server}: {requests_per_second:.0f} requests/s ({requests} '
+           'requests, {errors} errors), statuses {statuses}'.format(**result))
+    print ('    latency ' + ', '.join(
+        '{} {:.2f} ms'.format(name, seconds * 1000)
+        for name, seconds in result['latency'].items()))
+    print ('    startup {startup_seconds:.3f} s, max RSS {max_rss_kilobytes} '
+           'KB, CPU {cpu_seconds:.2f} s'.format(**result))
+    if verbose:
+        print (blug_server.print_usage_stats(result['usage']))
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description='Load test the Blug server against a generated site')
+    argument_parser.add_argument('root', help='Generated site to serve')
+    argument_parser.add_argument('--servers', nargs='+',
+                                 choices=sorted(SERVER_SCRIPTS),
+                                 default=DEFAULT_SERVERS,
+                                 help='Servers to test')
+    argument_parser.add_argument('-c', '--concurrency', type=int, default=16,
+                                 help='Number of concurrent clients')
+    argument_parser.add_argument('-d', '--duration', type=float, default=10,
+                                 help='Seconds to load each server for')
+    argument_parser.add_argument('--no-keep-alive', action='store_true',
+                                 help='Open a new connection for every '
+                                 'request')
+    argument_parser.add_argument('--gzip', type=float, default=0.5,
+                                 help='Fraction of requests accepting gzip')
+    argument_parser.add_argument('--seed', type=int, default=0,
+                                 help='Seed for the choice of URLs')
+    argument_parser.add_argument('-o', '--output',
+                                 help='File to write the results to as JSON')
+    argument_parser.add_argument('-v', '--verbose', action='store_true',
+                                 help='Show all of each server\'s resource '
+                                 'usage')
+    arguments = argument_parser.parse_args()
+
+    root = os.path.realpath(arguments.root)
+    urls = get_urls(root)
+    if not urls:
+        raise EnvironmentError('No files to request in [{}]'.format(root))
+    print ('{} URLs, {} clients, {} s per server, keep-alive {}, {:.0%} gzip'
+           .format(len(urls), arguments.concurrency, arguments.duration,
+                   'off' if arguments.no_keep_alive else 'on',
+                   arguments.gzip))
+    results = list()
+    for name in arguments.servers:
+        result = load_test(name, root, urls, arguments.concurrency,
+                           arguments.duration, not arguments.no_keep_alive,
+                           arguments.gzip, arguments.seed)
+        print_result(result, arguments.verbose)
+        results.append(result)
+
+    if arguments.output:
+        for result in results:
+            del result['usage']
+        with open(arguments.output, 'w') as output_file:
+            json.dump({'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'cpus': os.cpu_count(), 'urls': len(urls),
+                       'results': results}, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
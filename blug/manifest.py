@@ -0,0 +1,180 @@
+"""Build manifest recording which inputs each generated file depends on"""
+
+import os
+import json
+import datetime
+
+import jinja2
+from jinja2 import meta
+
+import deploy
+import staging
+
+MANIFEST_FILE_NAME = '.blug-manifest.json'
+
+# Template variables whose value changes on every build but which shouldn't,
+# on their own, cause a page to be regenerated
+VOLATILE_VARIABLES = ('now',)
+
+
+hash_bytes = deploy.hash_bytes
+
+
+def post_fingerprint(post):
+    """Return the values a post contributes to the pages it appears on: the
+    source hash and URL of it and of the post before it"""
+    fingerprint = [post['source_hash'], post['canonical_url']]
+    previous = post.get('post_previous')
+    if previous:
+        fingerprint.extend([previous['source_hash'],
+                            previous['canonical_url']])
+    return fingerprint
+
+
+def fingerprint(value):
+    """Return a stable, JSON serializable representation of a template
+    variable"""
+    if isinstance(value, dict):
+        if 'source_hash' in value:
+            return post_fingerprint(value)
+        return {str(key): fingerprint(value[key]) for key in value}
+    if isinstance(value, (list, tuple)):
+        return [fingerprint(item) for item in value]
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def write_if_changed(output_path, data, build_manifest=None):
+    """Write data to output_path, unless build_manifest shows the previous
+    build wrote exactly the same, returning True if it was written"""
+    if build_manifest and not build_manifest.needs_update(
+            output_path, hash_bytes(data)):
+        return False
+    staging.remove_file(output_path)
+    with open(output_path, 'wb') as output_file:
+        output_file.write(data)
+    return True
+
+
+class BuildManifest():
+    """A persistent record of the signature of every file a build wrote, a
+    digest of everything that went into the file"""
+
+    def __init__(self, output_dir, full=False):
+        self.output_dir = output_dir
+        self._output_prefix = os.path.join(output_dir, '')
+        self.path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+        self.previous = dict() if full else self._load()
+        self.current = dict()
+        self.updated = 0
+        self._templates = dict()
+
+    def _load(self):
+        """Return the signatures recorded by the previous build"""
+        try:
+            with open(self.path) as manifest_file:
+                return json.load(manifest_file)
+        except (IOError, ValueError):
+            return dict()
+
+    def _resolve_template(self, environment, template_name):
+        """Return a digest of the source of template_name and every template
+        it depends on, along with the set of variables they reference"""
+        if template_name in self._templates:
+            return self._templates[template_name]
+        try:
+            source, _, _ = environment.loader.get_source(environment,
+                                                         template_name)
+        except jinja2.TemplateNotFound:
+            # Templates only included conditionally (mail_signup_form.html,
+            # for example) need not exist
+            self._templates[template_name] = (hash_bytes(b''), set())
+            return self._templates[template_name]
+
+        ast = environment.parse(source)
+        variables = meta.find_undeclared_variables(ast)
+        digests = [hash_bytes(source.encode('utf-8'))]
+        for referenced_name in sorted(
+                name for name in meta.find_referenced_templates(ast) if name):
+            digest, referenced_variables = self._resolve_template(
+                environment, referenced_name)
+            digests.append(digest)
+            variables |= referenced_variables
+
+        self._templates[template_name] = (
+            hash_bytes(''.join(digests).encode('ascii')), variables)
+        return self._templates[template_name]
+
+    def page_signature(self, template, template_variables):
+        """Return the signature of a page rendered from template using
+        template_variables"""
+        digest, variables = self._resolve_template(template.environment,
+                                                   template.name)
+        used_variables = {
+            name: fingerprint(template_variables[name])
+            for name in variables
+            if name in template_variables and name not in VOLATILE_VARIABLES}
+        return hash_bytes(json.dumps(
+            [digest, used_variables], sort_keys=True).encode('utf-8'))
+
+    def _relative_path(self, output_path):
+        """Return output_path relative to the output directory"""
+        # Output paths are almost always built by joining onto output_dir,
+        # which makes this far cheaper than os.path.relpath()
+        if output_path.startswith(self._output_prefix):
+            return os.path.normpath(output_path[len(self._output_prefix):])
+        return os.path.relpath(output_path, self.output_dir)
+
+    def is_recorded(self, output_path):
+        """Return True if output_path was already written (or found to be up
+        to date) during this build"""
+        return self._relative_path(output_path) in self.current
+
+    def needs_update(self, output_path, signature):
+        """Record signature for output_path, returning True if the file must
+        be (re)written"""
+        relative_path = self._relative_path(output_path)
+        self.current[relative_path] = signature
+        if (self.previous.get(relative_path) == signature and
+                os.path.exists(output_path)):
+            return False
+        self.updated += 1
+        return True
+
+    def stale_outputs(self):
+        """Return the paths of files written by the previous build that this
+        build no longer produces"""
+        return sorted(os.path.join(self.output_dir, relative_path)
+                      for relative_path in self.previous
+                      if relative_path not in self.current)
+
+    def remove_stale_outputs(self):
+        """Delete files (and any directories left empty) that the previous
+        build produced but this one did not"""
+        stale_outputs = self.stale_outputs()
+        for path in stale_outputs:
+            if os.path.exists(path):
+                os.unlink(path)
+            directory = os.path.dirname(path)
+            while (os.path.normpath(directory) !=
+                   os.path.normpath(self.output_dir)):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+        return stale_outputs
+
+    def save(self):
+        """Persist the signatures recorded during this build"""
+        staging.remove_file(self.path)
+        with open(self.path, 'w') as manifest_file:
+            json.dump(self.current, manifest_file, indent=0, sort_keys=True)
+
+    def __str__(self):
+        return '{updated} files updated, {unchanged} unchanged'.format(
+            updated=self.updated,
+            unchanged=len(self.current) - self.updated)
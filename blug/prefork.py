@@ -0,0 +1,141 @@
+"""Serving from several worker processes, to make use of more than one core"""
+
+import os
+import sys
+import time
+import socket
+import signal
+import threading
+import traceback
+
+BACKLOG = 1024
+# A worker that dies sooner than this after starting is restarted only after
+# this long, so a worker that can't start doesn't have the supervisor forking
+# as fast as it can
+MINIMUM_LIFETIME = 1.0
+FORWARDED_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+RELOAD_SIGNAL = signal.SIGHUP
+
+
+def create_listener(server_address, reuse_port=False):
+    """Return a socket listening on server_address"""
+    return socket.create_server(server_address, backlog=BACKLOG,
+                                reuse_port=reuse_port)
+
+
+def watch_supervisor(alive_fd):
+    """Stop this worker once the supervisor, the only process holding the
+    other end of the pipe alive_fd reads from, exits"""
+    while os.read(alive_fd, 1):
+        pass
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def exit_on_signal(signum, _):
+    """Unwind the worker, so it can clean up (flushing its access log, for
+    example) before exiting"""
+    sys.exit(0)
+
+
+class Supervisor():
+    """Runs server.serve_forever() in a number of worker processes, calling
+    initializer and finalizer with server in each worker as it starts and
+    stops"""
+
+    def __init__(self, server, server_address, workers, initializer=None,
+                 finalizer=None, reuse_port=hasattr(socket, 'SO_REUSEPORT'),
+                 verbose=True):
+        self.server = server
+        self.server_address = server_address
+        self.workers = workers
+        self.initializer = initializer
+        self.finalizer = finalizer
+        self.verbose = verbose
+        self.listener = None
+        if not reuse_port:
+            self.listener = create_listener(server_address)
+        self.pids = dict()
+        self.stopping = False
+        # Nothing is ever written to the pipe; workers see it close when the
+        # supervisor exits, even if it's killed
+        (self.alive_read, self.alive_write) = os.pipe()
+
+    def start_worker(self):
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = time.monotonic()
+            return pid
+        status = 1
+        try:
+            os.close(self.alive_write)
+            threading.Thread(target=watch_supervisor, args=(self.alive_read,),
+                             daemon=True).start()
+            for signum in FORWARDED_SIGNALS:
+                signal.signal(signum, exit_on_signal)
+            # Reload requests are ignored unless the initializer handles
+            # them, rather than killing the worker
+            signal.signal(RELOAD_SIGNAL, signal.SIG_IGN)
+            # With SO_REUSEPORT each worker has a socket of its own and the
+            # kernel spreads connections evenly over them
+            self.server.listen_on(self.listener or create_listener(
+                self.server_address, reuse_port=True))
+            if self.initializer:
+                self.initializer(self.server)
+            self.server.serve_forever()
+            status = 0
+        except SystemExit:
+            status = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                if self.finalizer:
+                    self.finalizer(self.server)
+            finally:
+                os._exit(status)
+
+    def forward_signal(self, signum, _):
+        """Stop every worker, and then the supervisor"""
+        self.stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def forward_reload(self, signum, _):
+        """Have every worker reload the site"""
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        """Start the workers and keep them running until told to stop"""
+        for signum in FORWARDED_SIGNALS:
+            signal.signal(signum, self.forward_signal)
+        signal.signal(RELOAD_SIGNAL, self.forward_reload)
+        for _ in range(self.workers):
+            self.start_worker()
+        while self.pids:
+            try:
+                (pid, status) = os.wait()
+            except ChildProcessError:
+                break
+            started = self.pids.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            if self.verbose:
+                print('worker {pid} exited with status {status}; restarting'
+                      .format(pid=pid,
+                              status=os.waitstatus_to_exitcode(status)),
+                      file=sys.stderr)
+            if time.monotonic() - started < MINIMUM_LIFETIME:
+                time.sleep(MINIMUM_LIFETIME)
+            if not self.stopping:
+                self.start_worker()
+        if self.listener:
+            self.listener.close()
+        os.close(self.alive_read)
+        os.close(self.alive_write)
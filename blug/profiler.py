@@ -0,0 +1,102 @@
+"""Profiling of builds, for 'generate --profile'"""
+
+import os
+import time
+import contextlib
+import collections
+
+DEFAULT_TOP = 10
+
+
+def cpu_time():
+    """Return the CPU time used by this process and its finished children
+    (the worker processes converting posts and rendering pages)"""
+    times = os.times()
+    return (times.user + times.system + times.children_user +
+            times.children_system)
+
+
+def phase(profile, name):
+    """Return a context manager timing the phase called name into profile,
+    which may be None"""
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.phase(name)
+
+
+class BuildProfile():
+    """Where the time of a build went"""
+
+    def __init__(self):
+        # Phase name: [wall seconds, CPU seconds], in the order first run
+        self.phases = collections.OrderedDict()
+        # (seconds, post source path)
+        self.posts = list()
+        # (seconds, template name, output path, bytes)
+        self.pages = list()
+        self.bytes_written = 0
+        self.files_written = 0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        cpu_started = cpu_time()
+        try:
+            yield
+        finally:
+            times = self.phases.setdefault(name, [0.0, 0.0])
+            times[0] += time.perf_counter() - started
+            times[1] += cpu_time() - cpu_started
+
+    def record_post(self, source_path, seconds):
+        self.posts.append((seconds, source_path))
+
+    def record_page(self, template_name, output_path, seconds, size):
+        self.pages.append((seconds, template_name, output_path, size))
+        self.record_write(size)
+
+    def record_write(self, size):
+        self.bytes_written += size
+        self.files_written += 1
+
+    def templates(self):
+        """Return (total seconds, pages, template name) for each template,
+        slowest first"""
+        totals = dict()
+        for (seconds, template_name, _, _) in self.pages:
+            total = totals.setdefault(template_name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+        return sorted(((seconds, count, name) for name, (seconds, count)
+                       in totals.items()), reverse=True)
+
+    def report(self, top=DEFAULT_TOP):
+        """Return the profile as text, listing the top slowest posts, pages
+        and templates"""
+        lines = ['{:<24}{:>10}{:>10}'.format('Phase', 'Wall (s)', 'CPU (s)')]
+        for name, (wall, cpu) in self.phases.items():
+            lines.append('{:<24}{:>10.3f}{:>10.3f}'.format(name, wall, cpu))
+        lines.append('{} files, {} bytes written'.format(
+            self.files_written, self.bytes_written))
+
+        lines.append('')
+        lines.append('Slowest posts to convert ({} converted):'.format(
+            len(self.posts)))
+        for (seconds, source_path) in sorted(self.posts, reverse=True)[:top]:
+            lines.append('{:>10.1f} ms  {}'.format(seconds * 1000,
+                                                   source_path))
+
+        lines.append('')
+        lines.append('Slowest templates ({} pages rendered):'.format(
+            len(self.pages)))
+        for (seconds, count, name) in self.templates()[:top]:
+            lines.append('{:>10.1f} ms  {} ({} pages, {:.2f} ms each)'.format(
+                seconds * 1000, name, count, seconds * 1000 / count))
+
+        lines.append('')
+        lines.append('Slowest pages to render:')
+        for (seconds, template_name, output_path, size) in sorted(
+                self.pages, reverse=True)[:top]:
+            lines.append('{:>10.1f} ms  {} ({}, {} bytes)'.format(
+                seconds * 1000, output_path, template_name, size))
+        return '\n'.join(lines)
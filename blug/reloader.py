@@ -0,0 +1,152 @@
+"""Reloading of the site a server is serving, without restarting it"""
+
+import os
+import sys
+import time
+import resource
+import threading
+import traceback
+
+import deploy
+import search
+import blug_server
+
+# Seconds between checks of the build marker
+DEFAULT_INTERVAL = 2.0
+
+
+def build_marker(root):
+    """Return what identifies the build being served from root: the build
+    root links to, and when its file manifest (written by every build) was
+    last modified"""
+    try:
+        mtime = os.stat(os.path.join(
+            root, deploy.FILE_MANIFEST_NAME)).st_mtime_ns
+    except OSError:
+        mtime = None
+    return (os.path.realpath(root), mtime)
+
+
+def resident_memory():
+    """Return the resident set size of this process in kilobytes, or, where
+    it can't be read, the largest it has been"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return (int(statm.read().split()[1]) *
+                    resource.getpagesize() // 1024)
+    except (IOError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Reloader():
+    """Keeps server's generation up to date with the build published in
+    root, checking every interval seconds and whenever request() is called"""
+
+    def __init__(self, server, root, serve_search=False,
+                 interval=DEFAULT_INTERVAL, stats=None, verbose=True):
+        self.server = server
+        self.root = root
+        self.serve_search = serve_search
+        self.interval = interval
+        self.stats = stats
+        self.verbose = verbose
+        self.marker = build_marker(server.generation.root)
+        self.last_reload = None
+        self._requested = None
+        self._wake = threading.Event()
+        self._stopping = False
+        # The generation replaced by the last reload, which requests may
+        # still be using
+        self._previous = None
+
+    def request(self, *_):
+        """Ask for the site to be reloaded"""
+        self._requested = time.perf_counter()
+        self._wake.set()
+
+    def start(self):
+        """Start reloading in a thread of its own, returning the thread"""
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+
+    def run(self):
+        """Reload whenever asked to or a new build is published, until
+        stopped"""
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping:
+                return
+            requested = self._requested
+            self._requested = None
+            if requested is None:
+                if build_marker(self.root) == self.marker:
+                    continue
+                requested = time.perf_counter()
+                reason = 'new build'
+            else:
+                reason = 'signal'
+            try:
+                self.reload(reason, requested)
+            except Exception:
+                traceback.print_exc()
+                print('Reload failed; still serving {}'.format(
+                    self.server.generation.root), file=sys.stderr)
+                # Not tried again until the next build (or signal)
+                self.marker = build_marker(self.root)
+
+    def reload(self, reason='signal', requested=None):
+        """Build a generation from the build published in root, swap it in
+        and return the report of the reload"""
+        if requested is None:
+            requested = time.perf_counter()
+        marker = build_marker(self.root)
+        build_dir = marker[0]
+        memory_before = resident_memory()
+        started = time.perf_counter()
+        search_index = None
+        if self.serve_search:
+            search_index = search.SearchIndex.open(build_dir)
+            if search_index is None:
+                raise EnvironmentError(
+                    'No search index found in [{}]'.format(build_dir))
+        generation = blug_server.Generation(
+            build_dir, self.server.generation.file_cache.max_size,
+            search_index)
+        built = time.perf_counter()
+        previous = self.server.generation
+        self.server.generation = generation
+        swapped = time.perf_counter()
+        self.marker = marker
+        # Requests still being answered from the generation before the one
+        # just replaced had a whole reload interval to finish
+        if self._previous:
+            self._previous.release()
+        self._previous = previous
+
+        report = {
+            'reason': reason,
+            'build': generation.root,
+            'files': sum(1 for _ in generation.file_cache.entries()),
+            'build_seconds': built - started,
+            'swap_seconds': swapped - built,
+            'latency_seconds': swapped - requested,
+            'rss_before_kilobytes': memory_before,
+            'rss_after_kilobytes': resident_memory(),
+        }
+        self.last_reload = report
+        if self.stats:
+            self.stats.record_reload(report, previous.file_cache)
+        if self.verbose:
+            print('Reloaded {build} ({reason}): {files} files, built in '
+                  '{build_seconds:.3f} s and swapped in {swap_us:.1f} us, '
+                  '{latency_seconds:.3f} s after the request; RSS '
+                  '{rss_before_kilobytes} -> {rss_after_kilobytes} KB'.format(
+                      swap_us=report['swap_seconds'] * 1000000, **report),
+                  flush=True)
+        return report
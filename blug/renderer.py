@@ -0,0 +1,108 @@
+"""Rendering of templates to files, optionally spread over a pool of worker
+processes"""
+
+import os
+import time
+import collections
+import concurrent.futures
+
+import jinja2
+
+import staging
+import profiler
+
+# A page waiting to be rendered. template_variables belongs to the page alone
+# and isn't modified once the page is queued, so pages can be rendered in any
+# order, in any process.
+Page = collections.namedtuple('Page', ['template_name', 'output_path',
+                                       'template_variables'])
+
+# Each process rendering pages keeps a single template environment
+_template_environment = None
+
+
+def set_template_dir(template_dir):
+    """Create this process's template environment"""
+    global _template_environment
+    _template_environment = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(template_dir))
+
+
+def render_page(page, template_environment=None):
+    """Render a single page, streaming the output to disk"""
+    template = (template_environment or _template_environment).get_template(
+        page.template_name)
+    staging.remove_file(page.output_path)
+    template.stream(page.template_variables).dump(page.output_path,
+                                                  encoding='utf-8')
+
+
+def render_page_timed(page, template_environment=None):
+    """Render a single page, returning how long it took and the size of the
+    file written"""
+    started = time.perf_counter()
+    render_page(page, template_environment)
+    return (time.perf_counter() - started, os.path.getsize(page.output_path))
+
+
+def create_output_directories(pages):
+    """Create the directories for every page in a single pass"""
+    for directory in sorted(set(
+            os.path.dirname(page.output_path) for page in pages)):
+        os.makedirs(directory, exist_ok=True)
+
+
+class PageQueue():
+    """The pages a build needs to render, leaving out those build_manifest
+    shows are unchanged"""
+
+    def __init__(self, build_manifest=None):
+        self.build_manifest = build_manifest
+        self.pages = list()
+        self.body_posts = dict()
+
+    def add(self, template, template_variables, output_path, body_posts=()):
+        """Queue output_path to be rendered from template. body_posts are
+        the posts whose full bodies the page includes."""
+        if self.build_manifest and not self.build_manifest.needs_update(
+                output_path, self.build_manifest.page_signature(
+                    template, template_variables)):
+            return
+        self.pages.append(Page(template.name, output_path,
+                               dict(template_variables)))
+        for post in body_posts:
+            self.body_posts[id(post)] = post
+
+    def render(self, template_dir, jobs=1, template_environment=None,
+               profile=None):
+        """Render every queued page using up to jobs worker processes. Pages
+        rendered in this process use template_environment, if given. The
+        time taken by each page is recorded in profile, if given."""
+        with profiler.phase(profile, 'create directories'):
+            create_output_directories(self.pages)
+        with profiler.phase(profile, 'render pages'):
+            if jobs <= 1 or len(self.pages) <= 1:
+                if not template_environment:
+                    set_template_dir(template_dir)
+                for page in self.pages:
+                    if profile:
+                        profile.record_page(
+                            page.template_name, page.output_path,
+                            *render_page_timed(page, template_environment))
+                    else:
+                        render_page(page, template_environment)
+            else:
+                chunk_size = max(1, len(self.pages) // (jobs * 4))
+                with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=jobs, initializer=set_template_dir,
+                        initargs=(template_dir,)) as executor:
+                    for (page, result) in zip(self.pages, executor.map(
+                            render_page_timed if profile else render_page,
+                            self.pages, chunksize=chunk_size)):
+                        if profile:
+                            profile.record_page(
+                                page.template_name, page.output_path, *result)
+        rendered = len(self.pages)
+        self.pages = list()
+        self.body_posts = dict()
+        return rendered
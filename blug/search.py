@@ -0,0 +1,210 @@
+"""A full text search index of the posts, sharded by term prefix, built by
+'generate' and served by 'serve --search' at /search?q="""
+
+import os
+import re
+import json
+import math
+import array
+import heapq
+import functools
+import urllib.parse
+
+import manifest
+import converter
+import blug_server
+
+SEARCH_DIR = 'search'
+INDEX_FILE_NAME = 'index.json'
+PREFIX_LENGTH = 2
+# Bumped whenever tokenizing changes, so cached terms aren't reused
+VERSION = 1
+# How many times more a word in a post's title counts than one in its body
+TITLE_WEIGHT = 5
+MAX_RESULTS = 20
+MAX_QUERY_TERMS = 10
+# Searches whose results are remembered
+QUERY_CACHE_SIZE = 1024
+
+WORD = re.compile(r'[a-z0-9]+')
+TAG = re.compile(r'<[^>]*>')
+STOP_WORDS = frozenset((
+    'a an and are as at be but by for from has have if in into is it its no '
+    'not of on or so such that the their then there these they this to was '
+    'were will with you your').split())
+# Suffixes removed (or replaced) by stem(), tried in order
+SUFFIXES = (('sses', 'ss'), ('ies', 'y'), ('ss', 'ss'), ('ing', ''),
+            ('ed', ''), ('ly', ''), ('s', ''))
+
+
+def stem(word):
+    """Return word with its inflectional suffix removed: a light stemmer in
+    the spirit of the first step of Porter's algorithm, so that 'caches',
+    'cached' and 'caching' are all found by a search for 'cache'"""
+    for (suffix, replacement) in SUFFIXES:
+        if word.endswith(suffix):
+            if len(word) - len(suffix) >= 3:
+                word = word[:len(word) - len(suffix)] + replacement
+            break
+    if word.endswith('e') and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Return the stemmed terms of text, in order"""
+    return [stem(word) for word in WORD.findall(TAG.sub(' ', text.lower()))
+            if len(word) > 1 and word not in STOP_WORDS]
+
+
+def post_terms(post):
+    """Return the weighted number of times each term appears in post"""
+    counts = dict()
+    for term in tokenize(post['title']):
+        counts[term] = counts.get(term, 0) + TITLE_WEIGHT
+    (_, _, text) = converter.read_post_file(post.source_path).partition(
+        '\n\n')
+    for term in tokenize(text):
+        counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+def get_post_terms(post, cache=None):
+    """Return post_terms(post), from cache if possible"""
+    key = manifest.hash_bytes('{}:search:{}'.format(
+        post['source_hash'], VERSION).encode('ascii'))
+    counts = cache.get(key) if cache else None
+    if counts is None:
+        counts = post_terms(post)
+        if cache:
+            cache.set(key, counts)
+    return counts
+
+
+def build_index(posts, cache=None):
+    """Return the documents and the shards of the index of posts"""
+    documents = list()
+    postings = dict()
+    # Ids are positions in date order, oldest first, so publishing a new post
+    # changes only the shards of its own terms; adding an older post or
+    # removing one changes the ids of every later post, and so their shards
+    for (document_id, post) in enumerate(
+            sorted(posts, key=lambda post: post['date'])):
+        documents.append([post['relative_url'], post['title'],
+                          post['date'].isoformat()])
+        for (term, count) in get_post_terms(post, cache).items():
+            postings.setdefault(term, []).append((document_id, count))
+
+    shards = dict()
+    for term in sorted(postings):
+        deltas = list()
+        counts = list()
+        previous = 0
+        for (document_id, count) in postings[term]:
+            deltas.append(document_id - previous)
+            counts.append(count)
+            previous = document_id
+        shards.setdefault(term[:PREFIX_LENGTH], {})[term] = [deltas, counts]
+    return (documents, shards)
+
+
+def encode(value):
+    return json.dumps(value, separators=(',', ':'),
+                      sort_keys=True).encode('utf-8')
+
+
+def write_index(output_dir, posts, build_manifest=None, cache=None):
+    """Write the search index of posts under output_dir, returning the
+    number of files written"""
+    (documents, shards) = build_index(posts, cache)
+    search_dir = os.path.join(output_dir, SEARCH_DIR)
+    os.makedirs(search_dir, exist_ok=True)
+    written = 0
+    for (prefix, shard) in shards.items():
+        written += manifest.write_if_changed(os.path.join(
+            search_dir, prefix + '.json'), encode(shard), build_manifest)
+    index = encode({'version': VERSION, 'prefix_length': PREFIX_LENGTH,
+                    'documents': documents, 'shards': sorted(shards)})
+    written += manifest.write_if_changed(os.path.join(
+        search_dir, INDEX_FILE_NAME), index, build_manifest)
+    return written
+
+
+class SearchIndex():
+    """The search index of a generated site, held in memory"""
+
+    def __init__(self, root):
+        search_dir = os.path.join(root, SEARCH_DIR)
+        with open(os.path.join(search_dir, INDEX_FILE_NAME)) as index_file:
+            index = json.load(index_file)
+        self.documents = [{'url': url, 'title': title, 'date': date}
+                          for (url, title, date) in index['documents']]
+        # Term: (post ids, counts), as arrays to keep the index compact
+        self.postings = dict()
+        for prefix in index['shards']:
+            with open(os.path.join(search_dir, prefix + '.json')) as shard:
+                for (term, (deltas, counts)) in json.load(shard).items():
+                    document_ids = array.array('I', deltas)
+                    for index in range(1, len(document_ids)):
+                        document_ids[index] += document_ids[index - 1]
+                    self.postings[term] = (document_ids,
+                                           array.array('I', counts))
+        # Each index remembers its own results, so they go with it
+        self._cached_search = functools.lru_cache(QUERY_CACHE_SIZE)(
+            self._search)
+
+    @classmethod
+    def open(cls, root):
+        """Return the index of the site in root, or None if it has none"""
+        if not os.path.exists(os.path.join(root, SEARCH_DIR,
+                                           INDEX_FILE_NAME)):
+            return None
+        return cls(root)
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Return the total number of posts containing every term of query,
+        and the best limit of them, best first"""
+        terms = tuple(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        (total, best) = self._cached_search(terms, limit)
+        return (total, [self.documents[document_id] for document_id in best])
+
+    def _search(self, terms, limit):
+        """Return the number of posts containing every one of terms, and the
+        ids of the best limit of them"""
+        postings = [self.postings.get(term) for term in terms]
+        if not postings or None in postings:
+            return (0, ())
+        # Start from the rarest term, so there are as few candidates as
+        # possible to check the other terms for
+        postings.sort(key=lambda posting: len(posting[0]))
+        scores = None
+        for (document_ids, counts) in postings:
+            weight = math.log(1 + len(self.documents) / len(document_ids))
+            if scores is None:
+                # Scores are kept in units of the rarest term's weight, which
+                # ranks posts the same and saves scaling its counts
+                (scores, unit) = (dict(zip(document_ids, counts)), weight)
+                continue
+            ratio = weight / unit
+            scores = {document_id: scores[document_id] + count * ratio
+                      for (document_id, count) in zip(document_ids, counts)
+                      if document_id in scores}
+            if not scores:
+                return (0, ())
+        # Ties go to the newest post
+        best = heapq.nlargest(limit, scores, key=lambda document_id: (
+            scores[document_id], document_id))
+        return (len(scores), tuple(best))
+
+    def respond(self, url):
+        """Return the status, head and body of the response to a GET of the
+        search URL"""
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+        query = query.get('q', [''])[0]
+        (total, results) = self.search(query)
+        body = json.dumps({'query': query, 'total': total,
+                           'results': results}).encode('utf-8')
+        return (200, blug_server.format_head(200, [
+            ('Content-Type', 'application/json'),
+            ('Cache-Control', 'no-cache'),
+            ('Content-Length', str(len(body)))]), memoryview(body))
@@ -0,0 +1,160 @@
+"""A single file holding every servable file of a build, both as is and
+gzipped, for the server to memory map"""
+
+import os
+import json
+import gzip
+import mmap
+import struct
+
+import deploy
+
+PACK_FILE_NAME = '.blug-site.pack'
+# A pack is MAGIC, the length of the JSON index mapping URL paths to their
+# bodies, the index, then every distinct body back to back from a page
+# boundary
+MAGIC = b'BLUGPACK2\n'
+INDEX_LENGTH = struct.Struct('>Q')
+
+# Bodies smaller than this gain nothing from compression
+MINIMUM_GZIP_SIZE = 256
+# Files larger than this are sent from disk rather than packed
+MAXIMUM_PACKED_SIZE = 256 * 1024
+
+
+class SitePack():
+    """A memory mapped site pack"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as pack_file:
+            header = pack_file.read(len(MAGIC) + INDEX_LENGTH.size)
+            if header[:len(MAGIC)] != MAGIC:
+                raise ValueError('{} is not a site pack'.format(path))
+            (index_length,) = INDEX_LENGTH.unpack(header[len(MAGIC):])
+            self.index = json.loads(pack_file.read(index_length).decode(
+                'utf-8'))
+            self.blob_offset = blob_offset(len(header) + index_length)
+            self.map = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+    @classmethod
+    def open(cls, directory):
+        """Return the pack in directory, or None if there isn't a (valid)
+        one"""
+        try:
+            return cls(os.path.join(directory, PACK_FILE_NAME))
+        except (IOError, ValueError):
+            return None
+
+    def get_body(self, path, zipped=False):
+        """Return a memoryview of the body of path (gzipped, if zipped and a
+        gzipped body exists) without copying it, or None"""
+        entry = self.index.get(path)
+        if not entry:
+            return None
+        return self.get_body_by_entry(entry, zipped)
+
+    def get_body_by_entry(self, entry, zipped=False):
+        """Return a memoryview of the body described by an index entry, or
+        None if the file isn't packed"""
+        if not entry['raw']:
+            return None
+        (offset, length) = (entry['gzip'] if zipped and entry['gzip']
+                            else entry['raw'])
+        start = self.blob_offset + offset
+        return self.view[start:start + length]
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+
+def blob_offset(header_length):
+    """Return where the blob starts, given the length of everything before
+    it"""
+    return -(-header_length // mmap.PAGESIZE) * mmap.PAGESIZE
+
+
+def write_pack(directory, file_types, file_manifest):
+    """Write a pack of the files in directory with an extension in file_types
+    and return its size, or None if no file changed since the previous pack"""
+    servable = dict((relative_path, entry)
+                    for (relative_path, entry) in file_manifest.items()
+                    if os.path.splitext(relative_path)[1] in file_types)
+    previous = SitePack.open(directory)
+    if previous and {
+            path: (entry['hash'], entry['mtime'])
+            for (path, entry) in previous.index.items()} == {
+                deploy.url_path(relative_path): (
+                    entry['hash'], entry['mtime'])
+                for (relative_path, entry) in servable.items()}:
+        previous.close()
+        return None
+    previous_bodies = dict()
+    if previous:
+        for entry in previous.index.values():
+            if entry['raw']:
+                previous_bodies[entry['hash']] = (previous, entry)
+
+    index = dict()
+    bodies = list()
+    offsets = dict()
+    blob_length = 0
+
+    def add_body(body):
+        nonlocal blob_length
+        bodies.append(body)
+        blob_length += len(body)
+        return (blob_length - len(body), len(body))
+
+    for relative_path in sorted(servable):
+        file_entry = servable[relative_path]
+        content_hash = file_entry['hash']
+        if file_entry['size'] > MAXIMUM_PACKED_SIZE:
+            offsets[content_hash] = (None, None)
+        elif content_hash not in offsets:
+            # Identical files (the root and blog index pages, for example)
+            # share their bodies
+            if content_hash in previous_bodies:
+                (pack, entry) = previous_bodies[content_hash]
+                raw = bytes(pack.get_body_by_entry(entry))
+                gzipped = (bytes(pack.get_body_by_entry(entry, zipped=True))
+                           if entry['gzip'] else None)
+            else:
+                with open(os.path.join(directory, relative_path),
+                          'rb') as input_file:
+                    raw = input_file.read()
+                gzipped = None
+                if len(raw) >= MINIMUM_GZIP_SIZE:
+                    gzipped = gzip.compress(raw, compresslevel=9)
+                    if len(gzipped) >= len(raw):
+                        gzipped = None
+            offsets[content_hash] = (add_body(raw),
+                                     add_body(gzipped) if gzipped else None)
+        (raw_location, gzip_location) = offsets[content_hash]
+        index[deploy.url_path(relative_path)] = {
+            'raw': raw_location,
+            'gzip': gzip_location,
+            'hash': content_hash,
+            'size': file_entry['size'],
+            'mtime': file_entry['mtime'],
+        }
+
+    encoded_index = json.dumps(index, sort_keys=True).encode('utf-8')
+    header_length = len(MAGIC) + INDEX_LENGTH.size + len(encoded_index)
+    path = os.path.join(directory, PACK_FILE_NAME)
+    # The previous pack is a hard link shared with the published build, and
+    # may be mapped by a running server; write a new file and replace it
+    temporary_path = path + '.new'
+    with open(temporary_path, 'wb') as pack_file:
+        pack_file.write(MAGIC)
+        pack_file.write(INDEX_LENGTH.pack(len(encoded_index)))
+        pack_file.write(encoded_index)
+        pack_file.write(b'\0' * (blob_offset(header_length) - header_length))
+        for body in bodies:
+            pack_file.write(body)
+    if previous:
+        previous.close()
+    os.replace(temporary_path, path)
+    return blob_offset(header_length) + blob_length
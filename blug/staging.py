@@ -0,0 +1,142 @@
+"""Staged builds of the generated site, published with an atomic swap"""
+
+import os
+import shutil
+import datetime
+import itertools
+import threading
+
+import deploy
+
+# The number of builds (including the current one) to keep around, so that
+# requests being served from the previous build can finish
+KEEP_BUILDS = 2
+# Where servers record the builds they are serving, which are never removed
+SERVING_DIR = '.serving'
+
+_markers = itertools.count()
+
+
+def get_builds_dir(output_dir):
+    """Return the directory builds for output_dir are staged in"""
+    return os.path.normpath(output_dir) + '.builds'
+
+
+def get_current_build(output_dir):
+    """Return the directory holding the currently published build, or None
+    if nothing has been generated yet"""
+    if os.path.islink(output_dir):
+        return os.path.realpath(output_dir)
+    if os.path.isdir(output_dir):
+        return output_dir
+    return None
+
+
+def remove_file(path):
+    """Remove path if it exists, as must be done before writing to a file
+    that may be linked from the published build"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def create_build(output_dir, link_previous=True):
+    """Create and return a new build directory for output_dir, starting with
+    the contents of the current build unless link_previous is False"""
+    build_dir = os.path.join(
+        get_builds_dir(output_dir),
+        datetime.datetime.now().strftime('%Y%m%d%H%M%S%f'))
+    current_build = get_current_build(output_dir)
+    if link_previous and current_build:
+        deploy.link_tree(current_build, build_dir)
+    else:
+        os.makedirs(build_dir)
+    return build_dir
+
+
+def publish_build(output_dir, build_dir):
+    """Atomically make build_dir the contents of output_dir and start
+    removing builds that are no longer needed, returning the thread doing
+    so"""
+    if os.path.isdir(output_dir) and not os.path.islink(output_dir):
+        # A site generated before builds were staged; move it aside so the
+        # symbolic link can take its place
+        os.rename(output_dir, os.path.join(get_builds_dir(output_dir),
+                                           '0-unstaged'))
+
+    temporary_link = os.path.normpath(output_dir) + '.new'
+    remove_file(temporary_link)
+    os.symlink(os.path.relpath(build_dir, os.path.dirname(
+        os.path.abspath(output_dir))), temporary_link)
+    os.replace(temporary_link, output_dir)
+
+    # Removing a build takes as long as creating one; there's no need to
+    # make whoever is waiting for this build to be published wait for it
+    cleanup_thread = threading.Thread(target=remove_old_builds,
+                                      args=(output_dir,))
+    cleanup_thread.start()
+    return cleanup_thread
+
+
+def mark_serving(build_dir):
+    """Record that this process is serving build_dir, returning the marker
+    to give unmark_serving(), or None if build_dir isn't a staged build"""
+    (builds_dir, build) = os.path.split(os.path.normpath(build_dir))
+    if not builds_dir.endswith('.builds'):
+        return None
+    serving_dir = os.path.join(builds_dir, SERVING_DIR)
+    os.makedirs(serving_dir, exist_ok=True)
+    marker = os.path.join(serving_dir, '{}.{}.{}'.format(
+        build, os.getpid(), next(_markers)))
+    open(marker, 'w').close()
+    return marker
+
+
+def unmark_serving(marker):
+    """Remove a marker made by mark_serving()"""
+    if marker:
+        remove_file(marker)
+
+
+def get_builds_in_use(builds_dir):
+    """Return the builds marked as served by processes still running,
+    removing the markers of those that aren't"""
+    serving_dir = os.path.join(builds_dir, SERVING_DIR)
+    in_use = set()
+    try:
+        markers = os.listdir(serving_dir)
+    except FileNotFoundError:
+        return in_use
+    for marker in markers:
+        (build, pid, _) = marker.rsplit('.', 2)
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            remove_file(os.path.join(serving_dir, marker))
+            continue
+        except PermissionError:
+            # Running, as another user
+            pass
+        in_use.add(build)
+    return in_use
+
+
+def remove_old_builds(output_dir, keep=KEEP_BUILDS):
+    """Remove all but the newest keep builds, never removing the current
+    one or one a server is still serving"""
+    builds_dir = get_builds_dir(output_dir)
+    current_build = get_current_build(output_dir)
+    in_use = get_builds_in_use(builds_dir)
+    builds = sorted((build for build in os.listdir(builds_dir)
+                     if build != SERVING_DIR), reverse=True)
+    for build in builds[keep:]:
+        build_dir = os.path.join(builds_dir, build)
+        if (os.path.realpath(build_dir) != current_build and
+                build not in in_use):
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def discard_build(build_dir):
+    """Remove a build that failed part way through"""
+    shutil.rmtree(build_dir, ignore_errors=True)
@@ -0,0 +1,228 @@
+"""Live metrics for the Blug server, served (when enabled) at /__stats as JSON
+or, with ?format=prometheus, in the Prometheus text format"""
+
+import json
+import time
+import bisect
+import resource
+import threading
+
+import blug_server
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, float('inf'))
+# What resource.getrusage() reports, as (field, metric name, help)
+RUSAGE_FIELDS = (
+    ('ru_utime', 'cpu_user_seconds', 'Time spent in user mode'),
+    ('ru_stime', 'cpu_system_seconds', 'Time spent in system mode'),
+    ('ru_maxrss', 'max_rss_kilobytes', 'Maximum resident set size'),
+    ('ru_minflt', 'minor_page_faults', 'Page faults not requiring I/O'),
+    ('ru_majflt', 'major_page_faults', 'Page faults requiring I/O'),
+    ('ru_nvcsw', 'voluntary_context_switches', 'Voluntary context switches'),
+    ('ru_nivcsw', 'involuntary_context_switches',
+     'Involuntary context switches'),
+)
+# The counters of a blug_server.FileCache
+CACHE_COUNTERS = ('hits', 'misses', 'evictions')
+
+
+class Shard():
+    """The counts of a single thread"""
+
+    def __init__(self):
+        self.requests = dict()
+        self.bytes = dict()
+        self.encodings = {'gzip': 0, 'identity': 0}
+        self.latencies = dict()
+        self.connections = 0
+
+    def add(self, other):
+        """Add the counts of other to this shard"""
+        # other may be updated while it is read; copies keep its
+        # dictionaries from changing size under us
+        for status, count in other.requests.copy().items():
+            self.requests[status] = self.requests.get(status, 0) + count
+        for status, count in other.bytes.copy().items():
+            self.bytes[status] = self.bytes.get(status, 0) + count
+        for encoding, count in other.encodings.items():
+            self.encodings[encoding] += count
+        for route, histogram in other.latencies.copy().items():
+            total = self.latencies.setdefault(
+                route, [0] * (len(LATENCY_BUCKETS) + 1))
+            for index, count in enumerate(histogram):
+                total[index] += count
+        self.connections += other.connections
+
+
+class ServerStats():
+    """Counts of everything a server has done since it started"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._local = threading.local()
+        self._shards = list()
+        # The counts of threads that have finished with their shards
+        self._retired = Shard()
+        self._lock = threading.Lock()
+        self.reloads = 0
+        # What reloader.Reloader reported of the last reload, if any
+        self.last_reload = None
+        # The counts of the file caches of generations replaced by reloads
+        self._retired_cache = dict.fromkeys(CACHE_COUNTERS, 0)
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def connection_opened(self):
+        self._shard().connections += 1
+
+    def connection_closed(self):
+        shard = self._shard()
+        shard.connections -= 1
+        if shard.connections <= 0:
+            # The thread may never be used again; don't keep its shard
+            with self._lock:
+                self._shards.remove(shard)
+                self._retired.add(shard)
+            del self._local.shard
+
+    def record_reload(self, report, file_cache=None):
+        """Count a reload of the site, keeping the counts of file_cache, the
+        cache of the generation it replaced"""
+        self.reloads += 1
+        self.last_reload = report
+        if file_cache:
+            for name in CACHE_COUNTERS:
+                self._retired_cache[name] += getattr(file_cache, name)
+
+    def record(self, path, status, size, zipped, seconds):
+        """Count a response, which took seconds, serving the file at path
+        (or, for redirects and errors, None)"""
+        shard = self._shard()
+        shard.requests[status] = shard.requests.get(status, 0) + 1
+        shard.bytes[status] = shard.bytes.get(status, 0) + size
+        shard.encodings['gzip' if zipped else 'identity'] += 1
+        # Requests for unknown URLs share a histogram, so there are at most
+        # as many histograms as files
+        key = path or str(status)
+        histogram = shard.latencies.get(key)
+        if histogram is None:
+            histogram = shard.latencies[key] = [0] * (len(LATENCY_BUCKETS) + 1)
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        # The last slot holds the total time
+        histogram[-1] += seconds
+
+    def snapshot(self, file_cache):
+        """Return every metric, with the shards added together"""
+        total = Shard()
+        with self._lock:
+            shards = list(self._shards)
+            total.add(self._retired)
+        for shard in shards:
+            total.add(shard)
+
+        cache = {name: self._retired_cache[name] + getattr(file_cache, name)
+                 for name in CACHE_COUNTERS}
+        cache['size'] = file_cache.size
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {
+            'uptime_seconds': time.time() - self.started,
+            'requests': {str(status): count
+                         for status, count in sorted(total.requests.items())},
+            'bytes': {str(status): count
+                      for status, count in sorted(total.bytes.items())},
+            'encodings': total.encodings,
+            'gzip_ratio': (total.encodings['gzip'] /
+                           sum(total.encodings.values())
+                           if sum(total.encodings.values()) else 0),
+            'cache': cache,
+            'active_connections': total.connections,
+            'latency_buckets': [bucket for bucket in LATENCY_BUCKETS
+                                if bucket != float('inf')],
+            'latency': {route: {'buckets': histogram[:-1],
+                                'count': sum(histogram[:-1]),
+                                'sum': histogram[-1]}
+                        for route, histogram in sorted(
+                            total.latencies.items())},
+            'rusage': {name: getattr(usage, field)
+                       for (field, name, _) in RUSAGE_FIELDS},
+            'reloads': self.reloads,
+            'last_reload': self.last_reload,
+        }
+
+    def to_prometheus(self, snapshot):
+        """Return snapshot in the Prometheus text exposition format"""
+        lines = list()
+
+        def metric(name, metric_type, description, samples):
+            lines.append('# HELP blug_{} {}'.format(name, description))
+            lines.append('# TYPE blug_{} {}'.format(name, metric_type))
+            for (labels, value) in samples:
+                lines.append('blug_{}{} {}'.format(name, labels, value))
+
+        metric('requests_total', 'counter', 'Requests answered, by status',
+               [('{{status="{}"}}'.format(status), count)
+                for status, count in snapshot['requests'].items()])
+        metric('response_bytes_total', 'counter', 'Body bytes sent, by status',
+               [('{{status="{}"}}'.format(status), count)
+                for status, count in snapshot['bytes'].items()])
+        metric('responses_by_encoding_total', 'counter',
+               'Responses sent, by content encoding',
+               [('{{encoding="{}"}}'.format(encoding), count)
+                for encoding, count in snapshot['encodings'].items()])
+        for name in CACHE_COUNTERS:
+            metric('cache_{}_total'.format(name), 'counter',
+                   'File cache ' + name, [('', snapshot['cache'][name])])
+        metric('cache_bytes', 'gauge', 'Bytes held in the file cache',
+               [('', snapshot['cache']['size'])])
+        metric('active_connections', 'gauge', 'Open client connections',
+               [('', snapshot['active_connections'])])
+        metric('reloads_total', 'counter', 'Reloads of the site',
+               [('', snapshot['reloads'])])
+        if snapshot['last_reload']:
+            for name in ('build_seconds', 'swap_seconds'):
+                metric('last_reload_' + name, 'gauge',
+                       'Last reload\'s ' + name.replace('_', ' '),
+                       [('', snapshot['last_reload'][name])])
+
+        samples = list()
+        for route, histogram in snapshot['latency'].items():
+            label = route.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+                cumulative += count
+                samples.append(('_bucket{{route="{}",le="{}"}}'.format(
+                    label, '+Inf' if bound == float('inf') else bound),
+                    cumulative))
+            samples.append(('_sum{{route="{}"}}'.format(label),
+                            histogram['sum']))
+            samples.append(('_count{{route="{}"}}'.format(label),
+                            histogram['count']))
+        metric('request_duration_seconds', 'histogram',
+               'Time taken to answer requests, by route', samples)
+
+        for (_, name, description) in RUSAGE_FIELDS:
+            metric(name, 'gauge', description,
+                   [('', snapshot['rusage'][name])])
+        return '\n'.join(lines) + '\n'
+
+    def respond(self, url, file_cache):
+        """Return the status, head and body of the response to a GET of the
+        stats URL"""
+        snapshot = self.snapshot(file_cache)
+        if 'format=prometheus' in url:
+            body = self.to_prometheus(snapshot).encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body = json.dumps(snapshot, indent=2).encode('utf-8')
+            content_type = 'application/json'
+        return (200, blug_server.format_head(200, [
+            ('Content-Type', content_type), ('Cache-Control', 'no-store'),
+            ('Content-Length', str(len(body)))]), memoryview(body))
@@ -0,0 +1,86 @@
+import unittest
+import os
+import json
+import time
+import tempfile
+
+import access_log
+
+
+class TestAccessLog(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'access.log')
+
+    def read_lines(self):
+        with open(self.path) as log_file:
+            return log_file.read().splitlines()
+
+    def test_combined_format(self):
+        log = access_log.AccessLog(self.path)
+        log.log('127.0.0.1', 'GET', '/index.html', 'HTTP/1.1', 200, 1234,
+                None, 'curl/8.0')
+        log.log('127.0.0.1', 'GET', '/missing', 'HTTP/1.1', 404, 0)
+        log.close()
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('127.0.0.1 - - ['))
+        self.assertTrue(lines[0].endswith(
+            '] "GET /index.html HTTP/1.1" 200 1234 "-" "curl/8.0"'))
+        self.assertTrue(lines[1].endswith('404 - "-" "-"'))
+
+    def test_json_format(self):
+        log = access_log.AccessLog(self.path, 'json')
+        log.log('127.0.0.1', 'GET', '/', 'HTTP/1.0', 304, 0)
+        log.close()
+        record = json.loads(self.read_lines()[0])
+        self.assertEqual((record['path'], record['status']), ('/', 304))
+
+    def test_sampling(self):
+        log = access_log.AccessLog(self.path, sample_rate=0)
+        log.log('127.0.0.1', 'GET', '/', 'HTTP/1.1', 200, 10)
+        log.close()
+        self.assertEqual(self.read_lines(), [])
+
+    def test_rotation(self):
+        log = access_log.AccessLog(self.path, max_bytes=1, backup_count=2,
+                                   flush_interval=0)
+        for count in range(1, 4):
+            log.log('127.0.0.1', 'GET', '/', 'HTTP/1.1', 200, 10)
+            # Wait for each record to be written, so each gets its own file
+            while log.written < count:
+                time.sleep(0.01)
+        log.close()
+        self.assertTrue(os.path.exists(self.path + '.2'))
+        self.assertFalse(os.path.exists(self.path + '.3'))
+
+    def test_rotation_shared(self):
+        # Two logs on the same path, as written by two 'serve' workers
+        logs = [access_log.AccessLog(self.path, max_bytes=200,
+                                     flush_interval=0) for _ in range(2)]
+
+        def log(log, path):
+            count = log.written + 1
+            log.log('127.0.0.1', 'GET', path, 'HTTP/1.1', 200, 10)
+            while log.written < count:
+                time.sleep(0.01)
+
+        for _ in range(3):
+            log(logs[0], '/rotated')
+        log(logs[1], '/second')
+        log(logs[0], '/first')
+        for shared_log in logs:
+            shared_log.close()
+        # The second log writes to the new file rather than the rotated one,
+        # and doesn't rotate the log again
+        with open(self.path + '.1', encoding='utf-8') as rotated_file:
+            self.assertEqual(len(rotated_file.readlines()), 3)
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('/second', lines[0])
+        self.assertIn('/first', lines[1])
+        self.assertFalse(os.path.exists(self.path + '.2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import jinja2
+
+import assets
+import blug_server
+import manifest
+
+BASE = '''<link href="{{ asset_url('css/a.css', 'css/b.css') }}">
+<script src="{{ asset_url('js/app.js') }}"></script>
+<img src="{{ asset_url(image) }}">'''
+
+
+class TestAssets(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.static_dir = os.path.join(self.directory, 'static')
+        self.output_dir = os.path.join(self.directory, 'generated')
+        template_dir = os.path.join(self.directory, 'templates')
+        for (path, content) in (
+                ('static/css/a.css',
+                 '/* A */\na  >  b ,  c {\n  color: red;\n}\n'),
+                ('static/css/b.css', 'p:before { content: "x,  y"; }\n'),
+                ('static/js/app.js', '// Comment\n  var x = 1;\n\n  f(x)\n'),
+                ('templates/base.html', BASE)):
+            path = os.path.join(self.directory, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as output_file:
+                output_file.write(content)
+        self.template_environment = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(template_dir))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, url):
+        with open(os.path.join(self.output_dir, url[1:])) as asset_file:
+            return asset_file.read()
+
+    def test_find_bundles(self):
+        self.assertEqual(assets.find_bundles(self.template_environment),
+                         {('css/a.css', 'css/b.css'), ('js/app.js',)})
+
+    def test_bundles_minified_and_fingerprinted(self):
+        asset_url = assets.build_assets(
+            self.template_environment, self.static_dir, self.output_dir)
+        url = asset_url('css/a.css', 'css/b.css')
+        self.assertRegex(url, r'^/assets/[0-9a-f]{16}\.css$')
+        self.assertEqual(self.read(url),
+                         'a>b,c{color: red}\np:before{content: "x,  y"}')
+        self.assertEqual(self.read(asset_url('js/app.js')), 'var x = 1;\nf(x)')
+        self.assertRaises(EnvironmentError, asset_url, 'css/a.css')
+
+    def test_code_after_comment_kept(self):
+        self.assertEqual(assets.minify_js(
+            '/* init */ var a = 1;\n/* multi\nline */ var c = 3;\n'
+            '/*! License */\n'),
+            'var a = 1;\nvar c = 3;\n/*! License */')
+
+    def test_urls_prefixed_with_blog_root(self):
+        asset_url = assets.build_assets(
+            self.template_environment, self.static_dir, self.output_dir,
+            blog_root='/marketing')
+        self.assertRegex(asset_url('js/app.js'),
+                         r'^/marketing/assets/[0-9a-f]{16}\.js$')
+        asset_url = assets.build_assets(
+            self.template_environment, self.static_dir, self.output_dir,
+            blog_root='marketing/')
+        self.assertRegex(asset_url('js/app.js'),
+                         r'^/marketing/assets/[0-9a-f]{16}\.js$')
+
+    def test_changed_asset_renamed(self):
+        build_manifest = manifest.BuildManifest(self.output_dir)
+        first = assets.build_assets(self.template_environment,
+                                    self.static_dir, self.output_dir,
+                                    build_manifest)
+        with open(os.path.join(self.static_dir, 'css', 'b.css'), 'a') as f:
+            f.write('q { color: blue; }')
+        second = assets.build_assets(self.template_environment,
+                                     self.static_dir, self.output_dir,
+                                     build_manifest)
+        self.assertNotEqual(first('css/a.css', 'css/b.css'),
+                            second('css/a.css', 'css/b.css'))
+        self.assertEqual(first('js/app.js'), second('js/app.js'))
+        # Pages are rendered again when any of their assets change
+        self.assertNotEqual(manifest.fingerprint(first),
+                            manifest.fingerprint(second))
+
+    def test_served_immutable(self):
+        asset_url = assets.build_assets(
+            self.template_environment, self.static_dir, self.output_dir)
+        routes = blug_server.RouteTable(blug_server.FileCache(self.output_dir))
+        head = routes.respond(asset_url('js/app.js'), {})[1]
+        self.assertIn(b'Cache-Control: public, max-age=31536000, immutable',
+                      head)
+
+
+if __name__ == '__main__':
+    unittest.main()
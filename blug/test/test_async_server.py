@@ -0,0 +1,74 @@
+import unittest
+import os
+import re
+import socket
+import tempfile
+import threading
+import http.client
+
+import async_server
+
+
+class TestAsyncBlugServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'index.html'), 'w') as f:
+            f.write('<p>Index</p>' * 100)
+        os.makedirs(os.path.join(self.directory, 'images'))
+        with open(os.path.join(self.directory, 'images/photo.jpg'),
+                  'wb') as f:
+            f.write(b'\xff' * 5000)
+        self.server = async_server.AsyncBlugServer(
+            self.directory, ('localhost', 0), cache_size=8000)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.server.started.wait()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+
+    def test_requests_on_a_persistent_connection(self):
+        connection = http.client.HTTPConnection(*self.server.server_address)
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), b'<p>Index</p>' * 100)
+        etag = response.getheader('ETag')
+
+        # Too large to cache, so sent from disk
+        connection.request('GET', '/images/photo.jpg')
+        response = connection.getresponse()
+        self.assertEqual(response.read(), b'\xff' * 5000)
+
+        connection.request('GET', '/index.html',
+                           headers={'If-None-Match': etag})
+        response = connection.getresponse()
+        self.assertEqual((response.status, response.read()), (304, b''))
+
+        connection.request('GET', '/missing.html')
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 404)
+        self.assertFalse(response.will_close)
+        connection.close()
+
+    def test_pipelined_requests_are_answered_in_order(self):
+        client = socket.create_connection(self.server.server_address)
+        client.sendall(b'GET /missing.html HTTP/1.1\r\nHost: x\r\n\r\n'
+                       b'GET / HTTP/1.1\r\nHost: x\r\n'
+                       b'Connection: close\r\n\r\n')
+        responses = b''
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            responses += data
+        client.close()
+        self.assertEqual(re.findall(rb'HTTP/1.1 (\d+)', responses),
+                         [b'404', b'200'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import os
+import random
+import shutil
+import datetime
+import tempfile
+
+import converter
+import benchmark
+
+
+class TestSyntheticCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_posts_are_deterministic(self):
+        date = datetime.datetime(2012, 3, 4, 5, 6)
+        first = benchmark.synthesize_post(random.Random(1), 7, date)
+        second = benchmark.synthesize_post(random.Random(1), 7, date)
+        self.assertEqual(first, second)
+        self.assertEqual(first[0], '2012-03-04-post-7.md')
+
+    def test_create_site(self):
+        benchmark.create_site(self.directory, 20)
+        content_dir = os.path.join(self.directory, 'content')
+        posts = sorted(os.listdir(content_dir))
+        self.assertEqual(len(posts), 20)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, 'templates', 'post_index.html')))
+        post = converter.load_post(os.path.join(content_dir, posts[0]))
+        self.assertTrue(post['title'].startswith('Post '))
+        self.assertTrue(post['categories'])
+        self.assertIn('<p>', post['body'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,14 @@ import blug
 import os
 import tempfile
 
+import jinja2
+
+import manifest
+import renderer
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            os.pardir, os.pardir, 'templates')
+
 
 class TestGeneratePost(unittest.TestCase):
 
@@ -28,5 +36,129 @@ class TestGeneratePost(unittest.TestCase):
         blug.create_post(title, self.content_dir)
         self.assertRaises(EnvironmentError, blug.create_post, title, self.content_dir)
 
+
+class TestUpdatePosts(unittest.TestCase):
+
+    def setUp(self):
+        self.content_dir = tempfile.mkdtemp()
+        self.site_config = {'content_dir': self.content_dir,
+                            'blog_prefix': 'blog', 'url': 'http://foo.com',
+                            'blog_root': None}
+
+    def write_post(self, name, title):
+        path = os.path.join(self.content_dir, name)
+        with open(path, 'w') as post_file:
+            post_file.write('title: {}\ndate: 2013-01-01 10:00\n'
+                            'categories: python\n\nBody\n'.format(title))
+        return path
+
+    def test_only_changed_posts_reread(self):
+        first = self.write_post('first.md', 'First')
+        second = self.write_post('second.md', 'Second')
+        posts = dict()
+        blug.update_posts(posts, self.site_config)
+        self.assertEqual(sorted(posts), [first, second])
+        unchanged = posts[first][1]
+
+        self.write_post('second.md', 'Second, edited')
+        third = self.write_post('third.md', 'Third')
+        blug.update_posts(posts, self.site_config)
+        self.assertIs(posts[first][1], unchanged)
+        self.assertEqual(posts[second][1]['title'], 'Second, edited')
+        self.assertEqual(posts[third][1]['title'], 'Third')
+
+        os.unlink(first)
+        blug.update_posts(posts, self.site_config)
+        self.assertEqual(sorted(posts), [second, third])
+
+
+class TestGenerateFeeds(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.content_dir = os.path.join(self.directory, 'content')
+        os.mkdir(self.content_dir)
+        output_dir = os.path.join(self.directory, 'generated')
+        self.site_config = {
+            'output_dir': output_dir, 'blog_prefix': 'blog',
+            'blog_dir': os.path.join(output_dir, 'blog'),
+            'url': 'http://foo.com', 'blog_root': None, 'title': 'Blug',
+            'author': 'Jeff', 'feed_entries': 3, 'category_feed_entries': 2}
+        with open(os.path.join(TEMPLATE_DIR, 'atom.xml')) as atom_file:
+            atom_template = atom_file.read()
+        self.template_environment = jinja2.Environment(
+            loader=jinja2.DictLoader({
+                'atom.xml': atom_template, 'list.html': 'list',
+                'archives.html': 'archives', 'about.html': 'about'}))
+        for day in range(1, 6):
+            self.write_post(day)
+
+    def write_post(self, day, year=2013):
+        with open(os.path.join(self.content_dir, '{}-{}.md'.format(
+                year, day)), 'w') as post_file:
+            post_file.write('title: Post {day}\ndate: {year}-01-0{day} 10:00\n'
+                            'categories: python\n\nTeaser {day}\n'
+                            '<!--more-->\nBody {day}\n'.format(day=day,
+                                                                year=year))
+
+    def generate(self):
+        """Queue and render the static files, returning the output paths
+        of the feeds queued and the posts whose bodies were needed"""
+        (posts, categories) = blug.prepare_posts(blug.get_all_posts(
+            self.content_dir, 'blog', self.site_config['url']))
+        build_manifest = manifest.BuildManifest(
+            self.site_config['output_dir'])
+        page_queue = renderer.PageQueue(build_manifest)
+        blug.generate_static_files(self.site_config, posts, categories,
+                                   self.template_environment, page_queue)
+        feed_paths = sorted(
+            os.path.relpath(page.output_path, self.site_config['output_dir'])
+            for page in page_queue.pages
+            if page.output_path.endswith('atom.xml'))
+        body_posts = list(page_queue.body_posts.values())
+        page_queue.render(None,
+                          template_environment=self.template_environment)
+        build_manifest.save()
+        return (feed_paths, body_posts)
+
+    def read_feed(self, *path):
+        with open(os.path.join(self.site_config['output_dir'], *path)) as f:
+            return f.read()
+
+    def test_feeds_capped(self):
+        (_, body_posts) = self.generate()
+        feed = self.read_feed('atom.xml')
+        self.assertEqual(feed.count('<entry>'), 3)
+        self.assertIn('Post 5', feed)
+        self.assertNotIn('Post 2', feed)
+        self.assertIn('Body 3', feed)
+        category_feed = self.read_feed('blog', 'categories', 'python',
+                                       'atom.xml')
+        self.assertEqual(category_feed.count('<entry>'), 2)
+        self.assertEqual(len(body_posts), 3)
+
+    def test_teaser_feeds_need_no_bodies(self):
+        self.site_config['feed_content'] = 'teaser'
+        (_, body_posts) = self.generate()
+        self.assertEqual(body_posts, [])
+        feed = self.read_feed('atom.xml')
+        self.assertIn('Teaser 5', feed)
+        self.assertNotIn('Body 5', feed)
+
+    def test_unchanged_feed_not_rewritten(self):
+        self.generate()
+        self.assertIn('<updated>2013-01-05T10:00:00</updated>\n    <id>',
+                      self.read_feed('atom.xml'))
+        self.assertEqual(self.generate()[0], [])
+
+        # A post too old to make the feeds leaves them alone too
+        self.write_post(1, year=2012)
+        self.assertEqual(self.generate()[0], [])
+
+        self.write_post(6)
+        self.assertEqual(self.generate()[0], [
+            'atom.xml', os.path.join('blog', 'categories', 'python',
+                                     'atom.xml')])
+
 if __name__ == '__main__':
     unittest.main()
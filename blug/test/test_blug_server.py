@@ -0,0 +1,231 @@
+import unittest
+import os
+import re
+import gzip
+import tempfile
+import socket
+import threading
+import http.client
+
+import deploy
+import blug_server
+import sitepack
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def write(self, path, content):
+        path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as output_file:
+            output_file.write(content)
+
+    def test_identical_files_are_cached_once(self):
+        page = '<p>Index</p>' * 100
+        self.write('index.html', page)
+        self.write('blog/index.html', page)
+        file_cache = blug_server.FileCache(self.directory)
+        (body, zipped) = file_cache.get_body('/index.html', True)
+        self.assertTrue(zipped)
+        self.assertEqual(gzip.decompress(body), page.encode())
+        (body, zipped) = file_cache.get_body('/blog/index.html')
+        self.assertFalse(zipped)
+        self.assertEqual(bytes(body), page.encode())
+        self.assertEqual(len(file_cache.cache), 1)
+        self.assertEqual((file_cache.hits, file_cache.misses), (1, 1))
+        self.assertEqual(file_cache.get_body('/missing.html'), (None, False))
+
+    def test_least_recently_used_files_are_evicted(self):
+        for name in 'abc':
+            self.write(name + '.css', name * 100)
+        file_cache = blug_server.FileCache(self.directory)
+        file_cache.max_size = 250
+        file_cache.get_body('/a.css')
+        file_cache.get_body('/b.css')
+        file_cache.get_body('/a.css')
+        file_cache.get_body('/c.css')
+        self.assertEqual(file_cache.evictions, 1)
+        self.assertEqual(file_cache.size, 200)
+        self.assertEqual(bytes(file_cache.get_body('/a.css')[0]), b'a' * 100)
+        self.assertEqual(file_cache.hits, 2)
+
+    def test_large_files_are_not_cached(self):
+        self.write('images/photo.jpg', 'x' * 1000)
+        file_cache = blug_server.FileCache(self.directory, max_size=1600)
+        self.assertEqual(file_cache.get_file('/images/photo.jpg'),
+                         os.path.join(self.directory, 'images/photo.jpg'))
+        self.assertEqual(bytes(file_cache.get_body('/images/photo.jpg')[0]),
+                         b'x' * 1000)
+        self.assertEqual(file_cache.size, 0)
+
+    def test_site_pack_is_served(self):
+        self.write('index.html', 'packed')
+        sitepack.write_pack(self.directory, blug_server.FileCache.FILE_TYPES,
+                            {'index.html': {'hash': 'abc', 'size': 6,
+                                            'mtime': 0}})
+        file_cache = blug_server.FileCache(self.directory)
+        self.assertEqual(bytes(file_cache.get_body('/index.html')[0]),
+                         b'packed')
+        self.assertEqual(file_cache.size, 0)
+
+
+class TestRouteTable(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for (path, content) in (('index.html', '<p>Index</p>' * 100),
+                                ('blog/index.html', 'Blog'),
+                                ('css/style.css', 'body {}')):
+            path = os.path.join(self.directory, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as output_file:
+                output_file.write(content)
+
+    def check_routes(self, routes):
+        (status, head, body, _, _) = routes.respond('/blog/', {})
+        self.assertEqual((status, bytes(body)), (200, b'Blog'))
+        self.assertIn(b'Content-Length: 4\r\n', head)
+        (status, head, body, _, _) = routes.respond('/blog?page=2', {})
+        self.assertEqual(status, 301)
+        self.assertIn(b'Location: /blog/\r\n', head)
+        self.assertEqual(routes.respond('/missing.html', {})[0], 404)
+
+        (status, head, body, _, _) = routes.respond(
+            '/index.html', {'accept-encoding': 'gzip'})
+        self.assertEqual(gzip.decompress(body), b'<p>Index</p>' * 100)
+        etag = re.search(rb'ETag: (.*)\r\n', head).group(1).decode()
+        self.assertEqual(routes.respond('/', {
+            'accept-encoding': 'gzip', 'if-none-match': etag})[0], 304)
+        self.assertEqual(routes.respond('/', {'if-none-match': etag})[0], 200)
+
+        # Too small to be compressed, so the same whatever the encoding
+        (status, head, body, _, _) = routes.respond(
+            '/css/style.css', {'accept-encoding': 'gzip'})
+        self.assertEqual(bytes(body), b'body {}')
+        etag = re.search(rb'ETag: (.*)\r\n', head).group(1).decode()
+        self.assertEqual(routes.respond('/css/style.css', {
+            'accept-encoding': 'gzip', 'if-none-match': etag})[0], 304)
+
+    def test_routes(self):
+        self.check_routes(blug_server.RouteTable(
+            blug_server.FileCache(self.directory)))
+
+    def test_routes_from_a_site_pack(self):
+        sitepack.write_pack(self.directory, blug_server.FileCache.FILE_TYPES,
+                            deploy.update_file_manifest(self.directory))
+        self.check_routes(blug_server.RouteTable(
+            blug_server.FileCache(self.directory)))
+
+
+    def test_file_changed_after_startup(self):
+        routes = blug_server.RouteTable(blug_server.FileCache(self.directory))
+        with open(os.path.join(self.directory, 'blog/index.html'), 'w') as f:
+            f.write('A much longer blog page')
+        (status, head, body, _, _) = routes.respond('/blog/', {})
+        self.assertEqual(bytes(body), b'A much longer blog page')
+        self.assertIn(b'Content-Length: 23\r\n', head)
+
+    def test_missing_file(self):
+        routes = blug_server.RouteTable(blug_server.FileCache(self.directory))
+        os.unlink(os.path.join(self.directory, 'blog/index.html'))
+        self.assertEqual(routes.respond('/blog/', {})[0], 404)
+        # Unreadable
+        os.unlink(os.path.join(self.directory, 'css/style.css'))
+        os.mkdir(os.path.join(self.directory, 'css/style.css'))
+        self.assertEqual(routes.respond('/css/style.css', {})[0], 500)
+
+    def test_large_files_sent_from_disk_with_a_site_pack(self):
+        path = os.path.join(self.directory, 'images', 'photo.jpg')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as output_file:
+            output_file.write(b'x' * (sitepack.MAXIMUM_PACKED_SIZE + 1))
+        sitepack.write_pack(self.directory, blug_server.FileCache.FILE_TYPES,
+                            deploy.update_file_manifest(self.directory))
+        routes = blug_server.RouteTable(blug_server.FileCache(self.directory))
+        self.assertEqual(routes.respond('/images/photo.jpg', {})[2], path)
+        self.check_routes(routes)
+
+
+class TestFileCacheRequestHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'index.html'), 'w') as f:
+            f.write('<p>Index</p>' * 100)
+        self.server = blug_server.BlugHttpServer(
+            self.directory, ('localhost', 0),
+            blug_server.FileCacheRequestHandler)
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path, headers=None):
+        connection = http.client.HTTPConnection(
+            'localhost', self.server.server_address[1])
+        connection.request('GET', path, headers=headers or {})
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        return (response, body)
+
+    def test_conditional_get(self):
+        (response, body) = self.get('/index.html')
+        self.assertEqual(response.status, 200)
+        etag = response.getheader('ETag')
+        last_modified = response.getheader('Last-Modified')
+
+        (response, body) = self.get('/index.html', {'If-None-Match': etag})
+        self.assertEqual((response.status, body), (304, b''))
+        self.assertEqual(response.getheader('ETag'), etag)
+        (response, _) = self.get('/index.html',
+                                 {'if-modified-since': last_modified})
+        self.assertEqual(response.status, 304)
+
+        # The compressed body is a different representation
+        (response, _) = self.get('/index.html', {'If-None-Match': etag,
+                                                 'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.getheader('ETag'), etag)
+        (response, _) = self.get('/index.html', {'If-None-Match': '"other"'})
+        self.assertEqual(response.status, 200)
+        (response, _) = self.get('/missing.html')
+        self.assertEqual(response.status, 404)
+
+    def test_connections_persist(self):
+        connection = http.client.HTTPConnection(
+            'localhost', self.server.server_address[1])
+        for _ in range(3):
+            connection.request('GET', '/index.html')
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, 200)
+            self.assertFalse(response.will_close)
+        connection.request('GET', '/index.html',
+                           headers={'Connection': 'close'})
+        self.assertTrue(connection.getresponse().will_close)
+        connection.close()
+
+    def test_pipelined_requests_are_answered_in_order(self):
+        client = socket.create_connection(self.server.server_address)
+        client.sendall(b'GET /index.html HTTP/1.1\r\nHost: x\r\n\r\n'
+                       b'GET /missing.html HTTP/1.1\r\nHost: x\r\n\r\n'
+                       b'GET /index.html HTTP/1.1\r\nHost: x\r\n'
+                       b'Connection: close\r\n\r\n')
+        responses = b''
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            responses += data
+        client.close()
+        self.assertEqual(re.findall(rb'HTTP/1.1 (\d+)', responses),
+                         [b'200', b'404', b'200'])
+
+
+if __name__ == '__main__':
+    unittest.main()
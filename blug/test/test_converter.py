@@ -0,0 +1,152 @@
+import unittest
+import os
+import tempfile
+
+import converter
+import disk_cache
+
+POST = """title: Post {number}
+date: 2013-01-0{number} 10:00
+categories: python web
+
+Teaser {number}
+<!--more-->
+Body {number}
+"""
+
+
+class TestLoadPosts(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.post_file_paths = list()
+        for number in range(1, 5):
+            path = os.path.join(self.directory, '{}.md'.format(number))
+            with open(path, 'w') as post_file:
+                post_file.write(POST.format(number=number))
+            self.post_file_paths.append(path)
+
+    def test_front_matter_read_without_conversion(self):
+        post = converter.load_post(self.post_file_paths[0])
+        self.assertEqual(post['title'], 'Post 1')
+        self.assertEqual(post['categories'], ['python', 'web'])
+        self.assertEqual(post['date'].day, 1)
+        self.assertNotIn('body', post)
+        self.assertNotIn('teaser', post)
+
+    def test_teaser_converted_on_first_use(self):
+        post = converter.load_post(self.post_file_paths[0])
+        self.assertEqual(post['teaser'], '<p>Teaser 1</p>\n')
+        self.assertNotIn('body', post)
+        self.assertIn('Body 1', post['body'])
+
+    def test_teaser_matches_full_conversion(self):
+        post = converter.load_post(self.post_file_paths[0])
+        teaser = post['teaser']
+        del post['teaser']
+        post.load_body()
+        self.assertEqual(post['teaser'], teaser)
+
+    def test_teaser_using_reference_defined_after_more(self):
+        with open(self.post_file_paths[0], 'w') as post_file:
+            post_file.write(POST.replace(
+                'Teaser {number}', 'See [the docs][docs] for more.').replace(
+                    'Body {number}', 'Body\n\n[docs]: http://example.com/'
+                ).format(number=1))
+        post = converter.load_post(self.post_file_paths[0])
+        self.assertEqual(post['teaser'],
+                         '<p>See <a href="http://example.com/">the docs</a> '
+                         'for more.</p>\n')
+        teaser = post['teaser']
+        del post['teaser']
+        post.load_body()
+        self.assertEqual(post['teaser'], teaser)
+
+    def test_teaser_kept_when_body_loaded(self):
+        post = converter.load_post(self.post_file_paths[0])
+        teaser = post['teaser']
+        post.load_body({'body': '<p>Body</p>', 'teaser': '<p>Other</p>'})
+        self.assertIs(post['teaser'], teaser)
+
+    def test_metadata_and_teaser_cached(self):
+        cache = disk_cache.DiskCache(tempfile.mkdtemp())
+        post = converter.load_post(self.post_file_paths[0], cache)
+        teaser = post['teaser']
+        cache.misses = 0
+        post = converter.load_post(self.post_file_paths[0], cache)
+        # Nothing converted, or even looked up, on first use
+        self.assertEqual(dict.get(post, 'teaser'), teaser)
+        self.assertEqual(post['title'], 'Post 1')
+        self.assertEqual(cache.misses, 0)
+
+        # A teaser taken from the whole post is cached too
+        post = converter.load_post(self.post_file_paths[1], cache)
+        post.load_body()
+        post = converter.load_post(self.post_file_paths[1], cache)
+        self.assertEqual(dict.get(post, 'teaser'), '<p>Teaser 2</p>\n')
+
+    def test_bodies_loaded_in_worker_processes(self):
+        posts = [converter.load_post(path) for path in self.post_file_paths]
+        self.assertEqual(converter.load_bodies(posts, jobs=2), 4)
+        self.assertEqual([post['body'].split('\n')[-1] for post in posts],
+                         ['<p>Body 1</p>', '<p>Body 2</p>', '<p>Body 3</p>',
+                          '<p>Body 4</p>'])
+
+    def test_failure_names_post_file(self):
+        with open(self.post_file_paths[2], 'w') as post_file:
+            post_file.write('title: No date\n\nBody\n')
+        with self.assertRaisesRegex(EnvironmentError, '3.md'):
+            converter.load_post(self.post_file_paths[2])
+
+
+CODE_POST = """title: Code
+date: 2013-01-01 10:00
+categories: python
+
+{prose}
+
+```python
+def double(value):
+    return value * 2
+```
+
+    :::javascript
+    var doubled = value * 2;
+"""
+
+
+class TestHighlightCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = disk_cache.DiskCache(tempfile.mkdtemp())
+
+    def tearDown(self):
+        converter.set_highlight_cache(None)
+
+    def convert(self, prose):
+        return converter.convert_post(CODE_POST.format(prose=prose))['body']
+
+    def test_highlighting_cached(self):
+        uncached = self.convert('Some prose')
+        converter.set_highlight_cache(self.cache)
+        self.assertEqual(self.convert('Some prose'), uncached)
+        # A fenced and an indented block
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.assertIn('<span class="k">def</span>', uncached)
+
+        # Changing only the prose reuses both blocks
+        self.cache.hits = 0
+        self.assertIn('Other prose', self.convert('Other prose'))
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+    def test_language_is_part_of_key(self):
+        converter.set_highlight_cache(self.cache)
+        self.convert('Prose')
+        converter.convert_post(CODE_POST.format(prose='Prose').replace(
+            '```python', '```ruby'))
+        self.assertEqual(self.cache.stats()['entries'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
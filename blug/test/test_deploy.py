@@ -0,0 +1,70 @@
+import unittest
+import os
+import tempfile
+
+import deploy
+
+
+class TestDeployToDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.destination_dir = os.path.join(tempfile.mkdtemp(), 'public_html')
+
+    def write(self, path, content):
+        path = os.path.join(self.source_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as output_file:
+            output_file.write(content)
+
+    def deploy(self):
+        deploy.update_file_manifest(self.source_dir)
+        return deploy.deploy_to_directory(self.source_dir,
+                                          self.destination_dir)
+
+    def test_only_changes_are_deployed(self):
+        self.write('index.html', 'index')
+        self.write('blog/old-post/index.html', 'old post')
+        self.write('css/style.css', 'style')
+        self.assertEqual(self.deploy(), (
+            ['blog/old-post/index.html', 'css/style.css', 'index.html'], []))
+
+        self.write('index.html', 'new index')
+        os.unlink(os.path.join(self.source_dir, 'blog/old-post/index.html'))
+        self.assertEqual(self.deploy(),
+                         (['index.html'], ['blog/old-post/index.html']))
+
+        with open(os.path.join(self.destination_dir, 'index.html')) as f:
+            self.assertEqual(f.read(), 'new index')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.destination_dir, 'blog')))
+        self.assertEqual(self.deploy(), ([], []))
+
+    def test_deploy_swaps_in_a_new_release(self):
+        self.write('index.html', 'index')
+        self.deploy()
+        first_release = os.path.realpath(self.destination_dir)
+        self.assertTrue(os.path.islink(self.destination_dir))
+        self.assertEqual(os.listdir(self.destination_dir), ['index.html'])
+
+        self.write('index.html', 'new index')
+        self.deploy()
+        self.assertNotEqual(os.path.realpath(self.destination_dir),
+                            first_release)
+        # The previous release is left untouched for requests still using it
+        with open(os.path.join(first_release, 'index.html')) as f:
+            self.assertEqual(f.read(), 'index')
+        self.assertIn('index.html', deploy.get_remote_manifest(
+            self.destination_dir))
+
+    def test_destination_without_manifest_is_hashed(self):
+        self.write('index.html', 'index')
+        os.makedirs(self.destination_dir)
+        with open(os.path.join(self.destination_dir, 'index.html'), 'w') as f:
+            f.write('index')
+        with open(os.path.join(self.destination_dir, 'stale.html'), 'w') as f:
+            f.write('stale')
+        self.assertEqual(self.deploy(), ([], ['stale.html']))
+
+if __name__ == '__main__':
+    unittest.main()
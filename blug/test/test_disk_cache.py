@@ -0,0 +1,38 @@
+import unittest
+import os
+import time
+import tempfile
+
+import disk_cache
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = disk_cache.DiskCache(tempfile.mkdtemp(), max_size=1024)
+
+    def test_get_returns_stored_value(self):
+        self.cache.set('abcdef', {'title': 'Post'})
+        self.assertEqual(self.cache.get('abcdef'), {'title': 'Post'})
+        self.assertIsNone(self.cache.get('012345'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_evict_removes_least_recently_used(self):
+        for key in ('aa01', 'bb02', 'cc03'):
+            self.cache.set(key, b'x' * 400)
+        # Make 'aa01' the most recently used entry
+        old_time = time.time() - 60
+        for key in ('bb02', 'cc03'):
+            os.utime(self.cache._path(key), (old_time, old_time))
+        self.cache.get('aa01')
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertIsNotNone(self.cache.get('aa01'))
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+    def test_clear_removes_everything(self):
+        self.cache.set('abcdef', 'value')
+        self.assertEqual(self.cache.clear(), 1)
+        self.assertIsNone(self.cache.get('abcdef'))
+
+if __name__ == '__main__':
+    unittest.main()
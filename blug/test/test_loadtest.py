@@ -0,0 +1,44 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import loadtest
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for path in ('index.html', 'blog/post/index.html', 'style.css',
+                     'notes.txt', '.blug-files.json'):
+            full_path = os.path.join(self.directory, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'w') as output_file:
+                output_file.write('Some content')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_urls(self):
+        self.assertEqual(loadtest.get_urls(self.directory),
+                         ['/', '/blog/post/', '/style.css'])
+
+    def test_percentile(self):
+        ordered = list(range(1000))
+        self.assertEqual(loadtest.percentile(ordered, 50), 500)
+        self.assertEqual(loadtest.percentile(ordered, 99.9), 999)
+        self.assertEqual(loadtest.percentile([], 50), 0)
+
+    def test_load_test(self):
+        result = loadtest.load_test(
+            'blug', self.directory, loadtest.get_urls(self.directory),
+            concurrency=2, duration=0.5)
+        self.assertGreater(result['requests'], 0)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(list(result['statuses']), ['200'])
+        self.assertGreater(result['max_rss_kilobytes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import os
+import tempfile
+
+import jinja2
+import manifest
+
+
+class TestBuildManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.directory, 'index.html')
+        self.environment = jinja2.Environment(loader=jinja2.DictLoader({
+            'base.html': '{{ title }}{% block content %}{% endblock %}',
+            'page.html': '{% extends "base.html" %}'
+                         '{% block content %}{{ body }}{% endblock %}',
+        }))
+
+    def build(self, template_variables):
+        build_manifest = manifest.BuildManifest(self.directory)
+        template = self.environment.get_template('page.html')
+        needs_update = build_manifest.needs_update(
+            self.output_path,
+            build_manifest.page_signature(template, template_variables))
+        if needs_update:
+            with open(self.output_path, 'w') as output_file:
+                output_file.write(template.render(template_variables))
+        build_manifest.save()
+        return needs_update
+
+    def test_unchanged_page_is_skipped(self):
+        self.assertTrue(self.build({'title': 'Blug', 'body': 'Hello'}))
+        self.assertFalse(self.build({'title': 'Blug', 'body': 'Hello'}))
+
+    def test_unreferenced_variable_is_ignored(self):
+        self.build({'title': 'Blug', 'body': 'Hello'})
+        self.assertFalse(self.build(
+            {'title': 'Blug', 'body': 'Hello', 'twitter_user': 'jeff'}))
+
+    def test_variable_in_parent_template_is_tracked(self):
+        self.build({'title': 'Blug', 'body': 'Hello'})
+        self.assertTrue(self.build({'title': 'Blog', 'body': 'Hello'}))
+
+    def test_stale_outputs_are_removed(self):
+        self.build({'title': 'Blug', 'body': 'Hello'})
+        build_manifest = manifest.BuildManifest(self.directory)
+        self.assertEqual(build_manifest.remove_stale_outputs(),
+                         [self.output_path])
+        self.assertFalse(os.path.exists(self.output_path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import os
+import sys
+import time
+import socket
+import signal
+import tempfile
+import subprocess
+import http.client
+
+SUPERVISOR = '''
+import sys
+import signal
+import blug_server
+import prefork
+import reloader
+server_address = ('localhost', int(sys.argv[2]))
+server = blug_server.BlugHttpServer(
+    sys.argv[1], server_address, blug_server.FileCacheRequestHandler,
+    bind_and_activate=False)
+
+def start_reloader(server):
+    site_reloader = reloader.Reloader(server, sys.argv[1], interval=None,
+                                      verbose=False)
+    signal.signal(prefork.RELOAD_SIGNAL, site_reloader.request)
+    site_reloader.start()
+
+prefork.Supervisor(server, server_address, 2, initializer=start_reloader,
+                   verbose=False).run()
+'''
+
+
+class TestSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = directory = tempfile.mkdtemp()
+        with open(os.path.join(directory, 'index.html'), 'w') as f:
+            f.write('Index')
+        with socket.socket() as sock:
+            sock.bind(('localhost', 0))
+            self.port = sock.getsockname()[1]
+        self.supervisor = subprocess.Popen(
+            [sys.executable, '-c', SUPERVISOR, directory, str(self.port)],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    def tearDown(self):
+        workers = list()
+        if self.supervisor.poll() is None:
+            workers = self.workers()
+            self.supervisor.send_signal(signal.SIGTERM)
+            try:
+                self.supervisor.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.supervisor.kill()
+                self.supervisor.wait()
+        for pid in workers:
+            if not self.wait_for_exit(pid):
+                os.kill(pid, signal.SIGKILL)
+
+    def get(self, path='/'):
+        for _ in range(100):
+            connection = http.client.HTTPConnection('localhost', self.port)
+            try:
+                connection.request('GET', path)
+                return connection.getresponse().read()
+            except ConnectionError:
+                time.sleep(0.05)
+            finally:
+                connection.close()
+        self.fail('Nothing is listening')
+
+    def workers(self):
+        output = subprocess.check_output(
+            ['ps', '-o', 'pid=', '--ppid', str(self.supervisor.pid)])
+        return [int(pid) for pid in output.split()]
+
+    def wait_for_exit(self, pid):
+        """Return True once the process pid has exited (leaving, at most, a
+        zombie), or False if it's still running after a few seconds"""
+        for _ in range(100):
+            try:
+                with open('/proc/{}/stat'.format(pid)) as stat_file:
+                    if stat_file.read().rsplit(')', 1)[1].split()[0] == 'Z':
+                        return True
+            except (FileNotFoundError, ProcessLookupError):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def test_workers_are_restarted_and_stopped(self):
+        self.assertEqual(self.get(), b'Index')
+        workers = self.workers()
+        self.assertEqual(len(workers), 2)
+        os.kill(workers[0], signal.SIGKILL)
+        for _ in range(100):
+            if workers[0] not in self.workers() and len(self.workers()) == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual(len(self.workers()), 2)
+        self.assertEqual(self.get(), b'Index')
+
+        self.supervisor.send_signal(signal.SIGTERM)
+        self.assertEqual(self.supervisor.wait(timeout=10), 0)
+
+    def test_workers_exit_with_the_supervisor(self):
+        self.assertEqual(self.get(), b'Index')
+        workers = self.workers()
+        self.supervisor.kill()
+        self.supervisor.wait()
+        for pid in workers:
+            self.assertTrue(self.wait_for_exit(pid))
+
+    def test_reload_signal_forwarded(self):
+        self.assertEqual(self.get(), b'Index')
+        with open(os.path.join(self.directory, 'new.html'), 'w') as f:
+            f.write('New')
+        self.supervisor.send_signal(signal.SIGHUP)
+        # Both workers must have reloaded, whichever answers
+        for _ in range(100):
+            if all(self.get('/new.html') == b'New' for _ in range(10)):
+                break
+            time.sleep(0.05)
+        else:
+            self.fail('Not reloaded')
+        self.assertEqual(len(self.workers()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import os
+import time
+import tempfile
+import threading
+import http.client
+
+import deploy
+import staging
+import sitepack
+import blug_server
+import reloader
+import stats
+
+
+class TestReloader(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = os.path.join(tempfile.mkdtemp(), 'generated')
+        self.publish('first')
+        self.server = blug_server.BlugHttpServer(
+            self.output_dir, ('localhost', 0),
+            blug_server.FileCacheRequestHandler, stats=stats.ServerStats())
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def publish(self, content):
+        """Publish a build of a single page, as 'generate' would"""
+        build_dir = staging.create_build(self.output_dir)
+        path = os.path.join(build_dir, 'index.html')
+        staging.remove_file(path)
+        with open(path, 'w') as output_file:
+            output_file.write(content)
+        sitepack.write_pack(build_dir, blug_server.FileCache.FILE_TYPES,
+                            deploy.update_file_manifest(build_dir))
+        staging.publish_build(self.output_dir, build_dir).join()
+
+    def get(self, connection):
+        connection.request('GET', '/')
+        return connection.getresponse().read()
+
+    def test_new_build_swapped_in(self):
+        site_reloader = reloader.Reloader(self.server, self.output_dir,
+                                          stats=self.server.stats,
+                                          verbose=False)
+        connection = http.client.HTTPConnection(*self.server.server_address)
+        self.assertEqual(self.get(connection), b'first')
+        old_generation = self.server.generation
+        (_, _, old_body, _, _) = old_generation.routes.respond('/', {})
+
+        self.publish('second')
+        report = site_reloader.reload()
+        # On the same connection
+        self.assertEqual(self.get(connection), b'second')
+        connection.close()
+        self.assertEqual(report['files'], 1)
+        self.assertEqual(report['build'],
+                         os.path.realpath(self.output_dir))
+        self.assertEqual(self.server.stats.reloads, 1)
+        # Cache counts carry over from the old generation: both requests and
+        # the response taken from the old generation directly
+        snapshot = self.server.stats.snapshot(self.server.generation.file_cache)
+        self.assertEqual(snapshot['cache']['hits'], 3)
+        # What was being sent from the old generation is still intact
+        self.assertEqual(bytes(old_body), b'first')
+
+    def test_reload_on_new_build_or_request(self):
+        site_reloader = reloader.Reloader(self.server, self.output_dir,
+                                          interval=0.01, verbose=False)
+        site_reloader.start()
+        try:
+            self.publish('second')
+            # The report is recorded just after the new generation is
+            # swapped in, so wait for it rather than for the generation
+            for _ in range(500):
+                if site_reloader.last_reload:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(site_reloader.last_reload['reason'],
+                             'new build')
+
+            report = site_reloader.last_reload
+            site_reloader.request()
+            for _ in range(500):
+                if site_reloader.last_reload is not report:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(site_reloader.last_reload['reason'], 'signal')
+        finally:
+            site_reloader.stop()
+        connection = http.client.HTTPConnection(*self.server.server_address)
+        self.assertEqual(self.get(connection), b'second')
+        connection.close()
+
+    def test_failed_reload_keeps_serving(self):
+        site_reloader = reloader.Reloader(self.server, self.output_dir,
+                                          serve_search=True, verbose=False)
+        generation = self.server.generation
+        self.publish('second')
+        with self.assertRaises(EnvironmentError):
+            site_reloader.reload()
+        self.assertIs(self.server.generation, generation)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import os
+import tempfile
+
+import jinja2
+import manifest
+import profiler
+import renderer
+
+
+class TestPageQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.template_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.template_dir, 'page.html'), 'w') as f:
+            f.write('<h1>{{ title }}</h1>')
+        self.template = jinja2.Environment(loader=jinja2.FileSystemLoader(
+            self.template_dir)).get_template('page.html')
+
+    def queue_pages(self, page_queue, titles):
+        template_variables = dict()
+        for title in titles:
+            # Pages must not see later changes to the variables they were
+            # queued with
+            template_variables['title'] = title
+            page_queue.add(self.template, template_variables, os.path.join(
+                self.output_dir, title, 'index.html'))
+
+    def test_pages_rendered_in_worker_processes(self):
+        page_queue = renderer.PageQueue()
+        self.queue_pages(page_queue, ['first', 'second', 'third'])
+        self.assertEqual(page_queue.render(self.template_dir, jobs=2), 3)
+        with open(os.path.join(self.output_dir, 'second', 'index.html')) as f:
+            self.assertEqual(f.read(), '<h1>second</h1>')
+
+    def test_unchanged_pages_not_queued(self):
+        build_manifest = manifest.BuildManifest(self.output_dir)
+        page_queue = renderer.PageQueue(build_manifest)
+        self.queue_pages(page_queue, ['first', 'second'])
+        page_queue.render(self.template_dir)
+        build_manifest.save()
+
+        page_queue = renderer.PageQueue(
+            manifest.BuildManifest(self.output_dir))
+        self.queue_pages(page_queue, ['first', 'second', 'third'])
+        self.assertEqual(page_queue.render(self.template_dir), 1)
+
+    def test_profiled_render(self):
+        for jobs in (1, 2):
+            profile = profiler.BuildProfile()
+            page_queue = renderer.PageQueue()
+            self.queue_pages(page_queue, ['first', 'second'])
+            page_queue.render(self.template_dir, jobs, profile=profile)
+            self.assertEqual(
+                sorted((template_name, size) for (_, template_name, _, size)
+                       in profile.pages),
+                [('page.html', 14), ('page.html', 15)])
+            self.assertEqual(profile.bytes_written, 29)
+            self.assertEqual(list(profile.phases),
+                             ['create directories', 'render pages'])
+            report = profile.report()
+            self.assertIn('page.html (2 pages', report)
+            self.assertIn('2 files, 29 bytes written', report)
+
+if __name__ == '__main__':
+    unittest.main()
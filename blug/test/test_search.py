@@ -0,0 +1,117 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import threading
+import http.client
+
+import blug_server
+import converter
+import manifest
+import search
+
+POSTS = {
+    '2012-01-01-caching.md': ('Caching Pages', '2012-01-01 10:00',
+                              'Caches make serving fast. The cache is '
+                              'cached.'),
+    '2012-02-01-python.md': ('Python Tips', '2012-02-01 10:00',
+                             'Python caching with <code>lru_cache</code>.'),
+    '2012-03-01-travel.md': ('Travel', '2012-03-01 10:00',
+                             'Nothing about computers at all.'),
+}
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.directory, 'generated')
+        self.posts = [self.write_post(name, *POSTS[name]) for name in POSTS]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_post(self, name, title, date, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as post_file:
+            post_file.write('title: {}\ndate: {}\ncategories: misc\n\n{}\n'
+                            .format(title, date, text))
+        post = converter.load_post(path)
+        post['relative_url'] = '/' + name[:-3]
+        return post
+
+    def test_stem(self):
+        self.assertEqual(
+            {search.stem(word) for word in
+             ('cache', 'caches', 'cached', 'caching')}, {'cach'})
+        self.assertEqual(search.stem('classes'), search.stem('class'))
+        self.assertEqual(search.tokenize('The <b>Bold</b> and the 2 cats'),
+                         ['bold', 'cat'])
+
+    def test_postings_delta_encoded(self):
+        (documents, shards) = search.build_index(self.posts)
+        self.assertEqual([document[1] for document in documents],
+                         ['Caching Pages', 'Python Tips', 'Travel'])
+        # In the first two posts, and in the title of the first
+        self.assertEqual(shards['ca']['cach'], [[0, 1], [8, 2]])
+
+    def test_search(self):
+        search.write_index(self.output_dir, self.posts)
+        index = search.SearchIndex.open(self.output_dir)
+        (total, results) = index.search('cached')
+        self.assertEqual(total, 2)
+        self.assertEqual([result['title'] for result in results],
+                         ['Caching Pages', 'Python Tips'])
+        self.assertEqual(index.search('python cache')[1][0]['url'],
+                         '/2012-02-01-python')
+        self.assertEqual(index.search('python travel'), (0, []))
+        self.assertEqual(index.search('unknown'), (0, []))
+        self.assertEqual(index.search(''), (0, []))
+        self.assertIsNone(search.SearchIndex.open(self.directory))
+
+    def test_unchanged_shards_not_rewritten(self):
+        build_manifest = manifest.BuildManifest(self.output_dir)
+        written = search.write_index(self.output_dir, self.posts,
+                                     build_manifest)
+        self.assertEqual(written, len(os.listdir(
+            os.path.join(self.output_dir, 'search'))))
+        build_manifest.save()
+
+        post = self.write_post('2012-04-01-new.md', 'Pythons', '2012-04-01 10:00',
+                               'Snakes')
+        build_manifest = manifest.BuildManifest(self.output_dir)
+        # The index, and the shards of 'python' and 'snake'
+        self.assertEqual(search.write_index(
+            self.output_dir, self.posts + [post], build_manifest), 3)
+
+    def test_served(self):
+        search.write_index(self.output_dir, self.posts)
+        server = blug_server.BlugHttpServer(
+            self.output_dir, ('localhost', 0),
+            blug_server.FileCacheRequestHandler,
+            search_index=search.SearchIndex.open(self.output_dir))
+        threading.Thread(target=server.serve_forever).start()
+        connection = http.client.HTTPConnection('localhost',
+                                                server.server_address[1])
+        try:
+            connection.request('GET', '/search?q=python+tips')
+            response = connection.getresponse()
+            self.assertEqual(response.getheader('Content-Type'),
+                             'application/json')
+            self.assertEqual(json.loads(response.read().decode('utf-8')), {
+                'query': 'python tips', 'total': 1, 'results': [{
+                    'url': '/2012-02-01-python', 'title': 'Python Tips',
+                    'date': '2012-02-01T10:00:00'}]})
+            connection.request('GET', '/search/py.json')
+            response = connection.getresponse()
+            self.assertEqual(json.loads(response.read().decode('utf-8')),
+                             {'python': [[1], [6]]})
+        finally:
+            connection.close()
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
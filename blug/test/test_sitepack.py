@@ -0,0 +1,82 @@
+import unittest
+import os
+import gzip
+import tempfile
+
+import deploy
+import sitepack
+
+FILE_TYPES = ['.html', '.css']
+
+
+class TestSitePack(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def write(self, path, content):
+        path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as output_file:
+            output_file.write(content)
+
+    def write_pack(self):
+        sitepack.write_pack(self.directory, FILE_TYPES,
+                            deploy.update_file_manifest(self.directory))
+        return sitepack.SitePack.open(self.directory)
+
+    def test_bodies_are_served_from_the_pack(self):
+        page = '<p>A post</p>' * 100
+        self.write('index.html', page)
+        self.write('blog/index.html', page)
+        self.write('css/style.css', 'body {}')
+        self.write('notes.txt', 'not served')
+        pack = self.write_pack()
+
+        self.assertEqual(bytes(pack.get_body('/index.html')), page.encode())
+        self.assertEqual(gzip.decompress(pack.get_body('/index.html', True)),
+                         page.encode())
+        self.assertEqual(pack.index['/index.html']['raw'],
+                         pack.index['/blog/index.html']['raw'])
+        # Too small to be worth compressing
+        self.assertEqual(bytes(pack.get_body('/css/style.css', True)),
+                         b'body {}')
+        self.assertIsNone(pack.get_body('/notes.txt'))
+
+    def test_pack_is_rewritten(self):
+        self.write('index.html', 'old')
+        old_pack = self.write_pack()
+        self.write('index.html', 'new')
+        self.write('about.html', 'about')
+        pack = self.write_pack()
+        self.assertEqual(bytes(pack.get_body('/index.html')), b'new')
+        self.assertEqual(bytes(pack.get_body('/about.html')), b'about')
+        # A server holding the old pack keeps serving it
+        self.assertEqual(bytes(old_pack.get_body('/index.html')), b'old')
+
+    def test_unchanged_pack_not_rewritten(self):
+        self.write('index.html', 'index')
+        self.write_pack()
+        pack_path = os.path.join(self.directory, sitepack.PACK_FILE_NAME)
+        inode = os.stat(pack_path).st_ino
+        self.assertIsNone(sitepack.write_pack(
+            self.directory, FILE_TYPES,
+            deploy.update_file_manifest(self.directory)))
+        self.assertEqual(os.stat(pack_path).st_ino, inode)
+
+    def test_large_files_not_packed(self):
+        self.write('index.html', 'index')
+        self.write('css/large.css', 'x' * (sitepack.MAXIMUM_PACKED_SIZE + 1))
+        pack = self.write_pack()
+        self.assertIsNone(pack.get_body('/css/large.css'))
+        self.assertEqual(pack.index['/css/large.css']['size'],
+                         sitepack.MAXIMUM_PACKED_SIZE + 1)
+        self.assertLess(os.path.getsize(pack.path),
+                        sitepack.MAXIMUM_PACKED_SIZE)
+
+    def test_missing_pack(self):
+        self.assertIsNone(sitepack.SitePack.open(self.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
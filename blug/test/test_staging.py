@@ -0,0 +1,63 @@
+import unittest
+import os
+import tempfile
+
+import staging
+import blug_server
+
+
+class TestStagedBuilds(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = os.path.join(tempfile.mkdtemp(), 'generated')
+
+    def write(self, build_dir, content):
+        path = os.path.join(build_dir, 'index.html')
+        staging.remove_file(path)
+        with open(path, 'w') as output_file:
+            output_file.write(content)
+
+    def read(self, directory):
+        with open(os.path.join(directory, 'index.html')) as input_file:
+            return input_file.read()
+
+    def test_new_build_does_not_touch_published_build(self):
+        first_build = staging.create_build(self.output_dir)
+        self.write(first_build, 'first')
+        staging.publish_build(self.output_dir, first_build)
+
+        second_build = staging.create_build(self.output_dir)
+        self.assertEqual(self.read(second_build), 'first')
+        self.write(second_build, 'second')
+        self.assertEqual(self.read(self.output_dir), 'first')
+
+        staging.publish_build(self.output_dir, second_build)
+        self.assertEqual(self.read(self.output_dir), 'second')
+
+    def test_old_builds_removed(self):
+        builds = list()
+        for _ in range(staging.KEEP_BUILDS + 2):
+            builds.append(staging.create_build(self.output_dir))
+            staging.publish_build(self.output_dir, builds[-1]).join()
+        self.assertEqual(
+            sorted(os.listdir(staging.get_builds_dir(self.output_dir))),
+            [os.path.basename(build)
+             for build in builds[-staging.KEEP_BUILDS:]])
+
+    def test_build_being_served_kept(self):
+        first_build = staging.create_build(self.output_dir)
+        self.write(first_build, 'first')
+        staging.publish_build(self.output_dir, first_build).join()
+        generation = blug_server.Generation(self.output_dir)
+        for _ in range(staging.KEEP_BUILDS + 1):
+            build = staging.create_build(self.output_dir)
+            staging.publish_build(self.output_dir, build).join()
+        self.assertEqual(self.read(first_build), 'first')
+
+        generation.release()
+        build = staging.create_build(self.output_dir)
+        staging.publish_build(self.output_dir, build).join()
+        self.assertFalse(os.path.exists(first_build))
+
+if __name__ == '__main__':
+    unittest.main()
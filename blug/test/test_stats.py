@@ -0,0 +1,96 @@
+import unittest
+import os
+import json
+import time
+import tempfile
+import threading
+import http.client
+
+import deploy
+import sitepack
+import blug_server
+import stats
+
+
+class TestServerStats(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = directory = tempfile.mkdtemp()
+        with open(os.path.join(directory, 'index.html'), 'w') as f:
+            f.write('<p>Index</p>' * 100)
+        self.start_server()
+
+    def start_server(self):
+        directory = self.directory
+        self.server = blug_server.BlugHttpServer(
+            directory, ('localhost', 0), blug_server.FileCacheRequestHandler,
+            stats=stats.ServerStats())
+        threading.Thread(target=self.server.serve_forever).start()
+        self.connection = http.client.HTTPConnection(
+            'localhost', self.server.server_address[1])
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path, headers=None):
+        self.connection.request('GET', path, headers=headers or {})
+        response = self.connection.getresponse()
+        return (response, response.read())
+
+    def test_json(self):
+        self.get('/', {'Accept-Encoding': 'gzip'})
+        self.get('/index.html')
+        self.get('/missing.html')
+        (response, body) = self.get('/__stats')
+        self.assertEqual(response.getheader('Content-Type'),
+                         'application/json')
+        snapshot = json.loads(body.decode('utf-8'))
+        self.assertEqual(snapshot['requests'], {'200': 2, '404': 1})
+        self.assertEqual(snapshot['encodings'], {'gzip': 1, 'identity': 2})
+        self.assertEqual(snapshot['active_connections'], 1)
+        self.assertEqual(snapshot['latency']['/index.html']['count'], 2)
+        self.assertEqual(snapshot['latency']['404']['count'], 1)
+        self.assertGreater(snapshot['rusage']['max_rss_kilobytes'], 0)
+
+    def test_closed_connections_are_folded_together(self):
+        for _ in range(20):
+            self.get('/index.html')
+            self.connection.close()
+        # Wait for the server to notice the last connection closing
+        for _ in range(100):
+            if not self.server.stats._shards:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.server.stats._shards, [])
+        (_, body) = self.get('/__stats')
+        snapshot = json.loads(body.decode('utf-8'))
+        self.assertEqual(snapshot['requests'], {'200': 20})
+        self.assertEqual(snapshot['latency']['/index.html']['count'], 20)
+        self.assertEqual(snapshot['active_connections'], 1)
+        # Only the connection asking for the stats still has a shard
+        self.assertEqual(len(self.server.stats._shards), 1)
+
+    def test_pack_hits_are_counted(self):
+        self.tearDown()
+        sitepack.write_pack(self.directory, blug_server.FileCache.FILE_TYPES,
+                            deploy.update_file_manifest(self.directory))
+        self.start_server()
+        self.get('/index.html')
+        self.get('/', {'Accept-Encoding': 'gzip'})
+        (_, body) = self.get('/__stats')
+        snapshot = json.loads(body.decode('utf-8'))
+        self.assertEqual(snapshot['cache']['hits'], 2)
+
+    def test_prometheus(self):
+        self.get('/index.html')
+        (response, body) = self.get('/__stats?format=prometheus')
+        text = body.decode('utf-8')
+        self.assertIn('blug_requests_total{status="200"} 1\n', text)
+        self.assertIn('blug_request_duration_seconds_bucket{'
+                      'route="/index.html",le="+Inf"} 1\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import watcher
+
+
+class ScriptedWatcher(watcher.Watcher):
+    """A watcher whose polls return changes from a script, recording the
+    timeouts it's polled with"""
+
+    def __init__(self, script):
+        watcher.Watcher.__init__(self, [])
+        self.script = list(script)
+        self.timeouts = list()
+
+    def poll(self, timeout=None):
+        self.timeouts.append(timeout)
+        return self.script.pop(0) if self.script else set()
+
+
+class TestWatcher(unittest.TestCase):
+
+    def test_is_ignored(self):
+        for path in ('/site/content/.post.md.swx', '/site/content/post.md~',
+                     '/site/content/.post.md.swp', 'post.swp'):
+            self.assertTrue(watcher.is_ignored(path), path)
+        for path in ('/site/content/post.md', '/site/.templates/base.html'):
+            self.assertFalse(watcher.is_ignored(path), path)
+
+    def test_wait_debounces_a_burst_of_changes(self):
+        site_watcher = ScriptedWatcher([set(), {'a'}, {'b'}, {'a', 'c'},
+                                        set(), {'d'}])
+        self.assertEqual(site_watcher.wait(), {'a', 'b', 'c'})
+        # Blocks until the first change, then waits debounce seconds at a
+        # time for more
+        self.assertEqual(site_watcher.timeouts, [
+            None, None, site_watcher.debounce, site_watcher.debounce,
+            site_watcher.debounce])
+        self.assertEqual(site_watcher.wait(), {'d'})
+
+
+class WatcherTests():
+    """Tests run against each kind of watcher"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('content/post.md', 'post')
+        self.site_watcher = self.create_watcher([self.directory])
+
+    def tearDown(self):
+        self.site_watcher.close()
+        shutil.rmtree(self.directory)
+
+    def path(self, path):
+        return os.path.join(self.directory, path)
+
+    def write(self, path, content):
+        path = self.path(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as output_file:
+            output_file.write(content)
+
+    def changes(self):
+        """Return the paths changed since the last call, allowing the
+        watcher time to notice"""
+        changed_paths = set()
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            more_paths = self.site_watcher.poll(0.2)
+            if not more_paths and changed_paths:
+                break
+            changed_paths |= more_paths
+        return changed_paths
+
+    def test_created_modified_and_deleted(self):
+        self.write('content/new.md', 'new')
+        self.assertIn(self.path('content/new.md'), self.changes())
+        self.write('content/post.md', 'changed post')
+        self.assertEqual(self.changes(), {self.path('content/post.md')})
+        os.unlink(self.path('content/new.md'))
+        self.assertEqual(self.changes(), {self.path('content/new.md')})
+
+    def test_editor_files_ignored(self):
+        self.write('content/.post.md.swp', 'swap')
+        self.write('content/post.md~', 'backup')
+        self.write('content/other.md', 'other')
+        self.assertEqual(self.changes(), {self.path('content/other.md')})
+
+    def test_new_directories_watched(self):
+        self.write('static/images/logo.png', 'logo')
+        self.changes()
+        self.write('static/images/logo.png', 'new logo')
+        self.assertIn(self.path('static/images/logo.png'), self.changes())
+
+    def test_wait(self):
+        self.write('content/post.md', 'changed post')
+        self.write('content/other.md', 'other')
+        self.assertEqual(self.site_watcher.wait(),
+                         {self.path('content/post.md'),
+                          self.path('content/other.md')})
+
+
+class TestPollingWatcher(WatcherTests, unittest.TestCase):
+
+    def create_watcher(self, paths):
+        site_watcher = watcher.PollingWatcher(paths)
+        site_watcher.interval = 0.01
+        return site_watcher
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'requires inotify')
+class TestInotifyWatcher(WatcherTests, unittest.TestCase):
+
+    def create_watcher(self, paths):
+        return watcher.InotifyWatcher(paths)
+
+    def test_events_parsed(self):
+        # Feed the watcher events written to a pipe rather than by the kernel
+        (read_fd, write_fd) = os.pipe()
+        os.close(self.site_watcher.fd)
+        self.site_watcher.fd = read_fd
+        (watch_descriptor, directory) = next(
+            (watch_descriptor, directory) for (watch_descriptor, directory)
+            in self.site_watcher.directories.items()
+            if directory.endswith('content'))
+
+        def event(mask, name, watch_descriptor=watch_descriptor):
+            name = name.encode() + b'\0' * (16 - len(name))
+            return watcher.EVENT_HEADER.pack(watch_descriptor, mask, 0,
+                                             len(name)) + name
+
+        os.write(write_fd, event(watcher.IN_CLOSE_WRITE, 'post.md') +
+                 event(watcher.IN_CREATE, '.post.md.swp') +
+                 event(watcher.IN_DELETE, 'old.md', watch_descriptor=-1))
+        self.assertEqual(self.site_watcher.poll(1),
+                         {os.path.join(directory, 'post.md')})
+
+        os.write(write_fd, event(watcher.IN_CLOSE_WRITE, 'post.md') +
+                 event(watcher.IN_Q_OVERFLOW, '', watch_descriptor=-1))
+        self.assertEqual(self.site_watcher.poll(1), {self.directory})
+        os.close(write_fd)
+
+
+if __name__ == '__main__':
+    unittest.main()
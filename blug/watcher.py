@@ -0,0 +1,178 @@
+"""Watching directories for changed files, using inotify where available and
+polling everywhere else"""
+
+import os
+import abc
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# inotify event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_ignored(path):
+    """Return True for the hidden, backup and swap files editors leave
+    behind while a file is being edited"""
+    name = os.path.basename(path)
+    return (name.startswith('.') or name.endswith('~') or
+            name.endswith('.swp'))
+
+
+class Watcher(abc.ABC):
+    """Base class for watchers of a set of directory trees"""
+
+    # Seconds without further changes before a burst of changes (an editor
+    # saving several files, or a 'git checkout') is considered finished
+    debounce = 0.1
+
+    def __init__(self, paths):
+        self.paths = [os.path.abspath(path) for path in paths]
+
+    @abc.abstractmethod
+    def poll(self, timeout=None):
+        """Return the set of paths changed within timeout seconds"""
+
+    def wait(self):
+        """Wait for files to change and return the set of changed paths once
+        no more changes have happened for debounce seconds"""
+        changed_paths = set()
+        while not changed_paths:
+            changed_paths = self.poll()
+        while True:
+            more_paths = self.poll(self.debounce)
+            if not more_paths:
+                return changed_paths
+            changed_paths |= more_paths
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(Watcher):
+    """A watcher that periodically compares the size and modification time of
+    every file"""
+
+    interval = 0.5
+
+    def __init__(self, paths):
+        Watcher.__init__(self, paths)
+        self.snapshot = self._take_snapshot()
+
+    def _take_snapshot(self):
+        """Return the size and modification time of every watched file"""
+        snapshot = dict()
+        for path in self.paths:
+            for directory, _, file_names in os.walk(path):
+                for file_name in file_names:
+                    file_path = os.path.join(directory, file_name)
+                    try:
+                        file_stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    snapshot[file_path] = (file_stat.st_size,
+                                           file_stat.st_mtime_ns)
+        return snapshot
+
+    def poll(self, timeout=None):
+        while True:
+            time.sleep(self.interval if timeout is None else
+                       min(timeout, self.interval))
+            snapshot = self._take_snapshot()
+            changed_paths = set(
+                path for path in set(snapshot) | set(self.snapshot)
+                if snapshot.get(path) != self.snapshot.get(path) and
+                not is_ignored(path))
+            self.snapshot = snapshot
+            if changed_paths or timeout is not None:
+                return changed_paths
+
+
+class InotifyWatcher(Watcher):
+    """A watcher using Linux's inotify, which is told about changes by the
+    kernel rather than having to look for them"""
+
+    def __init__(self, paths):
+        Watcher.__init__(self, paths)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        self.directories = dict()
+        for path in self.paths:
+            self._add_tree(path)
+
+    def _add_tree(self, path):
+        """Watch path and every directory below it (inotify watches aren't
+        recursive)"""
+        for directory, _, _ in os.walk(path):
+            watch_descriptor = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), WATCH_MASK)
+            if watch_descriptor < 0:
+                raise OSError(ctypes.get_errno(),
+                              'Unable to watch {}'.format(directory))
+            self.directories[watch_descriptor] = directory
+
+    def poll(self, timeout=None):
+        (readable, _, _) = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except OSError as exception:
+            if exception.errno == errno.EINTR:
+                return set()
+            raise
+
+        changed_paths = set()
+        offset = 0
+        while offset < len(buffer):
+            (watch_descriptor, mask, _, length) = EVENT_HEADER.unpack_from(
+                buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; report every watched path as changed
+                return set(self.paths)
+            if watch_descriptor not in self.directories:
+                continue
+            path = os.path.join(self.directories[watch_descriptor],
+                                os.fsdecode(name))
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._add_tree(path)
+                except OSError:
+                    # Removed again before it could be watched
+                    pass
+            if not is_ignored(path):
+                changed_paths.add(path)
+        return changed_paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_watcher(paths):
+    """Return the best available watcher for paths"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(paths)
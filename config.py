@@ -7,7 +7,8 @@ url:
 # Fabric-based Deployment Options
 
 # The root path where your website is served from, for 
-# example "/srv/www/mysite.com/public_html"
+# example "/srv/www/mysite.com/public_html". Deploys turn it into a symbolic
+# link to the current release, so your web server must follow symbolic links
 public_html_dir: 
 
 # Directory to temporarily hold generated files on remote machine
@@ -36,9 +37,21 @@ output_dir: generated
 content_dir: content
 template_dir: templates
 
+# Directory converted posts are cached in between builds, and the
+# maximum size (in megabytes) the cache may grow to
+cache_dir: .blug-cache
+cache_size_mb: 100
+
 # full URL for your feedburner feed 
 feed_url:
 
+# Number of the newest posts each Atom feed includes (0 for every post),
+# the number each category's feed includes (if different), and whether
+# entries hold each post's full 'body' or only its 'teaser'
+feed_entries: 20
+category_feed_entries:
+feed_content: body
+
 # The rest of these should be self explanitory
 github_user: 
 clicky_id: 
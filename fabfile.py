@@ -1,7 +1,11 @@
 from fabric.api import put, sudo, local, run, cd, prefix, task, abort, env
 from fabric.contrib.console import confirm
+from blug import deploy as site_deploy
 import os.path
 import sys
+import json
+import shutil
+import tempfile
 
 
 def load_settings():
@@ -34,16 +38,27 @@ def copy_to_remote():
     check_git_status()
     if not os.path.exists(env.blug_content_dir):
         sys.exit('{} is not a valid path on the local machine'.format(env.blug_content_dir))
-    if os.path.exists('content.tar.gz'):
-        os.unlink('content.tar.gz')
-    local('tar -cf content.tar ' + env.blug_content_dir)
-    local('gzip content.tar')
+
+    # Ask the remote machine what it's currently serving, then ship only the
+    # files that differ along with a list of the files to delete
     with cd(env.remote_staging_dir):
         run('rm -rf *')
-        put('content.tar.gz', env.remote_staging_dir)
-        run('tar -xzf content.tar.gz')
-        sudo('rm -rf {public_html_dir}/*'.format(public_html_dir=env.public_html_dir))
-        sudo('cp -rp {source}/* {dest}'.format(source=env.blug_content_dir, dest=env.public_html_dir))
+        put(site_deploy.__file__, env.remote_staging_dir)
+        remote_manifest = json.loads(run('python3 deploy.py manifest {public_html_dir}'.format(
+            public_html_dir=env.public_html_dir), quiet=True))
+
+    bundle_dir = tempfile.mkdtemp()
+    (changed, deleted) = site_deploy.create_bundle(env.blug_content_dir, remote_manifest, bundle_dir)
+    print('Deploying {} changed files, deleting {}'.format(len(changed), len(deleted)))
+    if os.path.exists('bundle.tar.gz'):
+        os.unlink('bundle.tar.gz')
+    local('tar -czf bundle.tar.gz -C {bundle_dir} .'.format(bundle_dir=bundle_dir))
+    shutil.rmtree(bundle_dir)
+
+    with cd(env.remote_staging_dir):
+        put('bundle.tar.gz', env.remote_staging_dir)
+        run('tar -xzf bundle.tar.gz')
+        sudo('python3 deploy.py apply . {public_html_dir}'.format(public_html_dir=env.public_html_dir))
 
 
 @task